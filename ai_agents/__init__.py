@@ -7,6 +7,20 @@ from .hr_assistant import HRAssistant
 from .tags_generator import TagsGenerator
 from .head_approval import HeadApproval
 from .questions_generator import QuestionsGenerator
+from .llm_client import get_openai_client, configure_openai_client
+from .llm_router import LLMRouter, get_llm_router
+from .generation_checkpoints import GenerationCheckpoints
+from .near_duplicates import NearDuplicateIndex
+from .question_library import QuestionLibrary
+from .approval_analysis_store import ApprovalAnalysisStore
+from .profession_catalog import ProfessionCatalog
+from .similarity_index import SimilarityIndex
+from .ngram_vectors import NgramVectorIndex
+from .form_analysis import FormAnalysisCoordinator
+from .document_extraction import DocumentExtractor
+from .file_analysis_cache import FileAnalysisCache
+from .llm_metrics import LLMMetrics, llm_call_scope, llm_usage_scope
+from .prompt_builder import build_prompt
 
 # Версия модуля ИИ агентов
 __version__ = "2.0.0"
@@ -16,7 +30,25 @@ __all__ = [
     "HRAssistant",
     "TagsGenerator", 
     "HeadApproval",
-    "QuestionsGenerator"
+    "QuestionsGenerator",
+    "get_openai_client",
+    "configure_openai_client",
+    "LLMRouter",
+    "get_llm_router",
+    "GenerationCheckpoints",
+    "NearDuplicateIndex",
+    "QuestionLibrary",
+    "ApprovalAnalysisStore",
+    "ProfessionCatalog",
+    "SimilarityIndex",
+    "NgramVectorIndex",
+    "FormAnalysisCoordinator",
+    "DocumentExtractor",
+    "FileAnalysisCache",
+    "LLMMetrics",
+    "llm_call_scope",
+    "llm_usage_scope",
+    "build_prompt"
 ]
 
 print("🤖 ИИ Агенты загружены v{__version__}")
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Approval Analysis Store - готовые анализы профессий для утверждения начальником
+Анализ считается заранее (после генерации тегов) и хранится по ревизии тегов профессии:
+изменение тегов или данных профессии дает новую ревизию, старый анализ не отдается
+"""
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Поля профессии, от которых зависит анализ
+ANALYZED_FIELDS = ("bank_title", "real_name", "specialization", "department", "tags")
+
+
+def tags_revision(profession: Dict[str, Any]) -> str:
+    """Ревизия тегов профессии: номер версии тегов и отпечаток анализируемых полей"""
+    fingerprint = json.dumps([profession.get(field) for field in ANALYZED_FIELDS], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+    versions = profession.get("tags_versions_count", len(profession.get("tags_versions", [])))  # Проекция каталога или полная запись
+    return f"v{versions}-{digest}"
+
+
+class ApprovalAnalysisStore:
+    """Хранилище анализов: data/approval_analyses.json"""
+    
+    def __init__(self, data_dir: Path):
+        self.store_file = data_dir / "approval_analyses.json"
+        self.analyses: Dict[str, Dict[str, Any]] = {}
+        
+        self._load_store()
+    
+    def _load_store(self):
+        """Загрузка сохраненных анализов"""
+        try:
+            if self.store_file.exists():
+                with open(self.store_file, 'r', encoding='utf-8') as f:
+                    self.analyses = json.load(f).get("analyses", {})
+        
+        except Exception as e:
+            logger.error(f"❌ Approval Analysis Store: Ошибка загрузки анализов: {e}")
+            self.analyses = {}
+    
+    def _save_store(self):
+        """Атомарная запись анализов"""
+        try:
+            tmp_file = self.store_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"analyses": self.analyses}, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.store_file)
+        
+        except Exception as e:
+            logger.error(f"❌ Approval Analysis Store: Ошибка сохранения анализов: {e}")
+    
+    def get(self, profession_id: str, revision: str) -> Optional[Dict[str, Any]]:
+        """Готовый анализ профессии для этой ревизии тегов (None - нет или устарел)"""
+        entry = self.analyses.get(profession_id)
+        if not entry or entry.get("revision") != revision:
+            return None
+        return entry["analysis"]
+    
+    def put(self, profession_id: str, revision: str, analysis: Dict[str, Any]):
+        """Сохранение анализа (заменяет анализ прошлой ревизии)"""
+        self.analyses[profession_id] = {
+            "revision": revision,
+            "computed_at": datetime.now().isoformat() + "Z",
+            "analysis": analysis
+        }
+        self._save_store()
+    
+    def invalidate(self, profession_id: str):
+        """Удаление анализа (профессия утверждена, возвращена или удалена)"""
+        if self.analyses.pop(profession_id, None) is not None:
+            self._save_store()
+
+
+# Экспорт
+__all__ = ['ApprovalAnalysisStore', 'tags_revision']
@@ -0,0 +1,146 @@
+"""
+Document Extraction - извлечение текста из загруженных документов вне event loop
+PyPDF2 и python-docx работают в ограниченном пуле процессов с лимитами страниц и символов
+и таймаутом на файл; файл передается байтами, без записи на диск
+"""
+
+import io
+import asyncio
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional
+
+# Работа с файлами
+import PyPDF2
+import docx
+
+logger = logging.getLogger(__name__)
+
+
+SUPPORTED_SUFFIXES = ('.pdf', '.docx', '.doc', '.txt')
+
+
+# === ИЗВЛЕЧЕНИЕ (выполняется в процессе пула) ===
+
+def extract_document_text(content: bytes, suffix: str, max_pages: int, max_chars: int) -> Dict[str, Any]:
+    """Текст документа: чтение прекращается, как только набрано max_chars символов"""
+    suffix = suffix.lower()
+    
+    if suffix == '.pdf':
+        parts, pages_read, length = [], 0, 0
+        try:
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+            for page in pdf_reader.pages[:max_pages]:
+                page_text = page.extract_text() or ""
+                parts.append(page_text)
+                pages_read += 1
+                length += len(page_text) + 1
+                if length >= max_chars:
+                    break
+            total_pages = len(pdf_reader.pages)
+        except Exception as e:
+            raise ValueError(f"Ошибка чтения PDF: {e}")
+        
+        text = "\n".join(parts)
+        return {
+            "text": text[:max_chars].strip(),
+            "pages_read": pages_read,
+            "truncated": length > max_chars or pages_read < total_pages
+        }
+    
+    if suffix in ('.docx', '.doc'):
+        parts, length = [], 0
+        try:
+            document = docx.Document(io.BytesIO(content))
+            for paragraph in document.paragraphs:
+                parts.append(paragraph.text)
+                length += len(paragraph.text) + 1
+                if length >= max_chars:
+                    break
+        except Exception as e:
+            raise ValueError(f"Ошибка чтения DOCX: {e}")
+        
+        text = "\n".join(parts)
+        return {"text": text[:max_chars].strip(), "pages_read": None, "truncated": length > max_chars}
+    
+    if suffix == '.txt':
+        # UTF-8 символ - до 4 байт: больше байт для max_chars символов не нужно
+        text = content[:max_chars * 4].decode('utf-8', errors='ignore')
+        return {"text": text[:max_chars].strip(), "pages_read": None, "truncated": len(text) > max_chars}
+    
+    raise ValueError(f"Неподдерживаемый формат файла: {suffix}")
+
+
+class DocumentExtractor:
+    """Пул процессов для извлечения текста (создается при первом файле)"""
+    
+    def __init__(self, max_workers: int = 2, max_pages: int = 30, max_chars: int = 50000, timeout: float = 20):
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.timeout = timeout
+        
+        self._executor: Optional[ProcessPoolExecutor] = None
+        
+        # Не больше max_workers файлов в работе: таймаут считается от начала извлечения, а не от очереди пула
+        self._slots = asyncio.Semaphore(max_workers)
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+    
+    async def extract(self, content: bytes, filename: str) -> Dict[str, Any]:
+        """Извлечение текста файла: {"text", "pages_read", "truncated"}"""
+        suffix = Path(filename).suffix.lower()
+        if suffix not in SUPPORTED_SUFFIXES:
+            raise ValueError(f"Неподдерживаемый формат файла: {suffix}")
+        
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            
+            while True:
+                executor = self._get_executor()
+                future = loop.run_in_executor(executor, extract_document_text, content, suffix, self.max_pages, self.max_chars)
+                
+                try:
+                    return await asyncio.wait_for(future, timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f"❌ Document Extraction: {filename} не обработан за {self.timeout} сек, пул перезапускается")
+                    self._terminate(executor)
+                    raise TimeoutError(f"Файл обрабатывается слишком долго (больше {self.timeout:g} сек)")
+                except BrokenProcessPool:
+                    if self._executor is not executor:
+                        # Пул остановлен из-за таймаута другого файла - этот файл ни при чем, извлекаем заново
+                        logger.warning(f"🔁 Document Extraction: {filename} прерван перезапуском пула, повтор")
+                        continue
+                    
+                    # Процесс пула упал на этом файле: сломанный пул больше не используем
+                    logger.error(f"❌ Document Extraction: процесс пула упал на файле {filename}")
+                    self._terminate(executor)
+                    raise ValueError("Не удалось обработать файл")
+    
+    def _terminate(self, executor: ProcessPoolExecutor):
+        """Остановка зависшего пула: процесс с извлечением иначе работал бы до конца файла
+        
+        Другие файлы в работе получат BrokenProcessPool и будут извлечены заново в новом пуле
+        """
+        if self._executor is executor:
+            self._executor = None
+        
+        # Публичного способа прервать выполняющуюся задачу у ProcessPoolExecutor нет
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def shutdown(self):
+        """Остановка пула при завершении приложения"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Экспорт
+__all__ = ['DocumentExtractor', 'extract_document_text']
@@ -0,0 +1,94 @@
+"""
+File Analysis Cache - готовые анализы загруженных описаний вакансий
+Ключ - SHA-256 содержимого файла и версия анализа (промпт и лимиты извлечения):
+повторная загрузка того же файла не извлекает текст и не вызывает ИИ заново
+"""
+
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def file_content_key(content: bytes, analysis_version: str) -> str:
+    """Ключ кэша: хэш содержимого файла и версия анализа"""
+    return f"{hashlib.sha256(content).hexdigest()}:{analysis_version}"
+
+
+class FileAnalysisCache:
+    """Хранилище анализов файлов: data/file_analyses.json (ограничено по числу записей и TTL)"""
+    
+    def __init__(self, data_dir: Path, max_entries: int = 200, ttl_hours: float = 72):
+        self.store_file = data_dir / "file_analyses.json"
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 3600
+        
+        # {ключ: {"result": ..., "stored_at": unix time, "last_used": unix time}}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        
+        self._load_store()
+    
+    def _load_store(self):
+        """Загрузка сохраненных анализов"""
+        try:
+            if self.store_file.exists():
+                with open(self.store_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get("entries", {})
+            self._evict()
+        
+        except Exception as e:
+            logger.error(f"❌ File Analysis Cache: Ошибка загрузки кэша: {e}")
+            self.entries = {}
+    
+    def _save_store(self):
+        """Атомарная запись кэша"""
+        try:
+            tmp_file = self.store_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.store_file)
+        
+        except Exception as e:
+            logger.error(f"❌ File Analysis Cache: Ошибка сохранения кэша: {e}")
+    
+    def _evict(self):
+        """Удаление истекших записей и самых давно использованных сверх max_entries"""
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if now - entry.get("stored_at", 0) > self.ttl_seconds]
+        for key in expired:
+            del self.entries[key]
+        
+        overflow = len(self.entries) - self.max_entries
+        if overflow > 0:
+            for key in sorted(self.entries, key=lambda key: self.entries[key].get("last_used", 0))[:overflow]:
+                del self.entries[key]
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Готовый анализ файла (None - нет или истек)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        
+        if time.time() - entry.get("stored_at", 0) > self.ttl_seconds:
+            del self.entries[key]
+            self._save_store()
+            return None
+        
+        # Время использования только в памяти: чтение из кэша не переписывает файл
+        entry["last_used"] = time.time()
+        return entry["result"]
+    
+    def put(self, key: str, result: Dict[str, Any]):
+        """Сохранение анализа файла"""
+        now = time.time()
+        self.entries[key] = {"result": result, "stored_at": now, "last_used": now}
+        self._evict()
+        self._save_store()
+
+
+# Экспорт
+__all__ = ['FileAnalysisCache', 'file_content_key']
@@ -0,0 +1,160 @@
+"""
+Form Analysis - кэш и координация анализа формы создания профессии
+Анализ (проверка дубликатов + ИИ проверка логичности) кэшируется по хэшу нормализованного
+состояния формы; запросы одной сессии объединяются, устаревшие анализы отменяются
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Поля формы, от которых зависит анализ
+ANALYZED_FORM_FIELDS = ("department", "real_name", "specialization", "bank_title")
+
+
+def form_state_key(form_data: Dict[str, Any]) -> str:
+    """Хэш нормализованного состояния формы (регистр и лишние пробелы не важны)"""
+    state = [" ".join(str(form_data.get(field) or "").split()).lower() for field in ANALYZED_FORM_FIELDS]
+    return hashlib.sha256(json.dumps(state, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class FormAnalysisCoordinator:
+    """Анализ формы через HR Assistant: кэш по состоянию формы, debounce и отмена по сессиям"""
+    
+    def __init__(self, hr_assistant, debounce_seconds: float = 0.5, cache_ttl: int = 600, cache_size: int = 500):
+        self.hr_assistant = hr_assistant
+        self.debounce_seconds = debounce_seconds
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        
+        # {хэш формы: {"analysis": ..., "revision": ревизия каталога, "computed_at": monotonic}}
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        
+        # {сессия: {"key": хэш формы в работе, "task": задача анализа, "latest": последний анализ}}
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "superseded": 0, "computed": 0}
+    
+    def cached(self, form_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Готовый анализ этого состояния формы (None - нет или истек)
+        
+        Если реестр профессий изменился после анализа, пересчитываются только дубликаты -
+        ИИ проверка логичности от реестра не зависит
+        """
+        key = form_state_key(form_data)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        if time.monotonic() - entry["computed_at"] > self.cache_ttl:
+            del self._cache[key]
+            return None
+        
+        self._cache.move_to_end(key)
+        revision = self.hr_assistant.catalog.revision
+        if entry["revision"] != revision:
+            entry["analysis"] = self.hr_assistant.refresh_form_duplicates(entry["analysis"], form_data)
+            entry["revision"] = revision
+        
+        return entry["analysis"]
+    
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Последний готовый анализ формы сессии"""
+        session = self._sessions.get(session_id)
+        return session["latest"] if session else None
+    
+    async def analyze(self, session_id: str, form_data: Dict[str, Any], debounce: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Анализ формы для сессии
+        
+        Повтор того же состояния формы ждет уже идущий анализ; новое состояние отменяет
+        анализ предыдущего (он еще в debounce-паузе или ждет ИИ). Возвращает None, если
+        анализ этого запроса отменен более новым состоянием формы.
+        """
+        self.stats["requests"] += 1
+        key = form_state_key(form_data)
+        session = self._session(session_id)
+        
+        analysis = self.cached(form_data)
+        if analysis is not None:
+            self.stats["cache_hits"] += 1
+            if self.hr_assistant.llm_router:
+                self.hr_assistant.llm_router.record_cache_hit("consistency_check", "form_analysis", agent="hr_assistant")
+            self._supersede(session, key)
+            session["latest"] = analysis
+            return analysis
+        
+        task = session["task"]
+        if task is not None and not task.done() and session["key"] == key:
+            self.stats["coalesced"] += 1
+        else:
+            self._supersede(session, key)
+            task = asyncio.ensure_future(self._compute(key, form_data, self.debounce_seconds if debounce is None else debounce))
+            session["key"], session["task"] = key, task
+        
+        # wait не пробрасывает отмену задачи: отмененный анализ - это ответ "устарел", а не ошибка
+        await asyncio.wait({task})
+        if task.cancelled():
+            return None
+        
+        analysis = task.result()
+        if session["key"] == key:
+            session["latest"] = analysis
+        return analysis
+    
+    async def analysis_for_chat(self, session_id: str, form_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Анализ для ответа в чате: готовый анализ формы или последний анализ сессии, без пересчета на каждое сообщение
+        
+        Анализ без ответа ИИ (fallback) не переиспользуется - ИИ спрашивается снова
+        """
+        latest = self.latest(session_id)
+        analysis = self.cached(form_data) or (latest if latest and not latest.get("fallback") else None)
+        if analysis is None:
+            analysis = await self.analyze(session_id, form_data, debounce=0)
+        return analysis or self.latest(session_id) or {}
+    
+    def _session(self, session_id: str) -> Dict[str, Any]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            if len(self._sessions) >= self.cache_size:
+                # Ограничение памяти: забываем сессии без анализа в работе
+                for idle_id in [sid for sid, s in self._sessions.items() if s["task"] is None or s["task"].done()]:
+                    del self._sessions[idle_id]
+            session = self._sessions[session_id] = {"key": None, "task": None, "latest": None}
+        return session
+    
+    def _supersede(self, session: Dict[str, Any], key: str):
+        """Отмена анализа предыдущего состояния формы сессии"""
+        task = session["task"]
+        if task is not None and not task.done() and session["key"] != key:
+            task.cancel()
+            self.stats["superseded"] += 1
+            logger.info("🔁 Form Analysis: Форма изменилась - предыдущий анализ отменен")
+    
+    async def _compute(self, key: str, form_data: Dict[str, Any], debounce: float) -> Dict[str, Any]:
+        """Анализ после debounce-паузы (пока форма меняется, ИИ не вызывается)"""
+        if debounce > 0:
+            await asyncio.sleep(debounce)
+        
+        revision = self.hr_assistant.catalog.revision
+        analysis = await self.hr_assistant.analyze_form_data(form_data)
+        self.stats["computed"] += 1
+        
+        # Оценка по умолчанию (ИИ не ответил) не кэшируется: следующий запрос снова спросит ИИ
+        if not analysis.get("fallback") and "error" not in analysis:
+            self._cache[key] = {"analysis": analysis, "revision": revision, "computed_at": time.monotonic()}
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return analysis
+
+
+# Экспорт
+__all__ = ['FormAnalysisCoordinator', 'form_state_key']
@@ -0,0 +1,90 @@
+"""
+Generation Checkpoints - чекпоинты генерации вопросов по батчам (тег, сложность)
+Каждый готовый батч сохраняется сразу, повтор/перезапуск догенерирует только недостающее
+"""
+
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCheckpoints:
+    """Хранилище чекпоинтов: data/generation_checkpoints/{profession_id}.json"""
+    
+    def __init__(self, data_dir: Path):
+        self.checkpoints_dir = data_dir / "generation_checkpoints"
+    
+    @staticmethod
+    def batch_key(tag: str, difficulty: str) -> str:
+        """Ключ батча в чекпоинте"""
+        return f"{tag}::{difficulty}"
+    
+    @staticmethod
+    def _tags_fingerprint(tags: Dict[str, int]) -> str:
+        """Отпечаток набора тегов: при изменении тегов старые батчи не переиспользуются"""
+        return json.dumps(tags, ensure_ascii=False, sort_keys=True)
+    
+    def _checkpoint_file(self, profession_id: str) -> Path:
+        return self.checkpoints_dir / f"{profession_id}.json"
+    
+    def load(self, profession_id: str, tags: Dict[str, int]) -> Dict[str, List[Dict[str, Any]]]:
+        """Готовые батчи профессии {batch_key: [вопросы]} (пусто, если теги изменились)"""
+        checkpoint_file = self._checkpoint_file(profession_id)
+        
+        try:
+            if not checkpoint_file.exists():
+                return {}
+            
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            
+            if data.get("tags_fingerprint") != self._tags_fingerprint(tags):
+                logger.info(f"🔁 Checkpoints: Теги профессии {profession_id} изменились, чекпоинт сброшен")
+                self.clear(profession_id)
+                return {}
+            
+            batches = data.get("batches", {})
+            if batches:
+                logger.info(f"🔁 Checkpoints: Найдено {len(batches)} готовых батчей для {profession_id}")
+            return batches
+        
+        except Exception as e:
+            logger.error(f"❌ Checkpoints: Ошибка чтения чекпоинта {profession_id}: {e}")
+            return {}
+    
+    def save(self, profession_id: str, tags: Dict[str, int], batches: Dict[str, List[Dict[str, Any]]]):
+        """Атомарная запись чекпоинта после очередного готового батча"""
+        checkpoint_file = self._checkpoint_file(profession_id)
+        
+        try:
+            self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
+            
+            data = {
+                "profession_id": profession_id,
+                "tags_fingerprint": self._tags_fingerprint(tags),
+                "updated_at": datetime.now().isoformat() + "Z",
+                "batches": batches
+            }
+            
+            tmp_file = checkpoint_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(checkpoint_file)
+        
+        except Exception as e:
+            logger.error(f"❌ Checkpoints: Ошибка записи чекпоинта {profession_id}: {e}")
+    
+    def clear(self, profession_id: str):
+        """Удаление чекпоинта после успешного сохранения вопросов"""
+        try:
+            self._checkpoint_file(profession_id).unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"❌ Checkpoints: Ошибка удаления чекпоинта {profession_id}: {e}")
+
+
+# Экспорт
+__all__ = ['GenerationCheckpoints']
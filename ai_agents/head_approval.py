@@ -4,6 +4,7 @@ Head Approval - ИИ помощник для начальников отдело
 """
 
 import json
+import asyncio
 import logging
 import re
 from typing import Dict, List, Optional, Any, Tuple
@@ -11,58 +12,92 @@ from pathlib import Path
 from datetime import datetime
 
 # ИИ
-from openai import AsyncOpenAI
+from .llm_client import get_openai_client
+from .llm_router import get_llm_router
+from .profession_catalog import ProfessionCatalog
+from .approval_analysis_store import ApprovalAnalysisStore, tags_revision
+from .prompt_builder import build_prompt, project_fields
 import httpx
 
 logger = logging.getLogger(__name__)
 
 
+# Таймауты частей комплексного анализа (сек): не успевшая часть отдается как pending
+ANALYSIS_TIMEOUTS = {
+    "tags_analysis": 20,
+    "consistency_analysis": 15,
+    "web_analysis": 10
+}
+
+# Бюджеты промптов (токены, локальный подсчет): сверх них сокращаются слишком длинные тексты, затем теги (с наименее весомых)
+PROMPT_TOKEN_BUDGETS = {
+    "tag_analysis": 1200,
+    "consistency_check": 600,
+    "tag_corrections": 1400,
+    "chat": 600
+}
+
+# Поля профессии, которые попадают в промпты и в сравнение с похожими профессиями
+PROMPT_PROFESSION_FIELDS = ("bank_title", "real_name", "specialization", "department")
+SIMILAR_PROFESSION_FIELDS = ("id", "bank_title", "real_name", "specialization", "department", "status", "tags")
+
+
+def _tags_by_weight(tags: Dict[str, int]) -> List[Tuple[str, int]]:
+    """Теги по убыванию веса: при сокращении промпта отбрасываются наименее важные"""
+    return sorted(tags.items(), key=lambda item: item[1], reverse=True)
+
+
+# Список тегов выводится в промпт тем же JSON, что и раньше
+_TAGS_RENDERERS = {"tags": lambda items: json.dumps(dict(items), ensure_ascii=False, indent=2)}
+
+
+def _profession_prompt_fields(profession: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: profession.get(field, '') for field in PROMPT_PROFESSION_FIELDS}
+
+
 class HeadApproval:
     """ИИ помощник для начальников отделов"""
     
-    def __init__(self, openai_api_key: str, data_dir: Path):
+    def __init__(self, openai_api_key: str, data_dir: Path, catalog: Optional[ProfessionCatalog] = None):
         self.openai_api_key = openai_api_key
         self.data_dir = data_dir
         self.openai_client = None
-        self.profession_data = {}
+        self.llm_router = None
+        
+        # Общий каталог профессий (метаданные без вопросов, обновляется после записей в реестр)
+        self.catalog = catalog or ProfessionCatalog(data_dir)
+        
+        # Анализы, не успевшие к ответу: досчитываются в фоне и отдаются при следующем открытии
+        self._background_analyses: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        
+        # Готовые анализы по ревизии тегов (считаются заранее после генерации тегов)
+        self.analysis_store = ApprovalAnalysisStore(data_dir)
         
         self._initialize_openai()
-        self._load_profession_data()
     
     def _initialize_openai(self):
         """Инициализация OpenAI клиента"""
         try:
             if self.openai_api_key:
-                self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self.openai_client = get_openai_client(self.openai_api_key)
+                self.llm_router = get_llm_router(self.openai_api_key)
                 logger.info("✅ Head Approval: OpenAI инициализирован")
             else:
                 logger.warning("⚠️ Head Approval: OpenAI API ключ не найден")
         except Exception as e:
             logger.error(f"❌ Head Approval: Ошибка инициализации OpenAI: {e}")
     
-    def _load_profession_data(self):
-        """Загрузка данных о профессиях"""
-        try:
-            records_file = self.data_dir / "profession_records.json"
-            if records_file.exists():
-                with open(records_file, 'r', encoding='utf-8') as f:
-                    self.profession_data = json.load(f)
-            else:
-                self.profession_data = {"profession_records": []}
-            
-            logger.info(f"✅ Head Approval: Загружено {len(self.profession_data.get('profession_records', []))} записей")
-            
-        except Exception as e:
-            logger.error(f"❌ Head Approval: Ошибка загрузки данных: {e}")
-            self.profession_data = {"profession_records": []}
-    
     # === АНАЛИЗ ПРОФЕССИИ ДЛЯ УТВЕРЖДЕНИЯ ===
     
-    async def analyze_profession_for_approval(self, profession_id: str, user_department: str) -> Dict[str, Any]:
-        """Полный анализ профессии для утверждения начальником"""
+    async def analyze_profession_for_approval(self, profession_id: str, user_department: str,
+                                              profession: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Полный анализ профессии для утверждения начальником
+        
+        Готовый анализ текущей ревизии тегов отдается сразу, иначе считается и сохраняется
+        """
         try:
             # Находим профессию
-            profession = self._find_profession_by_id(profession_id)
+            profession = profession or self._find_profession_by_id(profession_id)
             if not profession:
                 return {"error": "Профессия не найдена"}
             
@@ -70,13 +105,20 @@ class HeadApproval:
             if not self._can_user_access_profession(profession, user_department):
                 return {"error": "Нет прав для доступа к этой профессии"}
             
-            # Анализируем все аспекты профессии
-            analysis = await self._comprehensive_profession_analysis(profession)
+            revision = tags_revision(profession)
+            analysis = self.analysis_store.get(profession_id, revision)
+            
+            if analysis is None:
+                # Анализируем все аспекты профессии
+                analysis = await self._comprehensive_profession_analysis(profession)
+                if self._is_complete_analysis(analysis):
+                    self.analysis_store.put(profession_id, revision, analysis)
             
             return {
                 "success": True,
                 "profession": profession,
                 "analysis": analysis,
+                "analysis_revision": revision,
                 "recommendations": self._generate_approval_recommendations(analysis),
                 "suggested_actions": self._suggest_actions(analysis)
             }
@@ -85,51 +127,132 @@ class HeadApproval:
             logger.error(f"❌ Head Approval: Ошибка анализа профессии: {e}")
             return {"error": str(e)}
     
+    async def precompute_analysis(self, profession: Dict[str, Any]) -> bool:
+        """Фоновый расчет анализа для утверждения (без таймаутов) по текущей ревизии тегов"""
+        try:
+            revision = tags_revision(profession)
+            if self.analysis_store.get(profession["id"], revision) is not None:
+                return True
+            
+            analysis = await self._comprehensive_profession_analysis(profession, wait_all=True)
+            if not self._is_complete_analysis(analysis):
+                # Ошибка или сбой ИИ: не сохраняем - анализ пересчитается при открытии профессии
+                logger.warning(f"⚠️ Head Approval: Анализ профессии {profession['id']} неполный, не сохранен")
+                return False
+            
+            self.analysis_store.put(profession["id"], revision, analysis)
+            logger.info(f"✅ Head Approval: Анализ профессии {profession['id']} подготовлен (ревизия {revision})")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Head Approval: Ошибка предварительного анализа: {e}")
+            return False
+    
+    def _is_complete_analysis(self, analysis: Dict[str, Any]) -> bool:
+        """Анализ можно сохранить по ревизии тегов: все части готовы и ИИ ответил
+        
+        Без API ключа ИИ недоступен всегда - такой анализ пересчет не улучшит, он сохраняется
+        """
+        if "error" in analysis or analysis.get("pending"):
+            return False
+        
+        if any("error" in analysis.get(name, {}) for name in ("tags_analysis", "consistency_analysis", "web_analysis")):
+            return False
+        
+        if not self.openai_client:
+            return True
+        
+        ai_parts = [analysis.get("tags_analysis", {}).get("ai_analysis"), analysis.get("consistency_analysis")]
+        return all(part is None or part.get("available", False) for part in ai_parts)
+    
     def _find_profession_by_id(self, profession_id: str) -> Optional[Dict[str, Any]]:
         """Поиск профессии по ID"""
-        for record in self.profession_data.get("profession_records", []):
-            if record.get("id") == profession_id:
-                return record
-        return None
+        return self.catalog.get(profession_id)
     
     def _can_user_access_profession(self, profession: Dict[str, Any], user_department: str) -> bool:
         """Проверка прав доступа к профессии"""
         profession_dept = profession.get("department", "")
         return profession_dept == f"{user_department} Department"
     
-    async def _comprehensive_profession_analysis(self, profession: Dict[str, Any]) -> Dict[str, Any]:
-        """Комплексный анализ профессии"""
+    async def _comprehensive_profession_analysis(self, profession: Dict[str, Any], wait_all: bool = False) -> Dict[str, Any]:
+        """Комплексный анализ профессии (wait_all - ждать все части без таймаутов)"""
         try:
             # 1. Анализ основных данных профессии
             basic_analysis = self._analyze_basic_profession_data(profession)
             
-            # 2. Анализ тегов
-            tags_analysis = await self._analyze_tags(profession)
-            
-            # 3. Анализ соответствия данных
-            consistency_analysis = await self._analyze_data_consistency(profession)
-            
-            # 4. Сравнение с похожими профессиями
+            # 2. Сравнение с похожими профессиями
             comparison_analysis = self._compare_with_similar_professions(profession)
             
-            # 5. Веб-анализ профессии
-            web_analysis = await self._web_research_profession(profession)
+            # 3. Теги, согласованность данных (запросы к ИИ) и веб-анализ - независимы, выполняются параллельно
+            concurrent_analyses = await self._run_concurrent_analyses(profession, {
+                "tags_analysis": self._analyze_tags,
+                "consistency_analysis": self._analyze_data_consistency,
+                "web_analysis": self._web_research_profession
+            }, wait_all)
+            tags_analysis = concurrent_analyses["tags_analysis"]
+            consistency_analysis = concurrent_analyses["consistency_analysis"]
+            pending = [name for name, result in concurrent_analyses.items() if result.get("pending")]
             
             return {
                 "basic_analysis": basic_analysis,
                 "tags_analysis": tags_analysis,
                 "consistency_analysis": consistency_analysis,
                 "comparison_analysis": comparison_analysis,
-                "web_analysis": web_analysis,
+                "web_analysis": concurrent_analyses["web_analysis"],
+                "pending": pending,
                 "overall_score": self._calculate_overall_score([
                     basic_analysis, tags_analysis, consistency_analysis
-                ])
+                ]),
+                # Не успевшие части в оценку не вошли - она предварительная
+                "score_provisional": bool(pending)
             }
             
         except Exception as e:
             logger.error(f"❌ Head Approval: Ошибка комплексного анализа: {e}")
             return {"error": str(e)}
     
+    async def _run_concurrent_analyses(self, profession: Dict[str, Any], analyzers: Dict[str, Any],
+                                       wait_all: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Параллельный запуск анализов с таймаутом на каждый
+        
+        Не успевший анализ возвращается как {"pending": True} и продолжает выполняться в фоне:
+        повторное открытие профессии (с теми же данными) получит его результат
+        """
+        fingerprint = json.dumps(
+            [profession.get(field) for field in ("bank_title", "real_name", "specialization", "department", "tags")],
+            ensure_ascii=False, sort_keys=True
+        )
+        
+        # Фоновые результаты, которые так и не забрали, не копим
+        if len(self._background_analyses) > 100:
+            for stale_key in [key for key, task in self._background_analyses.items() if task.done()]:
+                self._background_analyses.pop(stale_key, None)
+        
+        tasks = {}
+        for name, analyze in analyzers.items():
+            key = (profession.get("id", ""), name, fingerprint)
+            task = self._background_analyses.get(key)
+            if task is None:
+                task = asyncio.ensure_future(analyze(profession))
+                self._background_analyses[key] = task
+            tasks[name] = (key, task)
+        
+        async def wait_analysis(name: str, key: Tuple[str, str, str], task: asyncio.Future) -> Dict[str, Any]:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), timeout=None if wait_all else ANALYSIS_TIMEOUTS.get(name, 15))
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Head Approval: {name} не успел за {ANALYSIS_TIMEOUTS.get(name, 15)} сек, досчитывается в фоне")
+                return {"pending": True, "message": "Анализ еще выполняется, обновите через несколько секунд"}
+            except Exception as e:
+                logger.error(f"❌ Head Approval: Ошибка анализа {name}: {e}")
+                result = {"error": str(e)}
+            
+            self._background_analyses.pop(key, None)
+            return result
+        
+        results = await asyncio.gather(*(wait_analysis(name, key, task) for name, (key, task) in tasks.items()))
+        return dict(zip(tasks, results))
+    
     def _analyze_basic_profession_data(self, profession: Dict[str, Any]) -> Dict[str, Any]:
         """Анализ основных данных профессии"""
         issues = []
@@ -231,17 +354,17 @@ class HeadApproval:
             return {"available": False, "message": "ИИ анализ недоступен"}
         
         try:
-            prompt = f"""
+            template = """
             Проанализируй теги для профессии в банке как опытный начальник отдела.
             
             ПРОФЕССИЯ:
-            - Банковское название: {profession.get('bank_title', '')}
-            - Реальная профессия: {profession.get('real_name', '')}
-            - Специализация: {profession.get('specialization', '')}
-            - Департамент: {profession.get('department', '')}
+            - Банковское название: {bank_title}
+            - Реальная профессия: {real_name}
+            - Специализация: {specialization}
+            - Департамент: {department}
             
             ТЕГИ:
-            {json.dumps(tags, ensure_ascii=False, indent=2)}
+            {tags}
             
             Оцени:
             1. Соответствуют ли теги профессии?
@@ -262,8 +385,18 @@ class HeadApproval:
             Отвечай ТОЛЬКО JSON!
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            prompt = build_prompt(
+                "tag_analysis",
+                template,
+                {**_profession_prompt_fields(profession), "tags": _tags_by_weight(tags)},
+                PROMPT_TOKEN_BUDGETS["tag_analysis"],
+                trim_order=("specialization", "department", "tags"),
+                renderers=_TAGS_RENDERERS
+            )
+            
+            response = await self.llm_router.complete(
+                "tag_analysis",
+                agent="head_approval",
                 messages=[
                     {"role": "system", "content": "Ты опытный начальник IT отдела банка. Анализируешь теги для профессий с точки зрения практического опыта и банковской специфики."},
                     {"role": "user", "content": prompt}
@@ -274,6 +407,7 @@ class HeadApproval:
             
             response_text = response.choices[0].message.content.strip()
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            self.llm_router.record_parse("tag_analysis", json_match is not None, agent="head_approval")
             
             if json_match:
                 return {
@@ -293,14 +427,14 @@ class HeadApproval:
             return {"available": False, "score": 0.8}
         
         try:
-            prompt = f"""
+            template = """
             Проанализируй согласованность данных профессии как опытный HR эксперт.
             
             ДАННЫЕ:
-            - Банковское название: {profession.get('bank_title', '')}
-            - Реальная профессия: {profession.get('real_name', '')}
-            - Специализация: {profession.get('specialization', '')}
-            - Департамент: {profession.get('department', '')}
+            - Банковское название: {bank_title}
+            - Реальная профессия: {real_name}
+            - Специализация: {specialization}
+            - Департамент: {department}
             
             Проверь:
             1. Соответствует ли банковское название реальной профессии?
@@ -321,8 +455,17 @@ class HeadApproval:
             Отвечай ТОЛЬКО JSON!
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            prompt = build_prompt(
+                "consistency_check",
+                template,
+                _profession_prompt_fields(profession),
+                PROMPT_TOKEN_BUDGETS["consistency_check"],
+                trim_order=("specialization", "department", "bank_title", "real_name")
+            )
+            
+            response = await self.llm_router.complete(
+                "consistency_check",
+                agent="head_approval",
                 messages=[
                     {"role": "system", "content": "Ты опытный начальник отдела в банке. Проверяешь профессии на логичность и соответствие банковским стандартам."},
                     {"role": "user", "content": prompt}
@@ -333,6 +476,7 @@ class HeadApproval:
             
             response_text = response.choices[0].message.content.strip()
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            self.llm_router.record_parse("consistency_check", json_match is not None, agent="head_approval")
             
             if json_match:
                 return {
@@ -349,25 +493,22 @@ class HeadApproval:
     def _compare_with_similar_professions(self, profession: Dict[str, Any]) -> Dict[str, Any]:
         """Сравнение с похожими профессиями"""
         try:
-            similar_professions = []
-            current_real_name = profession.get('real_name', '').lower()
+            matches = self.catalog.similarity.search(
+                {"real_name": profession.get('real_name', '')},
+                min_score=0.4,
+                statuses=["approved_by_head", "questions_generated", "active"],
+                exclude_id=profession.get("id")
+            )
             
-            for record in self.profession_data.get("profession_records", []):
-                if (record.get("id") == profession.get("id") or 
-                    record.get("status") not in ["approved_by_head", "questions_generated", "active"]):
-                    continue
-                
-                similarity = self._calculate_name_similarity(
-                    current_real_name, 
-                    record.get('real_name', '').lower()
-                )
-                
-                if similarity >= 0.4:
-                    similar_professions.append({
-                        **record,
-                        "similarity": similarity
-                    })
+            scores = {record["id"]: (similarity, record) for similarity, record in matches}
             
+            # Близкие по написанию названия (словоформы, транслитерация)
+            for similarity, record in self.catalog.fuzzy_search("real_name", profession.get('real_name', ''), top_k=10,
+                                                                min_score=0.5, exclude_id=profession.get("id")):
+                if similarity > scores.get(record["id"], (0.0, None))[0]:
+                    scores[record["id"]] = (similarity, record)
+            
+            similar_professions = [{**project_fields(record, SIMILAR_PROFESSION_FIELDS), "similarity": similarity} for similarity, record in scores.values()]
             similar_professions.sort(key=lambda x: x["similarity"], reverse=True)
             
             return {
@@ -380,22 +521,6 @@ class HeadApproval:
             logger.error(f"❌ Head Approval: Ошибка сравнения профессий: {e}")
             return {"found_similar": False, "similar_professions": []}
     
-    def _calculate_name_similarity(self, name1: str, name2: str) -> float:
-        """Расчет похожести названий"""
-        if not name1 or not name2:
-            return 0.0
-        
-        words1 = set(name1.split())
-        words2 = set(name2.split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        return len(intersection) / len(union)
-    
     async def _web_research_profession(self, profession: Dict[str, Any]) -> Dict[str, Any]:
         """Веб-исследование профессии"""
         try:
@@ -470,6 +595,11 @@ class HeadApproval:
         if comparison_analysis.get("potential_duplicates"):
             recommendations.append("🔄 Найдены потенциальные дубликаты профессий")
         
+        # Анализы, не успевшие к ответу
+        pending_labels = {"tags_analysis": "ИИ анализ тегов", "consistency_analysis": "Проверка согласованности", "web_analysis": "Веб-анализ"}
+        for name in analysis.get("pending", []):
+            recommendations.append(f"⏳ {pending_labels.get(name, name)} еще выполняется")
+        
         return recommendations
     
     def _suggest_actions(self, analysis: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -488,7 +618,15 @@ class HeadApproval:
                 "priority": "high"
             })
         
-        if overall_score >= 0.8:
+        if analysis.get("pending"):
+            # Оценка без незавершенных частей анализа - утверждение по ней не предлагаем
+            actions.append({
+                "action": "wait_analysis",
+                "title": "Дождаться завершения анализа",
+                "description": "Оценка предварительная: часть анализа еще выполняется",
+                "priority": "medium"
+            })
+        elif overall_score >= 0.8:
             actions.append({
                 "action": "approve",
                 "title": "Утвердить профессию",
@@ -547,18 +685,18 @@ class HeadApproval:
     async def _ai_suggest_tag_corrections(self, profession: Dict[str, Any], tags: Dict[str, int], user_input: str) -> Dict[str, Any]:
         """ИИ предложения корректировок тегов"""
         try:
-            prompt = f"""
+            template = """
             Ты опытный начальник IT отдела банка. Предложи корректировки тегов для профессии.
             
             ПРОФЕССИЯ:
-            - Банковское название: {profession.get('bank_title', '')}
-            - Реальная профессия: {profession.get('real_name', '')}
-            - Специализация: {profession.get('specialization', '')}
+            - Банковское название: {bank_title}
+            - Реальная профессия: {real_name}
+            - Специализация: {specialization}
             
             ТЕКУЩИЕ ТЕГИ:
-            {json.dumps(tags, ensure_ascii=False, indent=2)}
+            {tags}
             
-            ЗАПРОС НАЧАЛЬНИКА: {user_input or "Общий анализ тегов"}
+            ЗАПРОС НАЧАЛЬНИКА: {user_input}
             
             Предложи конкретные изменения:
             {{
@@ -577,8 +715,23 @@ class HeadApproval:
             Отвечай ТОЛЬКО JSON!
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            # Текст сокращается раньше тегов: текущие теги нужны для предложений по возможности целиком
+            prompt = build_prompt(
+                "tag_corrections",
+                template,
+                {
+                    **_profession_prompt_fields(profession),
+                    "tags": _tags_by_weight(tags),
+                    "user_input": user_input or "Общий анализ тегов"
+                },
+                PROMPT_TOKEN_BUDGETS["tag_corrections"],
+                trim_order=("user_input", "specialization", "tags"),
+                renderers=_TAGS_RENDERERS
+            )
+            
+            response = await self.llm_router.complete(
+                "tag_analysis",
+                agent="head_approval",
                 messages=[
                     {"role": "system", "content": "Ты начальник IT отдела банка с 10+ лет опыта. Понимаешь какие навыки реально нужны сотрудникам."},
                     {"role": "user", "content": prompt}
@@ -589,6 +742,7 @@ class HeadApproval:
             
             response_text = response.choices[0].message.content.strip()
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            self.llm_router.record_parse("tag_analysis", json_match is not None, agent="head_approval")
             
             if json_match:
                 return json.loads(json_match.group())
@@ -651,14 +805,14 @@ class HeadApproval:
     async def _generate_head_chat_response(self, user_message: str, profession_context: Dict[str, Any]) -> str:
         """Генерация ответа в чате с начальником"""
         try:
-            prompt = f"""
+            template = """
             Ты ИИ помощник начальника IT отдела банка. Помогаешь анализировать и утверждать профессии.
             
             ПРОФЕССИЯ НА РАССМОТРЕНИИ:
-            - Банковское название: {profession_context.get('bank_title', '')}
-            - Реальная профессия: {profession_context.get('real_name', '')}
-            - Специализация: {profession_context.get('specialization', '')}
-            - Теги: {len(profession_context.get('tags', {}))} шт.
+            - Банковское название: {bank_title}
+            - Реальная профессия: {real_name}
+            - Специализация: {specialization}
+            - Теги: {tags_count} шт.
             
             ВОПРОС НАЧАЛЬНИКА: {user_message}
             
@@ -666,8 +820,21 @@ class HeadApproval:
             Фокусируйся на практических аспектах и банковской специфике.
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            prompt = build_prompt(
+                "chat",
+                template,
+                {
+                    **_profession_prompt_fields(profession_context),
+                    "tags_count": len(profession_context.get('tags', {})),
+                    "user_message": user_message
+                },
+                PROMPT_TOKEN_BUDGETS["chat"],
+                trim_order=("user_message", "specialization")
+            )
+            
+            response = await self.llm_router.complete(
+                "chat",
+                agent="head_approval",
                 messages=[
                     {"role": "system", "content": "Ты опытный ИИ помощник начальника отдела. Отвечаешь кратко, профессионально и по делу."},
                     {"role": "user", "content": prompt}
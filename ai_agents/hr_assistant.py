@@ -4,6 +4,7 @@ HR Assistant - ИИ помощник для HR специалистов
 """
 
 import json
+import asyncio
 import logging
 import re
 from typing import Dict, List, Optional, Any
@@ -11,59 +12,74 @@ from pathlib import Path
 from datetime import datetime
 
 # ИИ
-from openai import AsyncOpenAI
+from .llm_client import get_openai_client
+from .llm_router import get_llm_router
+from .profession_catalog import ProfessionCatalog
+from .document_extraction import DocumentExtractor
+from .file_analysis_cache import FileAnalysisCache, file_content_key
+from .text_chunking import split_into_chunks
 import httpx
 
-# Работа с файлами
-import PyPDF2
-import docx
-
 logger = logging.getLogger(__name__)
 
 
+# Версия промпта анализа вакансии: увеличить при изменении промпта, чтобы не отдавать старые анализы из кэша
+VACANCY_ANALYSIS_PROMPT_VERSION = 2
+
+# Не больше N одновременных запросов по частям одного документа (лимиты API)
+MAX_PARALLEL_CHUNK_CALLS = 8
+
+# Формат ответа анализа вакансии (общий для целого текста, частей и объединения)
+VACANCY_ANALYSIS_FORMAT = """{
+    "position_title": "название позиции из текста",
+    "department_suggestion": "предполагаемый департамент",
+    "real_profession": "реальная профессия",
+    "specialization": "специализация если есть",
+    "experience_level": "Junior/Middle/Senior",
+    "key_requirements": ["основные требования"],
+    "summary": "краткое описание позиции"
+}"""
+
+
 class HRAssistant:
     """ИИ помощник для HR специалистов"""
     
-    def __init__(self, openai_api_key: str, data_dir: Path):
+    def __init__(self, openai_api_key: str, data_dir: Path, catalog: Optional[ProfessionCatalog] = None,
+                 document_extractor: Optional[DocumentExtractor] = None, file_analysis_cache: Optional[FileAnalysisCache] = None,
+                 file_chunk_tokens: int = 3000):
         self.openai_api_key = openai_api_key
         self.data_dir = data_dir
         self.openai_client = None
-        self.profession_data = {}
+        self.llm_router = None
+        
+        # Общий каталог профессий (метаданные без вопросов, обновляется после записей в реестр)
+        self.catalog = catalog or ProfessionCatalog(data_dir)
+        self.reference_data = {}
+        
+        # Извлечение текста из файлов в пуле процессов (не блокирует event loop)
+        self.document_extractor = document_extractor or DocumentExtractor()
+        
+        # Готовые анализы файлов по SHA-256 содержимого
+        self.file_analysis_cache = file_analysis_cache or FileAnalysisCache(data_dir)
+        
+        # Длинные документы анализируются частями не длиннее file_chunk_tokens токенов
+        self.file_chunk_tokens = file_chunk_tokens
         
         self._initialize_openai()
-        self._load_profession_data()
+        self._load_reference_files()
     
     def _initialize_openai(self):
         """Инициализация OpenAI клиента"""
         try:
             if self.openai_api_key:
-                self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self.openai_client = get_openai_client(self.openai_api_key)
+                self.llm_router = get_llm_router(self.openai_api_key)
                 logger.info("✅ HR Assistant: OpenAI инициализирован")
             else:
                 logger.warning("⚠️ HR Assistant: OpenAI API ключ не найден")
         except Exception as e:
             logger.error(f"❌ HR Assistant: Ошибка инициализации OpenAI: {e}")
     
-    def _load_profession_data(self):
-        """Загрузка данных о профессиях"""
-        try:
-            # Загружаем основной файл
-            records_file = self.data_dir / "profession_records.json"
-            if records_file.exists():
-                with open(records_file, 'r', encoding='utf-8') as f:
-                    self.profession_data = json.load(f)
-            else:
-                self.profession_data = {"profession_records": []}
-            
-            # Загружаем справочники
-            self._load_reference_files()
-            
-            logger.info(f"✅ HR Assistant: Загружено {len(self.profession_data.get('profession_records', []))} записей")
-            
-        except Exception as e:
-            logger.error(f"❌ HR Assistant: Ошибка загрузки данных: {e}")
-            self.profession_data = {"profession_records": []}
-    
     def _load_reference_files(self):
         """Загрузка справочных файлов"""
         reference_files = ['departments.json', 'professions.json', 'specializations.json', 'bank_titles.json']
@@ -74,17 +90,27 @@ class HRAssistant:
                 if file_path.exists():
                     with open(file_path, 'r', encoding='utf-8') as f:
                         key = filename.replace('.json', '')
-                        self.profession_data[key] = json.load(f)
+                        self.reference_data[key] = json.load(f)
             except Exception as e:
                 logger.error(f"❌ HR Assistant: Ошибка загрузки {filename}: {e}")
     
     # === АНАЛИЗ ФАЙЛОВ ===
     
-    async def analyze_file(self, file_path: str) -> Dict[str, Any]:
-        """Анализ загруженного файла с требованиями к профессии"""
+    async def analyze_file(self, content: bytes, filename: str) -> Dict[str, Any]:
+        """Анализ загруженного файла с требованиями к профессии (содержимое файла в памяти)"""
         try:
+            # Тот же файл уже анализировался - ни извлечения текста, ни запроса к ИИ
+            cache_key = file_content_key(content, self._file_analysis_version())
+            cached_result = self.file_analysis_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info(f"📦 HR Assistant: {filename} - анализ из кэша")
+                if self.llm_router:
+                    self.llm_router.record_cache_hit("vacancy_analysis", "file_analysis", agent="hr_assistant")
+                return {**cached_result, "cached": True}
+            
             # Извлекаем текст из файла
-            text_content = await self._extract_text_from_file(file_path)
+            extraction = await self.document_extractor.extract(content, filename)
+            text_content = extraction["text"]
             
             if not text_content or len(text_content.strip()) < 50:
                 return {
@@ -93,16 +119,26 @@ class HRAssistant:
                     "suggestions": []
                 }
             
+            if extraction["truncated"]:
+                logger.info(f"✂️ HR Assistant: {filename} - для анализа взято {len(text_content)} символов")
+            
             # Анализируем через ИИ
             analysis = await self._ai_analyze_file_content(text_content)
             
-            return {
+            result = {
                 "success": True,
                 "content_preview": text_content[:300] + "..." if len(text_content) > 300 else text_content,
+                "truncated": extraction["truncated"],
                 "analysis": analysis,
                 "suggestions": self._generate_form_suggestions(analysis)
             }
             
+            # Кэшируем только ответ ИИ (ручной fallback пересчитается, когда ИИ снова доступен)
+            if not analysis.get("fallback") and "error" not in analysis:
+                self.file_analysis_cache.put(cache_key, result)
+            
+            return {**result, "cached": False}
+            
         except Exception as e:
             logger.error(f"❌ HR Assistant: Ошибка анализа файла: {e}")
             return {
@@ -111,78 +147,127 @@ class HRAssistant:
                 "suggestions": []
             }
     
-    async def _extract_text_from_file(self, file_path: str) -> str:
-        """Извлечение текста из файла"""
-        file_path = Path(file_path)
-        
-        if file_path.suffix.lower() == '.pdf':
-            return self._extract_pdf_text(file_path)
-        elif file_path.suffix.lower() in ['.docx', '.doc']:
-            return self._extract_docx_text(file_path)
-        elif file_path.suffix.lower() == '.txt':
-            return self._extract_txt_text(file_path)
-        else:
-            raise ValueError(f"Неподдерживаемый формат файла: {file_path.suffix}")
-    
-    def _extract_pdf_text(self, file_path: Path) -> str:
-        """Извлечение текста из PDF"""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text.strip()
-        except Exception as e:
-            raise Exception(f"Ошибка чтения PDF: {e}")
-    
-    def _extract_docx_text(self, file_path: Path) -> str:
-        """Извлечение текста из DOCX"""
-        try:
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
-        except Exception as e:
-            raise Exception(f"Ошибка чтения DOCX: {e}")
-    
-    def _extract_txt_text(self, file_path: Path) -> str:
-        """Извлечение текста из TXT"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read().strip()
-        except Exception as e:
-            raise Exception(f"Ошибка чтения TXT: {e}")
+    def _file_analysis_version(self) -> str:
+        """Версия анализа файла: промпт и лимиты извлечения текста"""
+        extractor = self.document_extractor
+        return f"p{VACANCY_ANALYSIS_PROMPT_VERSION}-{extractor.max_pages}pages-{extractor.max_chars}chars-{self.file_chunk_tokens}chunk"
     
     async def _ai_analyze_file_content(self, content: str) -> Dict[str, Any]:
-        """ИИ анализ содержимого файла"""
+        """ИИ анализ содержимого файла
+        
+        Длинный текст (больше file_chunk_tokens токенов) делится на части, части анализируются
+        параллельно, а частичные результаты объединяются одним итоговым запросом -
+        время анализа почти не растет с размером документа
+        """
         if not self.openai_client:
             return self._manual_file_analysis(content)
         
         try:
-            prompt = f"""
+            chunks = split_into_chunks(content, self.file_chunk_tokens)
+            if len(chunks) == 1:
+                return await self._ai_analyze_vacancy_text(content)
+            
+            logger.info(f"🧩 HR Assistant: Документ разбит на {len(chunks)} частей для анализа")
+            
+            # Map: части анализируются одновременно
+            slots = asyncio.Semaphore(MAX_PARALLEL_CHUNK_CALLS)
+            
+            async def analyze_chunk(index: int, chunk: str) -> Dict[str, Any]:
+                async with slots:
+                    return await self._ai_analyze_vacancy_chunk(chunk, index + 1, len(chunks))
+            
+            partial_results = await asyncio.gather(
+                *[analyze_chunk(index, chunk) for index, chunk in enumerate(chunks)],
+                return_exceptions=True
+            )
+            
+            partials = [result for result in partial_results if isinstance(result, dict) and "error" not in result]
+            failed = len(partial_results) - len(partials)
+            if failed:
+                logger.warning(f"⚠️ HR Assistant: {failed} из {len(chunks)} частей документа не проанализированы")
+            
+            if not partials:
+                return self._manual_file_analysis(content)
+            
+            # Reduce: итоговый анализ по частичным результатам
+            return await self._ai_reduce_vacancy_analyses(partials)
+                
+        except Exception as e:
+            logger.error(f"❌ HR Assistant: Ошибка ИИ анализа: {e}")
+            return self._manual_file_analysis(content)
+    
+    async def _ai_analyze_vacancy_text(self, content: str) -> Dict[str, Any]:
+        """Анализ текста вакансии целиком (один запрос)"""
+        prompt = f"""
             Проанализируй описание вакансии/профессии для банка Halyk Bank.
             
             ТЕКСТ: {content}
             
             Извлеки ключевую информацию и верни в JSON формате:
-            {{
-                "position_title": "название позиции из текста",
-                "department_suggestion": "предполагаемый департамент",
-                "real_profession": "реальная профессия",
-                "specialization": "специализация если есть",
-                "experience_level": "Junior/Middle/Senior",
-                "key_requirements": ["основные требования"],
-                "summary": "краткое описание позиции"
-            }}
+            {VACANCY_ANALYSIS_FORMAT}
             
             Если информации мало, укажи null для недостающих полей.
             Отвечай ТОЛЬКО JSON!
             """
+        
+        response = await self.llm_router.complete(
+            "vacancy_analysis",
+            agent="hr_assistant",
+            messages=[
+                {"role": "system", "content": "Ты HR эксперт банка. Анализируешь вакансии точно и кратко."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=800
+        )
+        
+        return self._parse_vacancy_analysis(response.choices[0].message.content)
+    
+    async def _ai_analyze_vacancy_chunk(self, chunk: str, part: int, total: int) -> Dict[str, Any]:
+        """Map: анализ одной части документа"""
+        prompt = f"""
+            Это часть {part} из {total} описания вакансии/профессии для банка Halyk Bank.
+            
+            ТЕКСТ ЧАСТИ: {chunk}
+            
+            Извлеки информацию, которая есть В ЭТОЙ ЧАСТИ, и верни в JSON формате:
+            {VACANCY_ANALYSIS_FORMAT}
+            
+            Поля, о которых в этой части ничего нет, укажи null. Не додумывай.
+            Отвечай ТОЛЬКО JSON!
+            """
+        
+        response = await self.llm_router.complete(
+            "vacancy_chunk_analysis",
+            agent="hr_assistant",
+            messages=[
+                {"role": "system", "content": "Ты HR эксперт банка. Извлекаешь данные из фрагментов вакансий точно и кратко."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=600
+        )
+        
+        return self._parse_vacancy_analysis(response.choices[0].message.content, "vacancy_chunk_analysis")
+    
+    async def _ai_reduce_vacancy_analyses(self, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Reduce: объединение анализов частей одним вызовом ИИ (при ошибке или неразобранном ответе - локальное слияние)"""
+        try:
+            prompt = f"""
+            Ниже результаты анализа частей одного описания вакансии для банка Halyk Bank (по порядку частей):
+            
+            {json.dumps(partials, ensure_ascii=False)}
+            
+            Объедини их в один итоговый анализ вакансии в JSON формате:
+            {VACANCY_ANALYSIS_FORMAT}
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            Убери повторы в требованиях, противоречия реши в пользу более конкретных данных.
+            Отвечай ТОЛЬКО JSON!
+            """
+            
+            response = await self.llm_router.complete(
+                "vacancy_analysis",
+                agent="hr_assistant",
                 messages=[
                     {"role": "system", "content": "Ты HR эксперт банка. Анализируешь вакансии точно и кратко."},
                     {"role": "user", "content": prompt}
@@ -191,18 +276,38 @@ class HRAssistant:
                 max_tokens=800
             )
             
-            response_text = response.choices[0].message.content.strip()
+            result = self._parse_vacancy_analysis(response.choices[0].message.content)
+            if "error" not in result:
+                return result
             
-            # Парсим JSON
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return {"error": "Не удалось извлечь данные из файла"}
-                
         except Exception as e:
-            logger.error(f"❌ HR Assistant: Ошибка ИИ анализа: {e}")
-            return self._manual_file_analysis(content)
+            logger.error(f"❌ HR Assistant: Ошибка объединения анализа частей: {e}")
+        
+        return self._merge_vacancy_analyses(partials)
+    
+    def _merge_vacancy_analyses(self, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Слияние анализов частей без ИИ: первое заполненное значение поля, требования - без повторов"""
+        merged: Dict[str, Any] = {}
+        requirements: List[str] = []
+        
+        for partial in partials:
+            for field, value in partial.items():
+                if field == "key_requirements":
+                    requirements.extend(item for item in value or [] if item not in requirements)
+                elif value and not merged.get(field):
+                    merged[field] = value
+        
+        merged["key_requirements"] = requirements
+        return merged
+    
+    def _parse_vacancy_analysis(self, response_text: str, route: str = "vacancy_analysis") -> Dict[str, Any]:
+        """JSON анализа вакансии из ответа ИИ"""
+        json_match = re.search(r'\{.*\}', response_text.strip(), re.DOTALL)
+        self.llm_router.record_parse(route, json_match is not None, agent="hr_assistant")
+        if json_match:
+            return json.loads(json_match.group())
+        else:
+            return {"error": "Не удалось извлечь данные из файла"}
     
     def _manual_file_analysis(self, content: str) -> Dict[str, Any]:
         """Ручной анализ файла (fallback)"""
@@ -229,7 +334,8 @@ class HRAssistant:
             "specialization": None,
             "experience_level": "Middle",
             "key_requirements": [],
-            "summary": f"Анализ файла: {len(content)} символов"
+            "summary": f"Анализ файла: {len(content)} символов",
+            "fallback": True
         }
     
     def _generate_form_suggestions(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
@@ -269,7 +375,8 @@ class HRAssistant:
                 "logic_analysis": logic_analysis,
                 "web_info": web_info,
                 "overall_score": self._calculate_form_score(duplicates, logic_analysis),
-                "recommendations": self._generate_recommendations(duplicates, logic_analysis, web_info)
+                "recommendations": self._generate_recommendations(duplicates, logic_analysis, web_info),
+                "fallback": bool(logic_analysis.get("fallback"))
             }
             
         except Exception as e:
@@ -279,44 +386,66 @@ class HRAssistant:
                 "recommendations": []
             }
     
+    def refresh_form_duplicates(self, analysis: Dict[str, Any], form_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Анализ формы с пересчитанными дубликатами (реестр изменился, ИИ анализ остается прежним)"""
+        duplicates = self._check_duplicates(form_data)
+        logic_analysis = analysis.get("logic_analysis", {})
+        web_info = analysis.get("web_info", {})
+        
+        return {
+            **analysis,
+            "duplicates": duplicates,
+            "overall_score": self._calculate_form_score(duplicates, logic_analysis),
+            "recommendations": self._generate_recommendations(duplicates, logic_analysis, web_info)
+        }
+    
     def _check_duplicates(self, form_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Проверка дубликатов в базе"""
+        """Проверка дубликатов в базе (через индекс похожести каталога)"""
         duplicates = []
         
         try:
-            existing_records = self.profession_data.get("profession_records", [])
+            approved_statuses = ["approved_by_head", "questions_generated", "active"]
+            index = self.catalog.similarity
             
             bank_title = form_data.get("bank_title", "").lower()
             real_name = form_data.get("real_name", "").lower()
-            
-            for record in existing_records:
-                # Пропускаем неутвержденные записи
-                if record.get("status") not in ["approved_by_head", "questions_generated", "active"]:
+            specialization = form_data.get("specialization", "").lower()
+            
+            # Проверяем точное совпадение банковского названия
+            for record in index.exact("bank_title", bank_title, approved_statuses):
+                duplicates.append({
+                    "type": "exact_bank_title",
+                    "existing": record,
+                    "similarity": 1.0,
+                    "message": "Банковское название уже существует"
+                })
+            
+            # Проверяем похожие названия (только профессии с общими словами)
+            for similarity, record in index.search({"bank_title": bank_title}, min_score=0.8, statuses=approved_statuses):
+                if similarity <= 0.8:
                     continue
-                
-                # Проверяем точное совпадение банковского названия
-                if record.get("bank_title", "").lower() == bank_title and bank_title:
-                    duplicates.append({
-                        "type": "exact_bank_title",
-                        "existing": record,
-                        "similarity": 1.0,
-                        "message": "Банковское название уже существует"
-                    })
-                
-                # Проверяем похожие названия
-                similarity = self._calculate_text_similarity(bank_title, record.get("bank_title", "").lower())
-                if similarity > 0.8 and bank_title:
-                    duplicates.append({
-                        "type": "similar_bank_title",
-                        "existing": record,
-                        "similarity": similarity,
-                        "message": f"Похожее банковское название ({similarity:.0%} совпадение)"
-                    })
-                
-                # Проверяем точное совпадение реальной профессии + специализации
-                if (record.get("real_name", "").lower() == real_name and 
-                    record.get("specialization", "").lower() == form_data.get("specialization", "").lower() and
-                    real_name):
+                duplicates.append({
+                    "type": "similar_bank_title",
+                    "existing": record,
+                    "similarity": similarity,
+                    "message": f"Похожее банковское название ({similarity:.0%} совпадение)"
+                })
+            
+            # Нечеткое совпадение по символьным n-граммам (словоформы, транслитерация)
+            found_ids = {duplicate["existing"].get("id") for duplicate in duplicates}
+            for similarity, record in self.catalog.fuzzy_search("bank_title", bank_title, top_k=3, min_score=0.8):
+                if record.get("id") in found_ids:
+                    continue
+                duplicates.append({
+                    "type": "fuzzy_bank_title",
+                    "existing": record,
+                    "similarity": similarity,
+                    "message": f"Банковское название почти совпадает ({similarity:.0%} по написанию)"
+                })
+            
+            # Проверяем точное совпадение реальной профессии + специализации
+            for record in index.exact("real_name", real_name, approved_statuses):
+                if record.get("specialization", "").lower() == specialization:
                     duplicates.append({
                         "type": "exact_profession_spec",
                         "existing": record,
@@ -330,26 +459,11 @@ class HRAssistant:
             logger.error(f"❌ HR Assistant: Ошибка проверки дубликатов: {e}")
             return []
     
-    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
-        """Простой расчет похожести текстов"""
-        if not text1 or not text2:
-            return 0.0
-        
-        words1 = set(text1.lower().split())
-        words2 = set(text2.lower().split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        return len(intersection) / len(union)
-    
     async def _analyze_form_logic(self, form_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Анализ логичности данных формы"""
+        """Анализ логичности данных формы (fallback: True - ИИ не ответил, оценка по умолчанию)"""
+        fallback = {"score": 0.8, "issues": [], "suggestions": [], "fallback": True}
         if not self.openai_client:
-            return {"score": 0.8, "issues": [], "suggestions": []}
+            return fallback
         
         try:
             prompt = f"""
@@ -370,8 +484,9 @@ class HRAssistant:
             Отвечай ТОЛЬКО JSON!
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            response = await self.llm_router.complete(
+                "consistency_check",
+                agent="hr_assistant",
                 messages=[
                     {"role": "system", "content": "Ты HR эксперт. Анализируешь логичность профессий кратко."},
                     {"role": "user", "content": prompt}
@@ -382,15 +497,16 @@ class HRAssistant:
             
             response_text = response.choices[0].message.content.strip()
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            self.llm_router.record_parse("consistency_check", json_match is not None, agent="hr_assistant")
             
             if json_match:
                 return json.loads(json_match.group())
             else:
-                return {"score": 0.8, "issues": [], "suggestions": []}
+                return fallback
                 
         except Exception as e:
             logger.error(f"❌ HR Assistant: Ошибка анализа логики: {e}")
-            return {"score": 0.8, "issues": [], "suggestions": []}
+            return fallback
     
     async def _web_research(self, form_data: Dict[str, Any]) -> Dict[str, Any]:
         """Поиск информации о профессии в интернете"""
@@ -420,7 +536,7 @@ class HRAssistant:
         for duplicate in duplicates:
             if duplicate["type"].startswith("exact_"):
                 score -= 0.4
-            elif duplicate["type"].startswith("similar_"):
+            elif duplicate["type"].startswith(("similar_", "fuzzy_")):
                 score -= 0.2
         
         # Учитываем логический анализ
@@ -439,6 +555,8 @@ class HRAssistant:
                 recommendations.append("⚠️ Банковское название уже используется")
             elif duplicate["type"] == "similar_bank_title":
                 recommendations.append(f"📝 Похожее название существует ({duplicate['similarity']:.0%})")
+            elif duplicate["type"] == "fuzzy_bank_title":
+                recommendations.append(f"📝 Почти такое же название уже есть: {duplicate['existing'].get('bank_title', '')} ({duplicate['similarity']:.0%})")
             elif duplicate["type"] == "exact_profession_spec":
                 recommendations.append("🔄 Профессия с такой специализацией уже есть")
         
@@ -457,11 +575,13 @@ class HRAssistant:
     
     # === ЧАТ С ПОЛЬЗОВАТЕЛЕМ ===
     
-    async def chat_with_user(self, user_message: str, form_context: Dict[str, Any]) -> Dict[str, Any]:
-        """Чат с HR специалистом"""
+    async def chat_with_user(self, user_message: str, form_context: Dict[str, Any],
+                             form_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Чат с HR специалистом (form_analysis - готовый анализ формы, иначе анализируется заново)"""
         try:
             # Анализируем контекст формы
-            form_analysis = await self.analyze_form_data(form_context)
+            if form_analysis is None:
+                form_analysis = await self.analyze_form_data(form_context)
             
             # Генерируем ответ
             ai_response = await self._generate_chat_response(user_message, form_context, form_analysis)
@@ -501,8 +621,9 @@ class HRAssistant:
             Вопрос пользователя: {user_message}
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            response = await self.llm_router.complete(
+                "chat",
+                agent="hr_assistant",
                 messages=[
                     {"role": "system", "content": "Ты ИИ помощник HR специалиста в банке Halyk Bank. Отвечаешь кратко и по делу. Помогаешь создавать профессии избегая дубликатов."},
                     {"role": "user", "content": context}
@@ -0,0 +1,250 @@
+"""
+JSON Salvage - устойчивый разбор JSON массива (или объекта с массивами) из ответа ИИ
+Из битого или обрезанного по max_tokens ответа извлекаются все целые объекты массивов
+"""
+
+import re
+import json
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+_decoder = json.JSONDecoder(strict=False)
+
+# Начало массива объектов (пропускаем случайные [ в тексте перед JSON)
+_ARRAY_OF_OBJECTS_START = re.compile(r'\[\s*\{')
+
+# Висячая запятая перед закрывающей скобкой: {"a": 1,} / [1, 2,]
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+# Скалярное значение объекта (число, true/false/null) - до следующего разделителя
+_SCALAR_VALUE = re.compile(r'[^,}\]]*')
+
+
+def _find_object_end(text: str, start: int) -> Optional[int]:
+    """Позиция после закрывающей '}' объекта, начинающегося в start (None - объект обрезан)"""
+    depth = 0
+    in_string = False
+    escaped = False
+    
+    for index in range(start, len(text)):
+        char = text[index]
+        
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    
+    return None
+
+
+def _loads_object(chunk: str) -> Tuple[Optional[Any], bool]:
+    """Разбор одного объекта: (объект, был ли нужен ремонт)"""
+    try:
+        return _decoder.decode(chunk), False
+    except json.JSONDecodeError:
+        pass
+    
+    try:
+        return _decoder.decode(_TRAILING_COMMA.sub(r'\1', chunk)), True
+    except json.JSONDecodeError:
+        return None, False
+
+
+def _new_report() -> Dict[str, Any]:
+    return {"clean": False, "recovered": 0, "repaired": 0, "dropped": 0, "truncated": False}
+
+
+def _salvage_array_at(text: str, start: int, report: Dict[str, Any]) -> Tuple[List[Any], Optional[int]]:
+    """Поштучный разбор массива объектов, начинающегося в start ('[')
+    
+    Возвращает (элементы, позиция после ']'); позиция None - массив обрезан
+    """
+    items = []
+    position = start + 1
+    
+    while position < len(text):
+        object_start = text.find('{', position)
+        closing = text.find(']', position)
+        
+        if object_start == -1 or (closing != -1 and closing < object_start):
+            if closing == -1:
+                report["truncated"] = True
+                return items, None
+            return items, closing + 1
+        
+        object_end = _find_object_end(text, object_start)
+        if object_end is None:
+            # Последний объект обрезан по лимиту токенов
+            report["truncated"] = True
+            report["dropped"] += 1
+            return items, None
+        
+        item, repaired = _loads_object(text[object_start:object_end])
+        if item is None:
+            report["dropped"] += 1
+        else:
+            items.append(item)
+            if repaired:
+                report["repaired"] += 1
+        
+        position = object_end
+    
+    report["truncated"] = True
+    return items, None
+
+
+def _log_report(report: Dict[str, Any]):
+    if report["dropped"] or report["repaired"] or report["truncated"]:
+        logger.warning(f"⚠️ JSON Salvage: извлечено {report['recovered']}, починено {report['repaired']}, "
+                       f"потеряно {report['dropped']}{', ответ обрезан' if report['truncated'] else ''}")
+
+
+def salvage_json_array(text: str) -> Tuple[List[Any], Dict[str, Any]]:
+    """Извлечение элементов JSON массива из ответа ИИ
+    
+    Корректный массив разбирается целиком. Иначе массив проходится по одному объекту:
+    целые объекты сохраняются (висячие запятые чинятся), битые пропускаются,
+    обрезанный хвост отбрасывается.
+    
+    Возвращает (элементы, отчет): clean - ответ был валидным JSON, recovered - извлечено
+    элементов, repaired - объектов после ремонта, dropped - потеряно объектов, truncated - ответ обрезан
+    """
+    report = _new_report()
+    
+    array_match = _ARRAY_OF_OBJECTS_START.search(text)
+    start = array_match.start() if array_match else text.find('[')
+    if start == -1:
+        return [], report
+    
+    # Быстрый путь: валидный массив
+    try:
+        items, _ = _decoder.raw_decode(text, start)
+        if isinstance(items, list):
+            report["clean"] = True
+            report["recovered"] = len(items)
+            return items, report
+    except json.JSONDecodeError:
+        pass
+    
+    items, _ = _salvage_array_at(text, start, report)
+    report["recovered"] = len(items)
+    _log_report(report)
+    
+    return items, report
+
+
+def _count_array_items(value: Any) -> int:
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_count_array_items(item) for item in value.values())
+    return 0
+
+
+def salvage_json_object(text: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Извлечение JSON объекта с вложенными массивами объектов (например, тег -> уровень -> [вопросы])
+    
+    Корректный объект разбирается целиком. Иначе структура объектов проходится по ключам,
+    а каждый массив разбирается поштучно, как в salvage_json_array: из обрезанного ответа
+    остаются все целые элементы до места обрыва. Отчет - как у salvage_json_array
+    (recovered - элементов во всех массивах).
+    """
+    report = _new_report()
+    
+    start = text.find('{')
+    if start == -1:
+        return {}, report
+    
+    # Быстрый путь: валидный объект
+    try:
+        data, _ = _decoder.raw_decode(text, start)
+        if isinstance(data, dict):
+            report["clean"] = True
+            report["recovered"] = _count_array_items(data)
+            return data, report
+    except json.JSONDecodeError:
+        pass
+    
+    result: Dict[str, Any] = {}
+    path: List[Optional[str]] = []  # Ключи открытых вложенных объектов
+    key: Optional[str] = None       # Ключ, значение которого ожидается
+    position = start + 1
+    
+    def container() -> Dict[str, Any]:
+        node = result
+        for name in path:
+            if not isinstance(node.get(name), dict):
+                node[name] = {}
+            node = node[name]
+        return node
+    
+    while position < len(text):
+        char = text[position]
+        
+        if char in ' \t\r\n,:':
+            position += 1
+        
+        elif char == '"':
+            try:
+                value, position = _decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                report["truncated"] = True
+                break
+            if key is None:
+                key = value
+            else:
+                container()[key] = value
+                key = None
+        
+        elif char == '{':
+            path.append(key if key is not None else "")
+            key = None
+            position += 1
+        
+        elif char == '}':
+            if not path:
+                break
+            path.pop()
+            key = None
+            position += 1
+        
+        elif char == '[':
+            items, end = _salvage_array_at(text, position, report)
+            if key is not None:
+                container()[key] = items
+            key = None
+            if end is None:
+                break
+            position = end
+        
+        else:
+            # Число, true/false/null - до конца значения
+            position = max(_SCALAR_VALUE.match(text, position).end(), position + 1)
+            key = None
+    else:
+        report["truncated"] = True
+    
+    report["recovered"] = _count_array_items(result)
+    _log_report(report)
+    
+    return result, report
+
+
+# Экспорт
+__all__ = ['salvage_json_array', 'salvage_json_object']
@@ -0,0 +1,63 @@
+"""
+LLM Client - общий асинхронный клиент OpenAI
+Один AsyncOpenAI на процесс: агенты и фоновые задачи делят пул соединений
+Адрес API настраивается (OPENAI_BASE_URL) - например, локальный mock-сервер для нагрузочных тестов
+"""
+
+import logging
+from typing import Dict, List, Any, Optional
+
+import httpx
+
+# ИИ
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+# Глобальный экземпляр клиента (создается один раз)
+_global_openai_client: Optional[AsyncOpenAI] = None
+
+# Адрес OpenAI-совместимого API (None - api.openai.com)
+_openai_base_url: Optional[str] = None
+
+# event_hooks httpx-клиента (метрики отдельных HTTP-попыток, включая повторы SDK)
+_http_event_hooks: Optional[Dict[str, List[Any]]] = None
+
+
+def configure_openai_client(base_url: Optional[str] = None, event_hooks: Optional[Dict[str, List[Any]]] = None):
+    """Адрес API и HTTP-хуки общего клиента (вызывается до создания агентов)"""
+    global _openai_base_url, _http_event_hooks, _global_openai_client
+    
+    _openai_base_url = base_url
+    _http_event_hooks = event_hooks
+    _global_openai_client = None
+    
+    if base_url:
+        logger.info(f"🧪 LLM Client: запросы к ИИ идут на {base_url}")
+
+
+def get_openai_client(openai_api_key: str) -> Optional[AsyncOpenAI]:
+    """Получение общего асинхронного клиента OpenAI"""
+    global _global_openai_client
+    
+    if not openai_api_key:
+        return None
+    
+    if _global_openai_client is None:
+        http_client = None
+        if _http_event_hooks:
+            # Лимиты соединений - как у клиента OpenAI по умолчанию
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                event_hooks=_http_event_hooks
+            )
+        
+        _global_openai_client = AsyncOpenAI(api_key=openai_api_key, base_url=_openai_base_url, http_client=http_client)
+        logger.info("✅ LLM Client: общий AsyncOpenAI клиент создан")
+    
+    return _global_openai_client
+
+
+# Экспорт
+__all__ = ['get_openai_client', 'configure_openai_client']
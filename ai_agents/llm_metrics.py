@@ -0,0 +1,304 @@
+"""
+LLM Metrics - учет вызовов ИИ по агентам и операциям
+Задержка (гистограмма), токены (считаются локально, если API не вернул usage), стоимость, повторы HTTP,
+попадания в кэш и успешность разбора ответов; расход токенов по профессиям - в data/llm_costs.json
+"""
+
+import json
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from .llm_router import ROUTE_HEADER, AGENT_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+# Верхние границы корзин гистограммы задержки, сек (последняя корзина - все, что дольше)
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+# Атрибуты текущих вызовов ИИ (profession_id) - наследуются задачами asyncio
+_call_scope: ContextVar[Dict[str, Any]] = ContextVar("llm_call_scope", default={})
+
+
+@contextmanager
+def llm_call_scope(**attributes):
+    """Вызовы ИИ внутри блока относятся к переданным атрибутам (например, profession_id)"""
+    token = _call_scope.set({**_call_scope.get(), **{key: value for key, value in attributes.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _call_scope.reset(token)
+
+
+def current_call_scope() -> Dict[str, Any]:
+    return _call_scope.get()
+
+
+@contextmanager
+def llm_usage_scope():
+    """Расход токенов вызовов ИИ внутри блока - тот же учет, что в метриках (с локальной оценкой без usage)
+    
+    Вложенные блоки учитываются и во внешних
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "estimated_usage_calls": 0}
+    scope = _call_scope.get()
+    token = _call_scope.set({**scope, "usage_ledgers": scope.get("usage_ledgers", ()) + (usage,)})
+    try:
+        yield usage
+    finally:
+        _call_scope.reset(token)
+
+
+class LLMMetrics:
+    """Метрики вызовов ИИ: {агент.операция: счетчики} в памяти и расход по профессиям на диске
+    
+    Расход по профессиям пишется на диск не чаще раза в save_delay секунд (генерация вопросов - десятки вызовов)
+    """
+    
+    def __init__(self, data_dir: Path, max_professions: int = 2000, save_delay: float = 5.0):
+        self.store_file = data_dir / "llm_costs.json"
+        self.max_professions = max_professions
+        self.save_delay = save_delay
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        
+        self.operations: Dict[str, Dict[str, Any]] = {}
+        
+        # {profession_id: {"calls", "prompt_tokens", "completion_tokens", "cost_usd", "operations", "updated_at"}}
+        self.professions: Dict[str, Dict[str, Any]] = {}
+        
+        self._load_store()
+    
+    def _load_store(self):
+        """Загрузка расхода по профессиям"""
+        try:
+            if self.store_file.exists():
+                with open(self.store_file, 'r', encoding='utf-8') as f:
+                    self.professions = json.load(f).get("professions", {})
+        
+        except Exception as e:
+            logger.error(f"❌ LLM Metrics: Ошибка загрузки расхода по профессиям: {e}")
+            self.professions = {}
+    
+    def _save_store(self):
+        """Атомарная запись расхода по профессиям"""
+        try:
+            tmp_file = self.store_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"professions": self.professions}, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.store_file)
+        
+        except Exception as e:
+            logger.error(f"❌ LLM Metrics: Ошибка сохранения расхода по профессиям: {e}")
+    
+    def _schedule_save(self):
+        """Отложенная запись: изменения за save_delay секунд сохраняются одной записью"""
+        if self._save_handle is not None:
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты) - пишем сразу
+            self._save_store()
+            return
+        
+        self._save_handle = loop.call_later(self.save_delay, self.flush)
+    
+    def flush(self):
+        """Запись несохраненного расхода по профессиям (по таймеру и при остановке приложения)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+            self._save_store()
+    
+    def _operation(self, agent: str, operation: str) -> Dict[str, Any]:
+        return self.operations.setdefault(f"{agent}.{operation}", {
+            "agent": agent, "operation": operation,
+            "calls": 0, "errors": 0, "timeouts": 0, "fallbacks": 0,
+            "http_attempts": 0, "rate_limited": 0, "server_errors": 0,
+            "cache_hits": {}, "parse_ok": 0, "parse_failed": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "estimated_usage_calls": 0, "cost_usd": 0.0,
+            "latency_total": 0.0, "latency_max": 0.0, "latency_histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+            "models": {}
+        })
+    
+    # === ЗАПИСЬ ===
+    
+    def record_call(self, agent: str, operation: str, model: str, latency: float, prompt_tokens: int = 0,
+                    completion_tokens: int = 0, cost_usd: float = 0.0, usage_estimated: bool = False,
+                    error: Optional[BaseException] = None, timeout: bool = False, fallback: bool = False):
+        """Одна попытка вызова модели (вызов по цепочке fallback - несколько попыток)"""
+        metrics = self._operation(agent, operation)
+        metrics["calls"] += 1
+        metrics["latency_total"] += latency
+        metrics["latency_max"] = max(metrics["latency_max"], latency)
+        metrics["latency_histogram"][self._bucket(latency)] += 1
+        
+        if fallback:
+            metrics["fallbacks"] += 1
+        
+        model_metrics = metrics["models"].setdefault(model, {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        model_metrics["calls"] += 1
+        
+        if error is not None:
+            metrics["errors"] += 1
+            model_metrics["errors"] += 1
+            if timeout:
+                metrics["timeouts"] += 1
+            return
+        
+        for counters in (metrics, model_metrics):
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["cost_usd"] += cost_usd
+        if usage_estimated:
+            metrics["estimated_usage_calls"] += 1
+        
+        for usage in current_call_scope().get("usage_ledgers", ()):
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["total_tokens"] += prompt_tokens + completion_tokens
+            if usage_estimated:
+                usage["estimated_usage_calls"] += 1
+        
+        profession_id = current_call_scope().get("profession_id")
+        if profession_id:
+            self._add_profession_cost(str(profession_id), operation, prompt_tokens, completion_tokens, cost_usd)
+    
+    def record_cache_hit(self, agent: str, operation: str, cache: str):
+        """Ответ взят из кэша (cache - какого: coalesced, file_analysis, form_analysis, question_library)"""
+        hits = self._operation(agent, operation)["cache_hits"]
+        hits[cache] = hits.get(cache, 0) + 1
+    
+    def record_parse(self, agent: str, operation: str, ok: bool):
+        """Удалось ли разобрать ответ модели в ожидаемый формат"""
+        self._operation(agent, operation)["parse_ok" if ok else "parse_failed"] += 1
+    
+    def _add_profession_cost(self, profession_id: str, operation: str, prompt_tokens: int, completion_tokens: int, cost_usd: float):
+        entry = self.professions.setdefault(profession_id, {
+            "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "operations": {}
+        })
+        operation_entry = entry["operations"].setdefault(operation, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        
+        for counters in (entry, operation_entry):
+            counters["calls"] += 1
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["cost_usd"] = round(counters["cost_usd"] + cost_usd, 6)
+        entry["updated_at"] = datetime.now().isoformat()
+        
+        # Ограничение размера: забываем профессии, которые дольше всех не генерировались
+        overflow = len(self.professions) - self.max_professions
+        if overflow > 0:
+            for stale_id in sorted(self.professions, key=lambda pid: self.professions[pid].get("updated_at", ""))[:overflow]:
+                del self.professions[stale_id]
+        
+        self._schedule_save()
+    
+    # === HTTP (повторы SDK OpenAI видны только на уровне отдельных запросов) ===
+    
+    def http_event_hooks(self) -> Dict[str, List[Any]]:
+        """event_hooks для httpx-клиента OpenAI: попытки и ответы 429/5xx по заголовкам маршрута и агента"""
+        return {"request": [self._on_http_request], "response": [self._on_http_response]}
+    
+    async def _on_http_request(self, request):
+        operation = request.headers.get(ROUTE_HEADER)
+        if operation:
+            self._operation(request.headers.get(AGENT_HEADER, "app"), operation)["http_attempts"] += 1
+    
+    async def _on_http_response(self, response):
+        operation = response.request.headers.get(ROUTE_HEADER)
+        if not operation or response.status_code < 400:
+            return
+        
+        metrics = self._operation(response.request.headers.get(AGENT_HEADER, "app"), operation)
+        if response.status_code == 429:
+            metrics["rate_limited"] += 1
+        elif response.status_code >= 500:
+            metrics["server_errors"] += 1
+    
+    # === ОТЧЕТЫ ===
+    
+    @staticmethod
+    def _bucket(latency: float) -> int:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                return index
+        return len(LATENCY_BUCKETS)
+    
+    @staticmethod
+    def _percentile(histogram: List[int], share: float) -> Optional[float]:
+        """Оценка перцентиля сверху: граница корзины, в которую он попал"""
+        total = sum(histogram)
+        if not total:
+            return None
+        
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if seen >= share * total:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float("inf")
+        return None
+    
+    def report(self) -> Dict[str, Any]:
+        """Метрики по агентам и операциям, самые дорогие - первыми"""
+        report = {}
+        for key, metrics in sorted(self.operations.items(), key=lambda item: item[1]["cost_usd"], reverse=True):
+            calls = metrics["calls"]
+            parsed = metrics["parse_ok"] + metrics["parse_failed"]
+            histogram = metrics["latency_histogram"]
+            
+            report[key] = {
+                "agent": metrics["agent"],
+                "operation": metrics["operation"],
+                "calls": calls,
+                "errors": metrics["errors"],
+                "timeouts": metrics["timeouts"],
+                "fallbacks": metrics["fallbacks"],
+                # Попыток HTTP больше, чем вызовов, - SDK повторял запросы (429, 5xx, обрывы)
+                "retries": max(0, metrics["http_attempts"] - calls),
+                "rate_limited": metrics["rate_limited"],
+                "server_errors": metrics["server_errors"],
+                "cache_hits": metrics["cache_hits"],
+                "parse_success_rate": round(metrics["parse_ok"] / parsed, 3) if parsed else None,
+                "prompt_tokens": metrics["prompt_tokens"],
+                "completion_tokens": metrics["completion_tokens"],
+                "estimated_usage_calls": metrics["estimated_usage_calls"],
+                "cost_usd": round(metrics["cost_usd"], 6),
+                "latency_avg": round(metrics["latency_total"] / calls, 3) if calls else 0.0,
+                "latency_p50": self._percentile(histogram, 0.5),
+                "latency_p95": self._percentile(histogram, 0.95),
+                "latency_max": round(metrics["latency_max"], 3),
+                "latency_histogram": {
+                    (f"<={bound}" if index < len(LATENCY_BUCKETS) else f">{LATENCY_BUCKETS[-1]}"): count
+                    for index, (bound, count) in enumerate(zip(LATENCY_BUCKETS + (None,), histogram))
+                },
+                "models": {
+                    model: {**model_metrics, "cost_usd": round(model_metrics["cost_usd"], 6)}
+                    for model, model_metrics in metrics["models"].items()
+                }
+            }
+        
+        return report
+    
+    def profession_costs(self, profession_id: str) -> Optional[Dict[str, Any]]:
+        """Расход ИИ на профессию: теги, анализ при утверждении, генерация вопросов"""
+        entry = self.professions.get(profession_id)
+        if entry is None:
+            return None
+        return {**entry, "total_tokens": entry["prompt_tokens"] + entry["completion_tokens"]}
+    
+    def top_professions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Самые дорогие профессии"""
+        ranked = sorted(self.professions.items(), key=lambda item: item[1]["cost_usd"], reverse=True)[:limit]
+        return [{"profession_id": profession_id, **self.profession_costs(profession_id)} for profession_id, _ in ranked]
+
+
+# Экспорт
+__all__ = ['LLMMetrics', 'llm_call_scope', 'llm_usage_scope', 'current_call_scope']
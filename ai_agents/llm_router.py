@@ -0,0 +1,276 @@
+"""
+LLM Router - маршрутизация запросов агентов по моделям
+Каждая операция (маршрут) имеет свою цепочку моделей, таймаут и лимит токенов;
+медленная или недоступная модель заменяется следующей в цепочке
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Any, Optional
+
+# ИИ
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+from .llm_client import get_openai_client
+from .text_chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# Ошибки, при которых запрос уходит на следующую модель цепочки
+FALLBACK_ERRORS = (asyncio.TimeoutError, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+# Заголовки с именем маршрута и агента: по ним метрики считают HTTP-повторы,
+# а локальный mock-сервер выбирает формат ответа
+ROUTE_HEADER = "X-LLM-Route"
+AGENT_HEADER = "X-LLM-Agent"
+
+# Маршрут по умолчанию (операция не описана в таблице маршрутов)
+DEFAULT_ROUTE = {"models": ["gpt-4"], "timeout": 60, "max_tokens": 4000}
+
+
+class LLMRouter:
+    """Маршрутизатор запросов к OpenAI с fallback-цепочками и метриками по маршрутам"""
+    
+    def __init__(self, openai_client: AsyncOpenAI):
+        self.openai_client = openai_client
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self.model_prices: Dict[str, Dict[str, float]] = {}
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        
+        # Метрики по агентам и операциям (LLMMetrics, подключаются из приложения)
+        self.call_metrics = None
+        
+        # Singleflight: одинаковые запросы в полете {ключ: {"task": задача, "waiters": ожидающих}}
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+    
+    def configure(self, routes: Dict[str, Dict[str, Any]], model_tiers: Optional[Dict[str, str]] = None,
+                  model_prices: Optional[Dict[str, Dict[str, float]]] = None):
+        """Таблица маршрутов: {операция: {"tiers" или "models": [...], "timeout": сек, "max_tokens": N}}"""
+        model_tiers = model_tiers or {}
+        
+        self.routes = {}
+        for route, settings in routes.items():
+            models = settings.get("models") or [model_tiers.get(tier, tier) for tier in settings.get("tiers", [])]
+            self.routes[route] = {
+                "models": models or DEFAULT_ROUTE["models"],
+                "timeout": settings.get("timeout", DEFAULT_ROUTE["timeout"]),
+                "max_tokens": settings.get("max_tokens", DEFAULT_ROUTE["max_tokens"])
+            }
+        
+        self.model_prices = model_prices or {}
+        logger.info(f"✅ LLM Router: Настроено {len(self.routes)} маршрутов")
+    
+    def attach_metrics(self, call_metrics):
+        """Подключение LLMMetrics: каждый вызов учитывается по агенту и операции"""
+        self.call_metrics = call_metrics
+    
+    def record_cache_hit(self, route: str, cache: str, agent: str = "app"):
+        """Вызов ИИ не понадобился - ответ взят из кэша"""
+        if self.call_metrics is not None:
+            self.call_metrics.record_cache_hit(agent, route, cache)
+    
+    def record_parse(self, route: str, ok: bool, agent: str = "app"):
+        """Результат разбора ответа модели агентом"""
+        if self.call_metrics is not None:
+            self.call_metrics.record_parse(agent, route, ok)
+    
+    def get_route(self, route: str) -> Dict[str, Any]:
+        return self.routes.get(route, DEFAULT_ROUTE)
+    
+    async def complete(self, route: str, messages: List[Dict[str, str]], temperature: float = 0.2,
+                       max_tokens: Optional[int] = None, coalesce: bool = True, agent: str = "app", **kwargs):
+        """chat.completions.create по маршруту: модели цепочки пробуются по очереди
+        
+        max_tokens вызова ограничивается лимитом маршрута. Если все модели цепочки
+        упали по таймауту/недоступности, пробрасывается последняя ошибка.
+        
+        Одновременные одинаковые запросы (coalesce=True) ждут один общий вызов: результат
+        и ошибка достаются всем. Отмена одного ожидающего не прерывает вызов для остальных,
+        вызов отменяется, только когда его никто не ждет.
+        
+        agent - имя агента для метрик (агент + маршрут = операция).
+        """
+        if not coalesce:
+            return await self._complete(route, messages, temperature, max_tokens, agent, **kwargs)
+        
+        key = self._request_key(route, messages, temperature, max_tokens, kwargs)
+        entry = self._inflight.get(key)
+        
+        if entry is None:
+            entry = {"task": asyncio.ensure_future(self._complete(route, messages, temperature, max_tokens, agent, **kwargs)), "waiters": 0}
+            self._inflight[key] = entry
+            entry["task"].add_done_callback(lambda task: self._release_inflight(key, entry))
+        else:
+            self._metrics_for(route)["coalesced"] += 1
+            self.record_cache_hit(route, "coalesced", agent)
+            logger.info(f"🔗 LLM Router: {route} - одинаковый запрос уже выполняется, ждем его результат")
+        
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # Все ожидающие отменены - вызов больше никому не нужен
+                self._release_inflight(key, entry)
+                entry["task"].cancel()
+    
+    @staticmethod
+    def _request_key(route: str, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int],
+                     kwargs: Dict[str, Any]) -> str:
+        """Ключ singleflight: маршрут и все параметры запроса"""
+        payload = json.dumps([route, messages, temperature, max_tokens, kwargs], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _release_inflight(self, key: str, entry: Dict[str, Any]):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+    
+    async def _complete(self, route: str, messages: List[Dict[str, str]], temperature: float,
+                        max_tokens: Optional[int], agent: str = "app", **kwargs):
+        """Вызов по цепочке моделей маршрута"""
+        settings = self.get_route(route)
+        max_tokens = min(max_tokens, settings["max_tokens"]) if max_tokens else settings["max_tokens"]
+        
+        last_error: Optional[BaseException] = None
+        for attempt, model in enumerate(settings["models"]):
+            started = time.perf_counter()
+            
+            try:
+                response = await asyncio.wait_for(
+                    self.openai_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        extra_headers={ROUTE_HEADER: route, AGENT_HEADER: agent},
+                        **kwargs
+                    ),
+                    timeout=settings["timeout"]
+                )
+            except FALLBACK_ERRORS as e:
+                last_error = e
+                self._record(route, model, time.perf_counter() - started, error=e, fallback=attempt > 0, agent=agent)
+                logger.warning(f"⚠️ LLM Router: {route} / {model} недоступна ({type(e).__name__}), пробуем следующую модель")
+                continue
+            except Exception as e:
+                self._record(route, model, time.perf_counter() - started, error=e, fallback=attempt > 0, agent=agent)
+                raise
+            
+            self._record(route, model, time.perf_counter() - started, response=response, fallback=attempt > 0,
+                         agent=agent, messages=messages)
+            return response
+        
+        logger.error(f"❌ LLM Router: Все модели маршрута {route} недоступны")
+        raise last_error or RuntimeError(f"Маршрут {route} без моделей")
+    
+    # === МЕТРИКИ ===
+    
+    def _record(self, route: str, model: str, latency: float, response=None, error: Optional[BaseException] = None,
+                fallback: bool = False, agent: str = "app", messages: Optional[List[Dict[str, str]]] = None):
+        """Учет вызова: задержка, токены, стоимость, ошибки и срабатывания fallback"""
+        metrics = self._metrics_for(route)
+        model_metrics = metrics["models"].setdefault(model, {
+            "calls": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+        })
+        
+        metrics["calls"] += 1
+        model_metrics["calls"] += 1
+        model_metrics["latency_total"] += latency
+        model_metrics["latency_max"] = max(model_metrics["latency_max"], latency)
+        
+        if fallback:
+            metrics["fallbacks"] += 1
+        
+        if error is not None:
+            timeout = isinstance(error, (asyncio.TimeoutError, APITimeoutError))
+            metrics["errors"] += 1
+            model_metrics["errors"] += 1
+            if timeout:
+                metrics["timeouts"] += 1
+            if self.call_metrics is not None:
+                self.call_metrics.record_call(agent, route, model, latency, error=error, timeout=timeout, fallback=fallback)
+            return
+        
+        prompt_tokens, completion_tokens, estimated = self._usage(response, messages)
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        model_metrics["prompt_tokens"] += prompt_tokens
+        model_metrics["completion_tokens"] += completion_tokens
+        model_metrics["cost_usd"] += cost
+        
+        if self.call_metrics is not None:
+            self.call_metrics.record_call(agent, route, model, latency, prompt_tokens, completion_tokens, cost,
+                                          usage_estimated=estimated, fallback=fallback)
+    
+    @staticmethod
+    def _usage(response, messages: Optional[List[Dict[str, str]]]) -> tuple:
+        """Токены вызова (prompt, completion, оценка ли): из usage ответа, а без него - локальный подсчет"""
+        usage = getattr(response, "usage", None)
+        if usage:
+            return usage.prompt_tokens, usage.completion_tokens, False
+        
+        prompt_tokens = sum(count_tokens(str(message.get("content") or "")) for message in messages or [])
+        completion_tokens = sum(count_tokens(choice.message.content or "") for choice in getattr(response, "choices", None) or [])
+        return prompt_tokens, completion_tokens, True
+    
+    def _metrics_for(self, route: str) -> Dict[str, Any]:
+        return self._metrics.setdefault(route, {"calls": 0, "errors": 0, "timeouts": 0, "fallbacks": 0, "coalesced": 0, "models": {}})
+    
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Стоимость вызова в USD по ценам за 1M токенов"""
+        prices = self.model_prices.get(model)
+        if not prices:
+            return 0.0
+        return (prompt_tokens * prices.get("input", 0) + completion_tokens * prices.get("output", 0)) / 1_000_000
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Метрики по маршрутам и моделям (средняя задержка, токены, стоимость)"""
+        report = {}
+        for route, metrics in self._metrics.items():
+            models = {}
+            for model, model_metrics in metrics["models"].items():
+                models[model] = {
+                    **{key: value for key, value in model_metrics.items() if key != "latency_total"},
+                    "latency_avg": round(model_metrics["latency_total"] / model_metrics["calls"], 3) if model_metrics["calls"] else 0.0,
+                    "latency_max": round(model_metrics["latency_max"], 3),
+                    "cost_usd": round(model_metrics["cost_usd"], 6)
+                }
+            
+            report[route] = {
+                "calls": metrics["calls"],
+                "errors": metrics["errors"],
+                "timeouts": metrics["timeouts"],
+                "fallbacks": metrics["fallbacks"],
+                "coalesced": metrics["coalesced"],
+                "cost_usd": round(sum(model["cost_usd"] for model in models.values()), 6),
+                "route": self.get_route(route),
+                "models": models
+            }
+        
+        return report
+
+
+# Глобальный маршрутизатор (создается один раз поверх общего клиента)
+_global_llm_router: Optional[LLMRouter] = None
+
+
+def get_llm_router(openai_api_key: str) -> Optional[LLMRouter]:
+    """Получение общего маршрутизатора LLM (None без API ключа)"""
+    global _global_llm_router
+    
+    openai_client = get_openai_client(openai_api_key)
+    if openai_client is None:
+        return None
+    
+    if _global_llm_router is None:
+        _global_llm_router = LLMRouter(openai_client)
+    
+    return _global_llm_router
+
+
+# Экспорт
+__all__ = ['LLMRouter', 'get_llm_router', 'ROUTE_HEADER', 'AGENT_HEADER']
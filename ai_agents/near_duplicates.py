@@ -0,0 +1,124 @@
+"""
+Near Duplicates - индекс почти-дубликатов вопросов (MinHash + LSH)
+Проверка нового вопроса не зависит от размера банка: сравниваются только кандидаты из общих LSH-корзин
+"""
+
+import re
+import random
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+_HASH_MASK = (1 << 64) - 1
+
+
+def normalize_question_text(question: Dict[str, Any]) -> str:
+    """Нормализованный текст вопроса вместе с вариантами ответа (порядок вариантов не важен)"""
+    parts = [str(question.get("question", ""))] + sorted(str(option) for option in question.get("options", []))
+    text = " ".join(parts).lower().replace("ё", "е")
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class NearDuplicateIndex:
+    """MinHash LSH индекс вопросов профессии"""
+    
+    def __init__(self, threshold: float = 0.7, num_perm: int = 64, bands: int = 16, shingle_size: int = 5):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        
+        # Случайные маски перестановок MinHash
+        rng = random.Random(1)
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        
+        self._buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, List[int]] = {}
+        
+        self.stats = {"indexed": 0, "checked": 0, "duplicates": 0}
+    
+    def _shingles(self, text: str) -> set:
+        """Символьные k-граммы текста"""
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+    
+    def _signature(self, text: str) -> List[int]:
+        """MinHash сигнатура (перестановки - XOR со случайными масками, минимум считается в C через map)
+        
+        Встроенный hash() строк зависит от процесса - сигнатуры живут только в памяти индекса
+        """
+        hashes = [hash(shingle) & _HASH_MASK for shingle in self._shingles(text)]
+        return [min(map(mask.__xor__, hashes)) for mask in self._masks]
+    
+    def _band_keys(self, signature: List[int]) -> List[Tuple[int, ...]]:
+        return [tuple(signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+    
+    def _similarity(self, first: List[int], second: List[int]) -> float:
+        """Оценка сходства Жаккара по сигнатурам"""
+        return sum(1 for x, y in zip(first, second) if x == y) / self.num_perm
+    
+    def _find(self, signature: List[int]) -> Optional[Tuple[str, float]]:
+        """Ближайший почти-дубликат среди кандидатов из общих корзин"""
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(band_key, []))
+        
+        best = None
+        for key in candidates:
+            similarity = self._similarity(signature, self._signatures[key])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        
+        return best
+    
+    def _insert(self, key: str, signature: List[int]):
+        self._signatures[key] = signature
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        self.stats["indexed"] += 1
+    
+    def add(self, key: str, question: Dict[str, Any]):
+        """Добавление вопроса без проверки (существующий банк)"""
+        if key not in self._signatures:
+            self._insert(key, self._signature(normalize_question_text(question)))
+    
+    def check_and_add(self, key: str, question: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+        """Проверка вопроса: (ключ дубликата, сходство) или None - тогда вопрос добавляется в индекс"""
+        signature = self._signature(normalize_question_text(question))
+        self.stats["checked"] += 1
+        
+        duplicate = self._find(signature)
+        if duplicate:
+            self.stats["duplicates"] += 1
+            return duplicate
+        
+        self._insert(key, signature)
+        return None
+    
+    def filter_new(self, questions: List[Dict[str, Any]], key_prefix: str = "") -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Разделение батча на уникальные вопросы и почти-дубликаты (внутри батча тоже)"""
+        unique, duplicates = [], []
+        
+        for index, question in enumerate(questions):
+            key = question.get("id") or f"{key_prefix}{self.stats['checked']}:{index}"
+            duplicate = self.check_and_add(key, question)
+            
+            if duplicate:
+                logger.info(f"♻️ Почти-дубликат ({duplicate[1]:.0%}): {question.get('question', '')[:60]}")
+                duplicates.append(question)
+            else:
+                unique.append(question)
+        
+        return unique, duplicates
+    
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+# Экспорт
+__all__ = ['NearDuplicateIndex', 'normalize_question_text']
@@ -0,0 +1,235 @@
+"""
+Ngram Vectors - локальный векторный индекс названий профессий
+Символьные n-граммы с TF-IDF весами и косинусная близость (NumPy, без внешних сервисов):
+находит "Data Scientist" / "Data Science Specialist" и кириллические/латинские варианты названий
+"""
+
+import re
+import math
+import logging
+from typing import Dict, List, Optional, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Транслитерация кириллицы (включая казахские буквы) в латиницу
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "c", "ч": "ch", "ш": "sh", "щ": "sh",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u", "һ": "h", "і": "i"
+})
+
+
+def normalize_title(text: str) -> str:
+    """Название в латинице без знаков препинания"""
+    text = (text or "").lower().translate(_TRANSLIT)
+    text = re.sub(r'[^\w]+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class NgramVectorIndex:
+    """TF-IDF векторы символьных n-грамм в CSR-массивах (indptr / indices / counts)
+    
+    Профессии добавляются по одной; IDF и нормы векторов пересчитываются лениво
+    перед поиском. Удаленные строки помечаются и вычищаются, когда их становится много.
+    """
+    
+    def __init__(self, ngram_size: int = 3, max_batch_cells: int = 4_000_000):
+        self.ngram_size = ngram_size
+        self.max_batch_cells = max_batch_cells
+        
+        self._vocab: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        
+        self._ids: List[str] = []
+        self._texts: Dict[str, str] = {}
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.float32)
+        
+        # Строки, добавленные после последней сборки массивов
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._removed = 0
+        
+        # Нормированные TF-IDF веса ненулевых элементов (None - нужно пересчитать)
+        self._weights: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+    
+    def _ngrams(self, text: str) -> Dict[str, int]:
+        """Символьные n-граммы слов названия (с границами слов)"""
+        grams: Dict[str, int] = {}
+        for word in normalize_title(text).split():
+            padded = f" {word} "
+            if len(padded) <= self.ngram_size:
+                grams[padded] = grams.get(padded, 0) + 1
+                continue
+            for i in range(len(padded) - self.ngram_size + 1):
+                gram = padded[i:i + self.ngram_size]
+                grams[gram] = grams.get(gram, 0) + 1
+        return grams
+    
+    def add(self, item_id: str, text: str):
+        """Добавление (или замена) названия"""
+        if self._texts.get(item_id) == text:
+            return
+        if item_id in self._rows:
+            self.remove(item_id)
+        
+        grams = self._ngrams(text)
+        if not grams:
+            return
+        
+        columns = []
+        for gram in grams:
+            column = self._vocab.get(gram)
+            if column is None:
+                column = self._vocab[gram] = len(self._vocab)
+            columns.append(column)
+        
+        if len(self._vocab) > len(self._df):
+            self._df = np.concatenate([self._df, np.zeros(max(len(self._vocab) - len(self._df), len(self._df)), dtype=np.int64)])
+        
+        columns = np.array(columns, dtype=np.int64)
+        self._df[columns] += 1
+        
+        self._rows[item_id] = len(self._ids)
+        self._ids.append(item_id)
+        self._texts[item_id] = text
+        self._pending.append((columns, np.array(list(grams.values()), dtype=np.float32)))
+        self._weights = None
+    
+    def remove(self, item_id: str):
+        """Удаление названия (строка помечается удаленной)"""
+        row = self._rows.pop(item_id, None)
+        self._texts.pop(item_id, None)
+        if row is None:
+            return
+        
+        self._build()
+        self._df[self._indices[self._indptr[row]:self._indptr[row + 1]]] -= 1
+        self._alive[row] = False
+        self._removed += 1
+        self._weights = None
+    
+    def sync(self, texts: Dict[str, str]):
+        """Приведение индекса к набору {id: название}: новые добавляются, исчезнувшие удаляются"""
+        for item_id in [item_id for item_id in self._rows if item_id not in texts]:
+            self.remove(item_id)
+        for item_id, text in texts.items():
+            self.add(item_id, text)
+        
+        if self._removed > 100 and self._removed > len(self._rows):
+            self._rebuild()
+    
+    def _rebuild(self):
+        """Полная пересборка без удаленных строк"""
+        texts = dict(self._texts)
+        self.__init__(self.ngram_size, self.max_batch_cells)
+        for item_id, text in texts.items():
+            self.add(item_id, text)
+    
+    def _build(self):
+        """Дописывание новых строк в CSR-массивы"""
+        if not self._pending:
+            return
+        
+        lengths = np.array([len(columns) for columns, _ in self._pending], dtype=np.int64)
+        self._indptr = np.concatenate([self._indptr, self._indptr[-1] + np.cumsum(lengths)])
+        self._indices = np.concatenate([self._indices] + [columns for columns, _ in self._pending])
+        self._counts = np.concatenate([self._counts] + [counts for _, counts in self._pending])
+        self._alive = np.concatenate([self._alive, np.ones(len(self._pending), dtype=bool)])
+        self._pending = []
+    
+    def _idf(self) -> np.ndarray:
+        """Сглаженный IDF по живым строкам"""
+        documents = len(self._rows)
+        return (np.log((1 + documents) / (1 + self._df[:len(self._vocab)])) + 1).astype(np.float32)
+    
+    def _doc_weights(self) -> np.ndarray:
+        """L2-нормированные TF-IDF веса всех ненулевых элементов"""
+        self._build()
+        if self._weights is None:
+            row_of_element = np.repeat(np.arange(len(self._ids)), np.diff(self._indptr))
+            weights = self._counts * self._idf()[self._indices]
+            norms = np.sqrt(np.bincount(row_of_element, weights=weights ** 2, minlength=len(self._ids)))
+            self._weights = (weights / norms[row_of_element]).astype(np.float32)
+        return self._weights
+    
+    def _query_matrix(self, texts: List[str], idf: np.ndarray) -> np.ndarray:
+        """Плотные L2-нормированные векторы запросов (n-граммы вне словаря учитываются в норме)"""
+        unseen_idf = math.log(1 + len(self._rows)) + 1
+        matrix = np.zeros((len(texts), len(self._vocab)), dtype=np.float32)
+        
+        for i, text in enumerate(texts):
+            norm = 0.0
+            for gram, count in self._ngrams(text).items():
+                column = self._vocab.get(gram)
+                weight = count * (idf[column] if column is not None else unseen_idf)
+                norm += weight ** 2
+                if column is not None:
+                    matrix[i, column] = weight
+            if norm:
+                matrix[i] /= math.sqrt(norm)
+        
+        return matrix
+    
+    def search_batch(self, texts: List[str], top_k: int = 5, min_score: float = 0.0,
+                     exclude_ids: Optional[Iterable[Optional[str]]] = None) -> List[List[Tuple[float, str]]]:
+        """Косинусный top-k для нескольких запросов: [[(близость, id)] по убыванию] на каждый запрос"""
+        if not texts:
+            return []
+        if not self._rows:
+            return [[] for _ in texts]
+        
+        weights = self._doc_weights()
+        query = self._query_matrix(texts, self._idf())
+        exclude_ids = list(exclude_ids) if exclude_ids is not None else [None] * len(texts)
+        
+        # Скалярные произведения построчно: сумма по ненулевым элементам каждой строки (reduceat по indptr)
+        nonempty = np.diff(self._indptr) > 0
+        starts = self._indptr[:-1][nonempty]
+        chunk = max(1, self.max_batch_cells // max(1, len(self._indices)))
+        
+        results = []
+        for offset in range(0, len(texts), chunk):
+            products = query[offset:offset + chunk][:, self._indices] * weights
+            scores = np.full((len(products), len(self._ids)), -1.0, dtype=np.float32)
+            scores[:, nonempty] = np.add.reduceat(products, starts, axis=1)
+            scores[:, ~self._alive] = -1.0
+            
+            for row_scores, exclude_id in zip(scores, exclude_ids[offset:offset + chunk]):
+                if exclude_id in self._rows:
+                    row_scores[self._rows[exclude_id]] = -1.0
+                results.append(self._top(row_scores, top_k, min_score))
+        
+        return results
+    
+    def search(self, text: str, top_k: int = 5, min_score: float = 0.0,
+               exclude_id: Optional[str] = None) -> List[Tuple[float, str]]:
+        """Косинусный top-k для одного запроса"""
+        return self.search_batch([text], top_k, min_score, [exclude_id])[0]
+    
+    def _top(self, scores: np.ndarray, top_k: int, min_score: float) -> List[Tuple[float, str]]:
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(float(scores[row]), self._ids[row]) for row in candidates if scores[row] >= min_score and scores[row] > 0]
+
+
+# Экспорт
+__all__ = ['NgramVectorIndex', 'normalize_title']
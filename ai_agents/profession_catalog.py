@@ -0,0 +1,135 @@
+"""
+Profession Catalog - общая для агентов модель чтения реестра профессий
+Хранит только метаданные профессий (без вопросов и истории) и индексы похожести
+(слова и символьные n-граммы), перечитывает profession_records.json после каждой записи в файл
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from .similarity_index import SimilarityIndex
+from .ngram_vectors import NgramVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+# Поля профессии, которые нужны агентам (вопросы, история и версии тегов не хранятся)
+CATALOG_FIELDS = (
+    "id", "bank_title", "real_name", "specialization", "department", "status", "tags",
+    "created_by", "created_at", "approved_at", "questions_generated_at"
+)
+
+# Статусы утвержденных профессий (попадают в векторный индекс)
+APPROVED_STATUSES = ("approved_by_head", "questions_generated", "active")
+
+# Поля с индексом символьных n-грамм (по ним агенты ищут близкие по написанию названия)
+FUZZY_FIELDS = ("real_name", "bank_title")
+
+
+class ProfessionCatalog:
+    """Проекция data/profession_records.json, общая для HR Assistant, Tags Generator и Head Approval"""
+    
+    def __init__(self, data_dir: Path, max_records: int = 5000):
+        self.records_file = data_dir / "profession_records.json"
+        self.max_records = max_records
+        
+        self._records: List[Dict[str, Any]] = []
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._similarity = SimilarityIndex()
+        self._vectors = {field: NgramVectorIndex() for field in FUZZY_FIELDS}
+        self._file_signature = None
+        
+        self.refresh()
+    
+    @staticmethod
+    def project(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Метаданные профессии для агентов"""
+        projection = {field: record[field] for field in CATALOG_FIELDS if field in record}
+        projection["questions_count"] = len(record.get("questions", []))
+        projection["tags_versions_count"] = len(record.get("tags_versions", []))
+        return projection
+    
+    def _current_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.records_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def refresh(self, force: bool = False):
+        """Перечитывание реестра, если файл изменился с прошлого чтения"""
+        signature = self._current_signature()
+        if not force and signature == self._file_signature:
+            return
+        
+        try:
+            records = []
+            if signature is not None:
+                with open(self.records_file, 'r', encoding='utf-8') as f:
+                    records = json.load(f).get("profession_records", [])
+            
+            self._set_records(records)
+            self._file_signature = signature
+        
+        except Exception as e:
+            # Файл мог читаться в момент записи - остаемся на прошлой версии до следующего обращения
+            logger.error(f"❌ Profession Catalog: Ошибка чтения реестра: {e}")
+    
+    def _set_records(self, records: List[Dict[str, Any]]):
+        if len(records) > self.max_records:
+            # Ограничение памяти: оставляем самые свежие профессии
+            logger.warning(f"⚠️ Profession Catalog: {len(records)} профессий, в каталоге остаются {self.max_records} последних")
+            records = sorted(records, key=lambda record: record.get("created_at", ""))[-self.max_records:]
+        
+        self._records = [self.project(record) for record in records]
+        self._by_id = {record.get("id"): record for record in self._records}
+        self._similarity = SimilarityIndex.build(self._records)
+        
+        # Векторы n-грамм дополняются инкрементально: пересчитываются только новые и измененные названия
+        approved = [record for record in self._records if record.get("status") in APPROVED_STATUSES]
+        for field, vectors in self._vectors.items():
+            vectors.sync({record["id"]: record[field] for record in approved if record.get("id") and record.get(field)})
+    
+    def records(self, statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Профессии каталога (опционально только с указанными статусами)"""
+        self.refresh()
+        if statuses is None:
+            return list(self._records)
+        
+        statuses = set(statuses)
+        return [record for record in self._records if record.get("status") in statuses]
+    
+    def get(self, profession_id: str) -> Optional[Dict[str, Any]]:
+        """Профессия по ID"""
+        self.refresh()
+        return self._by_id.get(profession_id)
+    
+    @property
+    def revision(self) -> Optional[tuple]:
+        """Ревизия реестра: меняется после каждой записи в profession_records.json"""
+        self.refresh()
+        return self._file_signature
+    
+    @property
+    def similarity(self) -> SimilarityIndex:
+        """Индекс слов названий для поиска дубликатов и похожих профессий"""
+        self.refresh()
+        return self._similarity
+    
+    def fuzzy_search(self, field: str, text: str, top_k: int = 5, min_score: float = 0.0,
+                     exclude_id: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Утвержденные профессии, близкие по символьным n-граммам поля из FUZZY_FIELDS: [(косинус, профессия)]"""
+        self.refresh()
+        matches = self._vectors[field].search(text, top_k=top_k, min_score=min_score, exclude_id=exclude_id)
+        return [(score, self._by_id[record_id]) for score, record_id in matches if record_id in self._by_id]
+    
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._records)
+
+
+# Экспорт
+__all__ = ['ProfessionCatalog']
@@ -0,0 +1,90 @@
+"""
+Prompt Builder - промпты с бюджетом токенов
+В промпт попадают только нужные поля записей; если промпт не укладывается в бюджет (локальный подсчет
+токенов), части сокращаются в заданном порядке: списки - с конца, текст - обрезкой, с записью в лог
+"""
+
+import logging
+from typing import Dict, List, Any, Callable, Optional, Sequence
+
+from .text_chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Текстовое поле не обрезается короче этого (токены): от поля остается начало, а не пустая строка
+MIN_TEXT_FIELD_TOKENS = 32
+
+
+def project_fields(record: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Только перечисленные поля записи (без истории, вопросов и версий тегов)"""
+    return {field: record[field] for field in fields if field in record}
+
+
+def _render(field: str, value: Any, renderers: Dict[str, Callable[[List[Any]], str]]) -> str:
+    if isinstance(value, list):
+        return renderers.get(field, lambda items: "\n".join(map(str, items)))(value)
+    return str(value)
+
+
+def build_prompt(name: str, template: str, fields: Dict[str, Any], max_tokens: int, trim_order: Sequence[str] = (),
+                 renderers: Optional[Dict[str, Callable[[List[Any]], str]]] = None) -> str:
+    """Промпт из шаблона (str.format) не длиннее max_tokens токенов
+    
+    fields - значения подстановок: строка или список элементов по убыванию важности
+    (renderers[поле] превращает список в текст). Поля trim_order сокращаются по очереди,
+    пока промпт не уложится в бюджет: списки - хоть до пустого, текст - не короче
+    MIN_TEXT_FIELD_TOKENS; остальные поля не трогаются.
+    """
+    renderers = renderers or {}
+    values = dict(fields)
+    
+    def render() -> str:
+        return template.format(**{field: _render(field, value, renderers) for field, value in values.items()})
+    
+    prompt = render()
+    tokens = count_tokens(prompt)
+    if tokens <= max_tokens:
+        return prompt
+    
+    original_tokens = tokens
+    for field in trim_order:
+        value = values.get(field)
+        if not value:
+            continue
+        
+        if isinstance(value, list):
+            # Списки упорядочены по важности - отбрасываются последние элементы
+            kept = list(value)
+            while kept and tokens > max_tokens:
+                kept.pop()
+                values[field] = kept
+                tokens = count_tokens(render())
+            logger.info(f"✂️ Prompt Builder: {name} - {field}: оставлено {len(kept)} из {len(value)}")
+        else:
+            text = cut = str(value)
+            chars = len(text)
+            while tokens > max_tokens and count_tokens(cut) > MIN_TEXT_FIELD_TOKENS:
+                # Символов - по средней плотности токенов, но каждый шаг короче предыдущего
+                cut_tokens = count_tokens(cut)
+                target = max(MIN_TEXT_FIELD_TOKENS, cut_tokens - (tokens - max_tokens))
+                chars = min(chars - 1, int(chars * target / cut_tokens))
+                cut = text[:chars].rstrip() + "…"
+                values[field] = cut
+                tokens = count_tokens(render())
+            if cut != text:
+                logger.info(f"✂️ Prompt Builder: {name} - {field}: обрезано с {len(text)} до {len(cut)} символов")
+        
+        if tokens <= max_tokens:
+            break
+    
+    prompt = render()
+    if tokens > max_tokens:
+        logger.warning(f"⚠️ Prompt Builder: {name} - {tokens} токенов при бюджете {max_tokens}, сокращать больше нечего")
+    else:
+        logger.info(f"✂️ Prompt Builder: {name} - промпт сокращен с {original_tokens} до {tokens} токенов (бюджет {max_tokens})")
+    
+    return prompt
+
+
+# Экспорт
+__all__ = ['build_prompt', 'project_fields']
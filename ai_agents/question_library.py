@@ -0,0 +1,159 @@
+"""
+Question Library - общая библиотека вопросов по тегам и уровням сложности
+Общие для разных профессий теги (SQL, Python, Git, Excel...) берут проверенные вопросы из библиотеки,
+ИИ генерирует только недостающие
+"""
+
+import json
+import uuid
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .near_duplicates import NearDuplicateIndex, normalize_question_text
+
+logger = logging.getLogger(__name__)
+
+
+# Поля вопроса, которые хранятся в библиотеке (метаданные профессии не переносятся)
+LIBRARY_QUESTION_FIELDS = ("question", "options", "correct_answer", "explanation", "category", "difficulty")
+
+
+class QuestionLibrary:
+    """Библиотека вопросов: data/question_library.json"""
+    
+    def __init__(self, data_dir: Path, max_per_bucket: int = 200, same_profession_only: bool = False):
+        self.library_file = data_dir / "question_library.json"
+        self.max_per_bucket = max_per_bucket
+        self.same_profession_only = same_profession_only
+        
+        # {тег (нормализованный): {сложность: [вопросы]}}
+        self.tags: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._known_texts = set()
+        self._dirty = False
+        
+        self._load_library()
+    
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return tag.strip().lower()
+    
+    def _load_library(self):
+        """Загрузка библиотеки"""
+        try:
+            if self.library_file.exists():
+                with open(self.library_file, 'r', encoding='utf-8') as f:
+                    self.tags = json.load(f).get("tags", {})
+            
+            for levels in self.tags.values():
+                for questions in levels.values():
+                    self._known_texts.update(normalize_question_text(q) for q in questions)
+            
+            logger.info(f"✅ Question Library: Загружено {len(self._known_texts)} вопросов по {len(self.tags)} тегам")
+        
+        except Exception as e:
+            logger.error(f"❌ Question Library: Ошибка загрузки библиотеки: {e}")
+            self.tags = {}
+    
+    def save(self):
+        """Атомарная запись библиотеки (только если были изменения)"""
+        if not self._dirty:
+            return
+        
+        try:
+            data = {
+                "updated_at": datetime.now().isoformat() + "Z",
+                "tags": self.tags
+            }
+            
+            tmp_file = self.library_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.library_file)
+            
+            self._dirty = False
+        
+        except Exception as e:
+            logger.error(f"❌ Question Library: Ошибка сохранения библиотеки: {e}")
+    
+    def _context_rank(self, entry: Dict[str, Any], profession_context: Dict[str, Any]) -> int:
+        """Близость источника вопроса к профессии: 0 - та же специализация, 1 - та же профессия, 2 - другая"""
+        source = entry.get("source", {})
+        if source.get("real_name") != profession_context.get("real_name"):
+            return 2
+        return 0 if source.get("specialization") == profession_context.get("specialization") else 1
+    
+    def draw(self, tag: str, difficulty: str, count: int, profession_context: Dict[str, Any],
+             dedup_index: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+        """До count вопросов из библиотеки (сначала близкие по профессии и реже использованные)
+        
+        Вопросы, почти совпадающие с уже имеющимися в банке профессии, пропускаются
+        """
+        if count <= 0:
+            return []
+        
+        entries = self.tags.get(self._tag_key(tag), {}).get(difficulty, [])
+        if self.same_profession_only:
+            entries = [entry for entry in entries if self._context_rank(entry, profession_context) < 2]
+        
+        ranked = sorted(entries, key=lambda entry: (self._context_rank(entry, profession_context), entry.get("usage_count", 0)))
+        
+        drawn = []
+        for entry in ranked:
+            question = {field: entry[field] for field in LIBRARY_QUESTION_FIELDS if field in entry}
+            question["library_id"] = entry["library_id"]
+            
+            if dedup_index is not None and dedup_index.check_and_add(entry["library_id"], question):
+                continue
+            
+            entry["usage_count"] = entry.get("usage_count", 0) + 1
+            drawn.append(question)
+            if len(drawn) >= count:
+                break
+        
+        if drawn:
+            self._dirty = True
+            logger.info(f"📚 Question Library: {len(drawn)} из {count} вопросов {tag}/{difficulty} взяты из библиотеки")
+        
+        return drawn
+    
+    def add(self, tag: str, questions: List[Dict[str, Any]], profession_context: Dict[str, Any]) -> int:
+        """Пополнение библиотеки новыми проверенными вопросами тега (точные повторы не добавляются)"""
+        added = 0
+        levels = self.tags.setdefault(self._tag_key(tag), {})
+        
+        for question in questions:
+            if question.get("library_id"):
+                continue  # Вопрос и так из библиотеки
+            
+            normalized = normalize_question_text(question)
+            difficulty = question.get("difficulty", "medium")
+            bucket = levels.setdefault(difficulty, [])
+            
+            if normalized in self._known_texts or len(bucket) >= self.max_per_bucket:
+                continue
+            
+            entry = {field: question[field] for field in LIBRARY_QUESTION_FIELDS if field in question}
+            entry.update({
+                "library_id": str(uuid.uuid4()),
+                "source": {
+                    "real_name": profession_context.get("real_name", ""),
+                    "specialization": profession_context.get("specialization", "")
+                },
+                "usage_count": 0,
+                "added_at": datetime.now().isoformat() + "Z"
+            })
+            
+            bucket.append(entry)
+            self._known_texts.add(normalized)
+            added += 1
+        
+        if added:
+            self._dirty = True
+        
+        return added
+
+
+# Экспорт
+__all__ = ['QuestionLibrary']
@@ -3,16 +3,20 @@ Questions Generator - ИИ генератор вопросов для тести
 Создает 30-50 умных вопросов на каждый тег в 3 уровнях сложности
 """
 
-import json
 import logging
-import re
 import uuid
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
 from pathlib import Path
 from datetime import datetime
 
 # ИИ
-from openai import AsyncOpenAI
+from .llm_client import get_openai_client
+from .llm_router import get_llm_router
+from .llm_metrics import llm_usage_scope
+from .generation_checkpoints import GenerationCheckpoints
+from .json_salvage import salvage_json_array, salvage_json_object
+from .near_duplicates import NearDuplicateIndex
+from .question_library import QuestionLibrary
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +24,24 @@ logger = logging.getLogger(__name__)
 class QuestionsGenerator:
     """ИИ генератор вопросов для тестирования навыков"""
     
-    def __init__(self, openai_api_key: str, data_dir: Path):
+    def __init__(self, openai_api_key: str, data_dir: Path, generation_mode: str = "per_level", pack_max_questions: int = 20,
+                 duplicate_threshold: float = 0.7, use_library: bool = True, library_same_profession_only: bool = False):
         self.openai_api_key = openai_api_key
         self.data_dir = data_dir
         self.openai_client = None
+        self.llm_router = None
+        self.checkpoints = GenerationCheckpoints(data_dir)
+        
+        # "per_level" - отдельный запрос на (тег, сложность); "packed" - все уровни тега
+        # (или группа небольших тегов) в одном запросе
+        self.generation_mode = generation_mode
+        self.pack_max_questions = pack_max_questions
+        
+        # Порог сходства (MinHash, Жаккар), выше которого вопрос считается почти-дубликатом
+        self.duplicate_threshold = duplicate_threshold
+        
+        # Общая библиотека вопросов по тегам (None - каждый тег генерируется заново)
+        self.library = QuestionLibrary(data_dir, same_profession_only=library_same_profession_only) if use_library else None
         
         self._initialize_openai()
     
@@ -31,7 +49,8 @@ class QuestionsGenerator:
         """Инициализация OpenAI клиента"""
         try:
             if self.openai_api_key:
-                self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self.openai_client = get_openai_client(self.openai_api_key)
+                self.llm_router = get_llm_router(self.openai_api_key)
                 logger.info("✅ Questions Generator: OpenAI инициализирован")
             else:
                 logger.warning("⚠️ Questions Generator: OpenAI API ключ не найден")
@@ -40,8 +59,41 @@ class QuestionsGenerator:
     
     # === ГЕНЕРАЦИЯ ВОПРОСОВ ДЛЯ ПРОФЕССИИ ===
     
-    async def generate_questions_for_profession(self, profession: Dict[str, Any]) -> Dict[str, Any]:
-        """Генерация вопросов для всех тегов профессии"""
+    async def generate_questions_for_profession(self, profession: Dict[str, Any],
+                                                progress_callback: Optional[Callable[[int, int, str], None]] = None,
+                                                existing_questions: Optional[List[Dict[str, Any]]] = None,
+                                                tags_changes: Optional[Dict[str, Any]] = None,
+                                                difficulties: Optional[List[str]] = None,
+                                                checkpoint_id: Optional[str] = None,
+                                                stop_check: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, Any]:
+        """Генерация вопросов для всех тегов профессии (progress_callback(готово, всего, тег) после каждого тега)
+        
+        Готовые батчи (тег, сложность) сохраняются в чекпоинт профессии сразу после ответа ИИ,
+        при повторе догенерируются только недостающие батчи.
+        
+        Инкрементальный режим (переданы existing_questions и tags_changes из calculate_tags_changes):
+        вопросы неизмененных тегов сохраняются, удаленные теги выбрасываются, для новых тегов
+        генерируется полный набор, для измененных - добор или обрезка по уровням сложности.
+        
+        difficulties ограничивает генерацию уровнями сложности (ленивая генерация уровня под тест),
+        вопросы остальных уровней сохраняются как есть. checkpoint_id - отдельный чекпоинт для такой задачи.
+        
+        stop_check() вызывается между тегами: непустая причина останавливает генерацию
+        ({"success": False, "stopped": True, "error": причина}), готовые батчи остаются в чекпоинте.
+        """
+        # Расход токенов генерации (stats["usage"]) считают метрики вызовов ИИ
+        with llm_usage_scope() as usage:
+            return await self._generate_questions_for_profession(usage, profession, progress_callback, existing_questions,
+                                                                 tags_changes, difficulties, checkpoint_id, stop_check)
+    
+    async def _generate_questions_for_profession(self, usage: Dict[str, int], profession: Dict[str, Any],
+                                                 progress_callback: Optional[Callable[[int, int, str], None]],
+                                                 existing_questions: Optional[List[Dict[str, Any]]],
+                                                 tags_changes: Optional[Dict[str, Any]],
+                                                 difficulties: Optional[List[str]],
+                                                 checkpoint_id: Optional[str],
+                                                 stop_check: Optional[Callable[[], Optional[str]]] = None) -> Dict[str, Any]:
+        """Генерация вопросов профессии; usage - расход токенов, заполняется по мере вызовов ИИ"""
         try:
             tags = profession.get("tags", {})
             if not tags:
@@ -57,35 +109,145 @@ class QuestionsGenerator:
                 "department": profession.get("department", "")
             }
             
+            # Чекпоинт: уже готовые батчи от прошлых попыток
+            profession_id = checkpoint_id or profession.get("id")
+            checkpoint = self.checkpoints.load(profession_id, tags) if profession_id else {}
+            
             all_questions = []
             generation_stats = {
                 "total_tags": len(tags),
                 "successful_tags": 0,
                 "failed_tags": 0,
                 "total_questions": 0,
-                "questions_by_difficulty": {"easy": 0, "medium": 0, "hard": 0}
+                "questions_by_difficulty": {"easy": 0, "medium": 0, "hard": 0},
+                "resumed_batches": sum(1 for key in checkpoint if not key.endswith("::library")),
+                "missing_batches": [],
+                # Разбор ответов ИИ: сколько ответов было битым/обрезанным и что удалось спасти
+                "salvage": {"responses": 0, "malformed_responses": 0, "truncated_responses": 0,
+                            "salvaged_questions": 0, "dropped_objects": 0, "followup_calls": 0},
+                "mode": "incremental" if tags_changes is not None else "full",
+                "usage": usage
             }
             
-            # Генерируем вопросы для каждого тега
+            # Инкрементальный режим: существующие вопросы по тегам
+            existing_by_tag: Dict[str, List[Dict[str, Any]]] = {}
+            if tags_changes is not None:
+                for question in existing_questions or []:
+                    existing_by_tag.setdefault(question.get("tag"), []).append(question)
+                
+                generation_stats["kept_questions"] = 0
+                generation_stats["trimmed_questions"] = 0
+                generation_stats["removed_questions"] = sum(len(existing_by_tag.get(tag, [])) for tag in tags_changes.get("removed", []))
+            
+            # План по тегам: сохраняемые вопросы и сколько сгенерировать по уровням
+            tag_plans = {}
             for tag, weight in tags.items():
-                logger.info(f"🎯 Генерация вопросов для тега: {tag} ({weight}%)")
+                if tags_changes is not None and tag not in tags_changes.get("added", []):
+                    kept_questions, questions_distribution = self._plan_incremental_tag(
+                        tag, weight, existing_by_tag.get(tag, []),
+                        modified=tag in tags_changes.get("modified", {}),
+                        difficulties=difficulties
+                    )
+                    generation_stats["kept_questions"] += len(kept_questions)
+                    generation_stats["trimmed_questions"] += len(existing_by_tag.get(tag, [])) - len(kept_questions)
+                else:
+                    kept_questions, questions_distribution = [], {
+                        difficulty: count for difficulty, count in self._calculate_questions_distribution(weight).items()
+                        if difficulties is None or difficulty in difficulties
+                    }
                 
-                tag_questions = await self._generate_questions_for_tag(
-                    tag, weight, profession_context
-                )
+                tag_plans[tag] = (kept_questions, questions_distribution)
+            
+            save_checkpoint = (lambda: self.checkpoints.save(profession_id, tags, checkpoint)) if profession_id else None
+            
+            # Индекс почти-дубликатов профессии: сохраняемый банк и готовые батчи, новые батчи проверяются по мере прихода
+            dedup_index = NearDuplicateIndex(self.duplicate_threshold)
+            for kept_questions, _ in tag_plans.values():
+                for question in kept_questions:
+                    dedup_index.add(question["id"], question)
+            for batch_questions in checkpoint.values():
+                for question in batch_questions:
+                    dedup_index.add(question["id"], question)
+            
+            # Общая библиотека: часть вопросов берется готовыми, ИИ генерирует только остаток
+            library_questions = self._draw_library_questions(tags, tag_plans, profession_context, checkpoint, dedup_index)
+            generation_stats["library_questions"] = sum(len(questions) for questions in library_questions.values())
+            if library_questions and save_checkpoint:
+                save_checkpoint()
+            
+            # Упакованный режим: группы тегов, которые запрашиваются одним вызовом
+            packed_groups = []
+            if self.generation_mode == "packed" and self.openai_client:
+                packed_groups = self._pack_tag_groups(tags, tag_plans, checkpoint)
+                generation_stats["packed_calls"] = len(packed_groups)
+            tag_group = {tag: index for index, group in enumerate(packed_groups) for tag, _, _ in group}
+            fetched_groups = set()
+            
+            # Генерируем вопросы для каждого тега
+            for tag_index, (tag, weight) in enumerate(tags.items(), start=1):
+                kept_questions, questions_distribution = tag_plans[tag]
+                
+                if tag in tag_group and tag_group[tag] not in fetched_groups:
+                    # Один запрос на все уровни тега (или группу тегов) - результат ложится в чекпоинт
+                    fetched_groups.add(tag_group[tag])
+                    await self._generate_packed_group(packed_groups[tag_group[tag]], profession_context, checkpoint, save_checkpoint,
+                                                      dedup_index, parse_stats=generation_stats["salvage"])
+                
+                if questions_distribution == {}:
+                    # Тег не изменился или набор уже полон - ИИ не нужен
+                    tag_questions = {"success": True, "questions": []}
+                else:
+                    logger.info(f"🎯 Генерация вопросов для тега: {tag} ({weight}%)")
+                    
+                    # Недостающие после упакованного запроса батчи догенерируются по уровням
+                    tag_questions = await self._generate_questions_for_tag(
+                        tag, weight, profession_context,
+                        checkpoint=checkpoint,
+                        save_checkpoint=save_checkpoint,
+                        questions_distribution=questions_distribution,
+                        parse_stats=generation_stats["salvage"],
+                        dedup_index=dedup_index
+                    )
+                
+                generation_stats["missing_batches"].extend(tag_questions.get("missing_batches", []))
+                
+                tag_result_questions = kept_questions + library_questions.get(tag, []) + tag_questions.get("questions", [])
+                
+                # Новые вопросы ИИ пополняют общую библиотеку
+                if self.library is not None and self.openai_client and tag_questions.get("success"):
+                    self.library.add(tag, tag_questions.get("questions", []), profession_context)
+                all_questions.extend(tag_result_questions)
+                generation_stats["total_questions"] += len(tag_result_questions)
+                
+                # Подсчет по сложности
+                for question in tag_result_questions:
+                    difficulty = question.get("difficulty", "medium")
+                    generation_stats["questions_by_difficulty"][difficulty] += 1
                 
                 if tag_questions.get("success"):
-                    all_questions.extend(tag_questions["questions"])
                     generation_stats["successful_tags"] += 1
-                    generation_stats["total_questions"] += len(tag_questions["questions"])
-                    
-                    # Подсчет по сложности
-                    for question in tag_questions["questions"]:
-                        difficulty = question.get("difficulty", "medium")
-                        generation_stats["questions_by_difficulty"][difficulty] += 1
                 else:
                     generation_stats["failed_tags"] += 1
                     logger.error(f"❌ Не удалось сгенерировать вопросы для тега: {tag}")
+                
+                if progress_callback:
+                    progress_callback(tag_index, len(tags), tag)
+                
+                stop_reason = stop_check() if stop_check and tag_index < len(tags) else None
+                if stop_reason:
+                    logger.warning(f"⚠️ Генерация остановлена после тега {tag} ({tag_index}/{len(tags)}): {stop_reason}")
+                    if self.library is not None:
+                        self.library.save()
+                    return {"success": False, "stopped": True, "error": stop_reason, "stats": generation_stats}
+            
+            # Доля спасенных объектов среди битых ответов
+            salvage = generation_stats["salvage"]
+            salvage_total = salvage["salvaged_questions"] + salvage["dropped_objects"]
+            salvage["salvage_rate"] = round(salvage["salvaged_questions"] / salvage_total, 3) if salvage_total else None
+            generation_stats["near_duplicates"] = dict(dedup_index.stats)
+            
+            if self.library is not None:
+                self.library.save()
             
             return {
                 "success": True,
@@ -98,43 +260,167 @@ class QuestionsGenerator:
             logger.error(f"❌ Questions Generator: Ошибка генерации вопросов: {e}")
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "stats": {"usage": usage}
+            }
+    
+    def _draw_library_questions(self, tags: Dict[str, int], tag_plans: Dict[str, tuple], profession_context: Dict[str, Any],
+                                checkpoint: Dict[str, List[Dict[str, Any]]], dedup_index: NearDuplicateIndex) -> Dict[str, List[Dict[str, Any]]]:
+        """Вопросы из библиотеки по плану тегов; план уменьшается до остатка, который генерирует ИИ
+        
+        Взятое из библиотеки фиксируется в чекпоинте (ключ batch_key::library), чтобы повтор
+        задачи не перевыбирал вопросы
+        """
+        library_questions: Dict[str, List[Dict[str, Any]]] = {}
+        if self.library is None:
+            return library_questions
+        
+        for tag, weight in tags.items():
+            kept_questions, questions_distribution = tag_plans[tag]
+            remaining_distribution = {}
+            
+            for difficulty, count in questions_distribution.items():
+                batch_key = GenerationCheckpoints.batch_key(tag, difficulty)
+                library_key = f"{batch_key}::library"
+                
+                if library_key in checkpoint:
+                    drawn = checkpoint[library_key]
+                elif batch_key in checkpoint:
+                    drawn = []  # Батч целиком сгенерирован ИИ в прошлой попытке
+                else:
+                    drawn = self.library.draw(tag, difficulty, count, profession_context, dedup_index)
+                    self._attach_question_metadata(drawn, tag, weight, profession_context)
+                    checkpoint[library_key] = drawn
+                    if self.llm_router and drawn and len(drawn) >= count:
+                        # Батч целиком из библиотеки - запрос к ИИ не нужен
+                        self.llm_router.record_cache_hit("question_generation", "question_library", agent="questions_generator")
+                
+                library_questions.setdefault(tag, []).extend(drawn)
+                if count > len(drawn):
+                    remaining_distribution[difficulty] = count - len(drawn)
+            
+            tag_plans[tag] = (kept_questions, remaining_distribution)
+        
+        return library_questions
+    
+    def _plan_incremental_tag(self, tag: str, weight: int, existing: List[Dict[str, Any]], modified: bool,
+                              difficulties: Optional[List[str]] = None) -> tuple:
+        """План для существующего тега: (сохраняемые вопросы, добор по уровням сложности)"""
+        target_distribution = self._calculate_questions_distribution(weight)
+        
+        if not modified:
+            # Тег не изменился: вопросы сохраняются, генерируются только уровни, которых в банке нет
+            # совсем (ленивый режим создает уровни по требованию)
+            existing_levels = {q.get("difficulty", "medium") for q in existing}
+            return existing, {
+                difficulty: count for difficulty, count in target_distribution.items()
+                if difficulty not in existing_levels and (difficulties is None or difficulty in difficulties)
             }
+        
+        # Вес сменился - сверяем количество по уровням с новой корзиной распределения
+        
+        kept_questions = []
+        shortfall = {}
+        for difficulty, count in target_distribution.items():
+            if difficulties is not None and difficulty not in difficulties:
+                # Уровень не запрошен - вопросы остаются без изменений
+                kept_questions.extend(q for q in existing if q.get("difficulty", "medium") == difficulty)
+                continue
+            
+            same_level = [q for q in existing if q.get("difficulty", "medium") == difficulty][:count]
+            for question in same_level:
+                question["tag_weight"] = weight
+            kept_questions.extend(same_level)
+            
+            if len(same_level) < count:
+                shortfall[difficulty] = count - len(same_level)
+        
+        if len(kept_questions) < len(existing):
+            logger.info(f"✂️ Тег {tag}: обрезано {len(existing) - len(kept_questions)} вопросов (вес {weight}%)")
+        if shortfall:
+            logger.info(f"➕ Тег {tag}: добор вопросов {shortfall} (вес {weight}%)")
+        
+        return kept_questions, shortfall
     
-    async def _generate_questions_for_tag(self, tag: str, weight: int, profession_context: Dict[str, Any]) -> Dict[str, Any]:
-        """Генерация 30-50 вопросов для одного тега в 3 уровнях сложности"""
+    async def _generate_questions_for_tag(self, tag: str, weight: int, profession_context: Dict[str, Any],
+                                          checkpoint: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                                          save_checkpoint: Optional[Callable[[], None]] = None,
+                                          questions_distribution: Optional[Dict[str, int]] = None,
+                                          parse_stats: Optional[Dict[str, int]] = None,
+                                          dedup_index: Optional[NearDuplicateIndex] = None) -> Dict[str, Any]:
+        """Генерация 30-50 вопросов для одного тега в 3 уровнях сложности (с учетом чекпоинта)
+        
+        questions_distribution задает количество по уровням явно (добор в инкрементальном режиме)
+        """
         try:
             if not self.openai_client:
-                return await self._manual_generate_questions_for_tag(tag, weight, profession_context)
+                return await self._manual_generate_questions_for_tag(tag, weight, profession_context,
+                                                                     questions_distribution)
+            
+            if checkpoint is None:
+                checkpoint = {}
             
             # Определяем количество вопросов по уровням на основе веса тега
-            questions_distribution = self._calculate_questions_distribution(weight)
+            if questions_distribution is None:
+                questions_distribution = self._calculate_questions_distribution(weight)
             
             all_questions = []
+            missing_batches = []
             
             # Генерируем вопросы для каждого уровня сложности
             for difficulty, count in questions_distribution.items():
+                batch_key = GenerationCheckpoints.batch_key(tag, difficulty)
+                
+                if batch_key in checkpoint:
+                    ready = checkpoint[batch_key][:count]
+                    if len(ready) >= count:
+                        # Батч уже готов (прошлая попытка или упакованный запрос)
+                        all_questions.extend(ready)
+                        continue
+                    
+                    # Неполный батч (упакованный ответ обрезан или прорежен дубликатами) - добор остатка
+                    logger.info(f"➕ Батч {batch_key}: {len(ready)} из {count}, добор {count - len(ready)}")
+                    extra = await self._generate_difficulty_level_questions(
+                        tag, difficulty, count - len(ready), profession_context, parse_stats, dedup_index
+                    )
+                    
+                    if not extra:
+                        missing_batches.append(batch_key)
+                        all_questions.extend(ready)
+                        continue
+                    
+                    self._attach_question_metadata(extra, tag, weight, profession_context)
+                    checkpoint[batch_key] = ready + extra
+                    if save_checkpoint:
+                        save_checkpoint()
+                    
+                    all_questions.extend(checkpoint[batch_key])
+                    continue
+                
                 difficulty_questions = await self._generate_difficulty_level_questions(
-                    tag, difficulty, count, profession_context
+                    tag, difficulty, count, profession_context, parse_stats, dedup_index
                 )
                 
-                if difficulty_questions:
-                    all_questions.extend(difficulty_questions)
-            
-            # Добавляем метаданные к вопросам
-            for question in all_questions:
-                question["tag"] = tag
-                question["tag_weight"] = weight
-                question["profession_context"] = profession_context["real_name"]
-                question["id"] = str(uuid.uuid4())
-                question["generated_at"] = datetime.now().isoformat() + "Z"
+                if not difficulty_questions:
+                    missing_batches.append(batch_key)
+                    continue
+                
+                # Добавляем метаданные к вопросам до записи чекпоинта
+                self._attach_question_metadata(difficulty_questions, tag, weight, profession_context)
+                
+                checkpoint[batch_key] = difficulty_questions
+                if save_checkpoint:
+                    save_checkpoint()
+                
+                all_questions.extend(difficulty_questions)
             
             return {
                 "success": True,
                 "tag": tag,
                 "questions": all_questions,
                 "total_questions": len(all_questions),
-                "distribution": questions_distribution
+                "distribution": questions_distribution,
+                "missing_batches": missing_batches
             }
             
         except Exception as e:
@@ -145,6 +431,224 @@ class QuestionsGenerator:
                 "error": str(e)
             }
     
+    def _attach_question_metadata(self, questions: List[Dict[str, Any]], tag: str, weight: int, profession_context: Dict[str, Any]):
+        """Метаданные вопроса: тег, вес, профессия, id"""
+        for question in questions:
+            question["tag"] = tag
+            question["tag_weight"] = weight
+            question["profession_context"] = profession_context["real_name"]
+            question["id"] = str(uuid.uuid4())
+            question["generated_at"] = datetime.now().isoformat() + "Z"
+    
+    # === УПАКОВАННАЯ ГЕНЕРАЦИЯ (ВСЕ УРОВНИ / НЕСКОЛЬКО ТЕГОВ ЗА ЗАПРОС) ===
+    
+    def _pack_tag_groups(self, tags: Dict[str, int], tag_plans: Dict[str, tuple], checkpoint: Dict[str, List[Dict[str, Any]]]) -> List[List[tuple]]:
+        """Группировка тегов в запросы: крупный тег - отдельно, небольшие - вместе до pack_max_questions вопросов"""
+        groups = []
+        current_group = []
+        current_size = 0
+        
+        for tag, weight in tags.items():
+            _, questions_distribution = tag_plans[tag]
+            
+            # Только уровни, которых еще нет в чекпоинте
+            pending = {
+                difficulty: count for difficulty, count in questions_distribution.items()
+                if GenerationCheckpoints.batch_key(tag, difficulty) not in checkpoint
+            }
+            if not pending:
+                continue
+            
+            size = sum(pending.values())
+            if current_group and current_size + size > self.pack_max_questions:
+                groups.append(current_group)
+                current_group, current_size = [], 0
+            
+            current_group.append((tag, weight, pending))
+            current_size += size
+        
+        if current_group:
+            groups.append(current_group)
+        
+        return groups
+    
+    async def _generate_packed_group(self, group: List[tuple], profession_context: Dict[str, Any],
+                                     checkpoint: Dict[str, List[Dict[str, Any]]],
+                                     save_checkpoint: Optional[Callable[[], None]] = None,
+                                     dedup_index: Optional[NearDuplicateIndex] = None,
+                                     parse_stats: Optional[Dict[str, int]] = None):
+        """Один запрос на группу тегов: ответ раскладывается по батчам (тег, сложность) в чекпоинт
+        
+        Неполные батчи тоже сохраняются - поуровневая генерация добирает в них только остаток
+        """
+        tags_label = ", ".join(tag for tag, _, _ in group)
+        total_count = sum(sum(distribution.values()) for _, _, distribution in group)
+        
+        try:
+            prompt = self._create_packed_questions_prompt(group, profession_context)
+            
+            response = await self.llm_router.complete(
+                "question_generation",
+                agent="questions_generator",
+                messages=[
+                    {"role": "system", "content": self._get_packed_system_prompt()},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.4,
+                max_tokens=min(4000, 250 * total_count + 500)  # ~250 токенов на вопрос
+            )
+            
+            response_text = response.choices[0].message.content.strip()
+            batches = self._parse_packed_response(response_text, group, parse_stats)
+            
+            for tag, weight, distribution in group:
+                for difficulty in distribution:
+                    questions = batches.get(GenerationCheckpoints.batch_key(tag, difficulty), [])
+                    if dedup_index is not None:
+                        questions, _ = dedup_index.filter_new(questions)
+                    if not questions:
+                        continue
+                    
+                    self._attach_question_metadata(questions, tag, weight, profession_context)
+                    checkpoint[GenerationCheckpoints.batch_key(tag, difficulty)] = questions
+            
+            if save_checkpoint:
+                save_checkpoint()
+            
+            logger.info(f"✅ Упакованный запрос: {sum(len(q) for q in batches.values())} из {total_count} вопросов для тегов: {tags_label}")
+            
+        except Exception as e:
+            # Недостающие батчи будут догенерированы по уровням
+            logger.error(f"❌ Ошибка упакованной генерации для {tags_label}: {e}")
+    
+    def _create_packed_questions_prompt(self, group: List[tuple], profession_context: Dict[str, Any]) -> str:
+        """Промпт на все уровни сложности для одного или нескольких тегов"""
+        profession = profession_context.get('real_name', '')
+        specialization = profession_context.get('specialization', '')
+        
+        # Один пример на весь запрос (по первому тегу)
+        first_tag = group[0][0]
+        example = self._get_example_for_context(first_tag, profession, specialization, "medium")
+        
+        plan_lines = "\n".join(
+            f'    - "{tag}": ' + ", ".join(f"{difficulty} - {count}" for difficulty, count in distribution.items())
+            for tag, _, distribution in group
+        )
+        format_tags = ",\n".join(
+            f'        "{tag}": {{' + ", ".join(f'"{difficulty}": [...]' for difficulty in distribution) + "}"
+            for tag, _, distribution in group
+        )
+        
+        return f"""
+    Создай уникальные вопросы для профессии "{profession}" (специализация: {specialization}) по тегам и уровням сложности:
+{plan_lines}
+
+    ПРИМЕР СТРУКТУРЫ:
+    {example['question']}
+    A) {example['options'][0]} ✓
+    B) {example['options'][1]}
+    C) {example['options'][2]}
+    D) {example['options'][3]}
+
+    ПРАВИЛА:
+    1. Все вопросы должны быть РАЗНЫЕ (не повторяться)
+    2. Дистракторы ТОЛЬКО из области своего тега или смежных технологий
+    3. НЕ используй универсальные ответы из других областей
+    4. Дистракторы НЕ должны повторяться между вопросами
+    5. Все варианты ответов должны выглядеть правдоподобно (нельзя угадать методом исключения)
+    6. Строго соблюдай количество вопросов для каждого тега и уровня
+
+    ФОРМАТ JSON (объект: тег -> уровень -> массив вопросов):
+    {{
+{format_tags}
+    }}
+
+    Каждый вопрос:
+    {{
+        "question": "Вопрос?",
+        "options": ["Правильный ответ", "Дистрактор 1", "Дистрактор 2", "Дистрактор 3"],
+        "correct_answer": "Правильный ответ",
+        "explanation": "Краткое объяснение",
+        "category": "Категория вопроса"
+    }}
+    """
+    
+    def _get_packed_system_prompt(self) -> str:
+        """Системный промпт упакованного запроса: фокус для каждого уровня сложности"""
+        base_prompt = "Ты эксперт по техническим интервью в банке. Создаешь качественные вопросы для проверки навыков кандидатов."
+        
+        return (base_prompt + " Соблюдай фокус уровня: easy - базовые концепции и определения;"
+                " medium - практическое применение технологий в реальной работе;"
+                " hard - сложные вопросы для экспертов, включая оптимизацию и архитектуру.")
+    
+    def _parse_packed_response(self, response: str, group: List[tuple], parse_stats: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Разбор упакованного ответа обратно в батчи {batch_key: [вопросы]}
+        
+        Целые вопросы спасаются из битого или обрезанного по max_tokens ответа (как в поуровневом режиме)
+        """
+        batches = {}
+        
+        try:
+            packed_data, report = salvage_json_object(response)
+            self.llm_router.record_parse("question_generation", bool(packed_data) and report["clean"], agent="questions_generator")
+            
+            if parse_stats is not None:
+                parse_stats["responses"] += 1
+                if not report["clean"]:
+                    parse_stats["malformed_responses"] += 1
+                    parse_stats["salvaged_questions"] += report["recovered"]
+                    parse_stats["dropped_objects"] += report["dropped"]
+                if report["truncated"]:
+                    parse_stats["truncated_responses"] += 1
+            
+            if not packed_data:
+                logger.error("❌ Не найден JSON объект в упакованном ответе ИИ")
+                return {}
+            
+            # Для одного тега ИИ может вернуть уровни без обертки тегом
+            if len(group) == 1 and group[0][0] not in packed_data:
+                packed_data = {group[0][0]: packed_data}
+            
+            for tag, _, distribution in group:
+                tag_data = packed_data.get(tag, {})
+                if not isinstance(tag_data, dict):
+                    continue
+                
+                for difficulty, count in distribution.items():
+                    validated_questions = []
+                    for question in tag_data.get(difficulty, []) or []:
+                        if isinstance(question, dict) and self._validate_question(question):
+                            question["difficulty"] = difficulty
+                            validated_questions.append(question)
+                    
+                    if validated_questions:
+                        batches[GenerationCheckpoints.batch_key(tag, difficulty)] = validated_questions[:count]
+            
+            return batches
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка разбора упакованного ответа: {e}")
+            return {}
+    
+    def missing_questions_for_level(self, profession: Dict[str, Any], difficulty: str) -> Dict[str, int]:
+        """Теги, у которых уровень difficulty еще не сгенерирован: {тег: сколько вопросов нужно}
+        
+        Частичная нехватка (отброшенные дубликаты, потери разбора) не считается - иначе каждый
+        новый тест снова запускал бы генерацию
+        """
+        counts: Dict[str, int] = {}
+        for question in profession.get("questions", []):
+            if question.get("difficulty", "medium") == difficulty:
+                counts[question.get("tag")] = counts.get(question.get("tag"), 0) + 1
+        
+        missing = {}
+        for tag, weight in profession.get("tags", {}).items():
+            target = self._calculate_questions_distribution(weight).get(difficulty, 0)
+            if target and not counts.get(tag):
+                missing[tag] = target
+        
+        return missing
+    
     def _calculate_questions_distribution(self, weight: int) -> Dict[str, int]:
         """Расчет распределения вопросов по сложности на основе веса тега"""
         # Базовое распределение: 30-50 вопросов
@@ -161,30 +665,58 @@ class QuestionsGenerator:
             # Низкий вес - минимум вопросов
             return {"easy": 3, "medium": 4, "hard": 2}   # 25 вопросов
     
-    async def _generate_difficulty_level_questions(self, tag: str, difficulty: str, count: int, profession_context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Генерация вопросов определенного уровня сложности"""
+    async def _generate_difficulty_level_questions(self, tag: str, difficulty: str, count: int, profession_context: Dict[str, Any],
+                                                   parse_stats: Optional[Dict[str, int]] = None,
+                                                   dedup_index: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+        """Генерация вопросов определенного уровня сложности
+        
+        Почти-дубликаты банка профессии отбрасываются сразу. Если из битого/обрезанного ответа
+        спасена только часть вопросов или часть оказалась дубликатами, недостающие запрашиваются
+        одним дополнительным вызовом (без повтора уже полученных)
+        """
+        questions = []
+        
         try:
             prompt = self._create_questions_prompt(tag, difficulty, count, profession_context)
+            received = (await self._request_questions(prompt, difficulty, parse_stats))[:count]
+            questions, duplicates = dedup_index.filter_new(received) if dedup_index is not None else (received, [])
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt(difficulty)},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4,  # Немного творчества для разнообразия вопросов
-                max_tokens=4000
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            questions = self._parse_questions_response(response_text, difficulty)
+            shortfall = count - len(questions)
+            if received and shortfall > 0:
+                logger.info(f"🔁 Добор {shortfall} вопросов уровня {difficulty} для тега {tag}")
+                if parse_stats is not None:
+                    parse_stats["followup_calls"] += 1
+                
+                followup_prompt = self._create_questions_prompt(tag, difficulty, shortfall, profession_context)
+                followup_prompt += "\n    НЕ повторяй уже созданные вопросы:\n" + "\n".join(f"    - {q['question']}" for q in questions + duplicates)
+                
+                received = (await self._request_questions(followup_prompt, difficulty, parse_stats))[:shortfall]
+                if dedup_index is not None:
+                    received, _ = dedup_index.filter_new(received)
+                questions.extend(received)
             
             logger.info(f"✅ Сгенерировано {len(questions)} вопросов уровня {difficulty} для тега {tag}")
-            return questions
+            return questions[:count]
             
         except Exception as e:
             logger.error(f"❌ Ошибка генерации вопросов {difficulty} для {tag}: {e}")
-            return []
+            return questions[:count]
+    
+    async def _request_questions(self, prompt: str, difficulty: str, parse_stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Один запрос к ИИ за вопросами уровня difficulty"""
+        response = await self.llm_router.complete(
+            "question_generation",
+            agent="questions_generator",
+            messages=[
+                {"role": "system", "content": self._get_system_prompt(difficulty)},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.4,  # Немного творчества для разнообразия вопросов
+            max_tokens=4000
+        )
+        
+        response_text = response.choices[0].message.content.strip()
+        return self._parse_questions_response(response_text, difficulty, parse_stats)
     
     def _create_questions_prompt(self, tag: str, difficulty: str, count: int, profession_context: Dict[str, Any]) -> str:
         """Создание простого и эффективного промпта для генерации вопросов"""
@@ -370,29 +902,34 @@ class QuestionsGenerator:
         else:  # hard
             return base_prompt + " Генерируй сложные вопросы для экспертов, включая оптимизацию и архитектуру."
     
-    def _parse_questions_response(self, response: str, difficulty: str) -> List[Dict[str, Any]]:
-        """Парсинг ответа ИИ с вопросами"""
+    def _parse_questions_response(self, response: str, difficulty: str, parse_stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Парсинг ответа ИИ с вопросами (целые объекты спасаются из битого или обрезанного JSON)"""
         try:
-            # Ищем JSON массив в ответе
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                questions_data = json.loads(json_match.group())
-                
-                # Валидируем и дополняем каждый вопрос
-                validated_questions = []
-                for question in questions_data:
-                    if self._validate_question(question):
-                        question["difficulty"] = difficulty
-                        validated_questions.append(question)
-                
-                return validated_questions
-            else:
+            questions_data, report = salvage_json_array(response)
+            self.llm_router.record_parse("question_generation", bool(questions_data) and report["clean"], agent="questions_generator")
+            
+            if parse_stats is not None:
+                parse_stats["responses"] += 1
+                if not report["clean"]:
+                    parse_stats["malformed_responses"] += 1
+                    parse_stats["salvaged_questions"] += report["recovered"]
+                    parse_stats["dropped_objects"] += report["dropped"]
+                if report["truncated"]:
+                    parse_stats["truncated_responses"] += 1
+            
+            if not questions_data:
                 logger.error("❌ Не найден JSON массив в ответе ИИ")
                 return []
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON: {e}")
-            return []
+            
+            # Валидируем и дополняем каждый вопрос
+            validated_questions = []
+            for question in questions_data:
+                if isinstance(question, dict) and self._validate_question(question):
+                    question["difficulty"] = difficulty
+                    validated_questions.append(question)
+            
+            return validated_questions
+            
         except Exception as e:
             logger.error(f"❌ Ошибка парсинга вопросов: {e}")
             return []
@@ -426,11 +963,20 @@ class QuestionsGenerator:
     
     # === РУЧНАЯ ГЕНЕРАЦИЯ (FALLBACK) ===
     
-    async def _manual_generate_questions_for_tag(self, tag: str, weight: int, profession_context: Dict[str, Any]) -> Dict[str, Any]:
-        """Ручная генерация вопросов когда ИИ недоступен"""
+    async def _manual_generate_questions_for_tag(self, tag: str, weight: int, profession_context: Dict[str, Any],
+                                                 questions_distribution: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Ручная генерация вопросов когда ИИ недоступен
+        
+        При заданном questions_distribution отдаются только шаблоны запрошенных уровней
+        """
         try:
             # Базовые шаблоны вопросов
             manual_questions = self._create_manual_questions_templates(tag, weight)
+            if questions_distribution is not None:
+                manual_questions = [
+                    question for question in manual_questions
+                    if questions_distribution.get(question["difficulty"], 0) > 0
+                ]
             
             return {
                 "success": True,
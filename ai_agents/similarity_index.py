@@ -0,0 +1,157 @@
+"""
+Similarity Index - инвертированный индекс слов названий профессий
+Поиск дубликатов и похожих профессий сравнивает запрос только с профессиями,
+у которых есть общие слова, а не со всем реестром
+"""
+
+import math
+import heapq
+import logging
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Поля профессии, по которым строится индекс
+INDEXED_FIELDS = ("bank_title", "real_name", "specialization")
+
+
+def tokenize(text: str) -> frozenset:
+    """Нормализованные слова текста"""
+    return frozenset((text or "").lower().replace("ё", "е").split())
+
+
+class SimilarityIndex:
+    """Индекс {поле: {слово: [id профессий]}} с заранее посчитанными множествами слов"""
+    
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._tokens: Dict[str, Dict[str, frozenset]] = {field: {} for field in self.fields}
+        self._postings: Dict[str, Dict[str, List[str]]] = {field: defaultdict(list) for field in self.fields}
+        self._exact: Dict[str, Dict[str, List[str]]] = {field: defaultdict(list) for field in self.fields}
+    
+    @classmethod
+    def build(cls, records: Iterable[Dict[str, Any]], fields: Iterable[str] = INDEXED_FIELDS) -> "SimilarityIndex":
+        index = cls(fields)
+        for record in records:
+            index.add(record)
+        return index
+    
+    def add(self, record: Dict[str, Any]):
+        """Добавление профессии в индекс"""
+        record_id = record.get("id")
+        if record_id is None or record_id in self._records:
+            return
+        
+        self._records[record_id] = record
+        for field in self.fields:
+            value = record.get(field) or ""
+            tokens = tokenize(value)
+            
+            self._tokens[field][record_id] = tokens
+            for token in tokens:
+                self._postings[field][token].append(record_id)
+            
+            if value:
+                self._exact[field][value.lower()].append(record_id)
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    def exact(self, field: str, value: str, statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Профессии с точно таким же значением поля (без учета регистра)"""
+        if not value:
+            return []
+        
+        statuses = set(statuses) if statuses is not None else None
+        matches = []
+        for record_id in self._exact[field].get(value.lower(), []):
+            record = self._records[record_id]
+            if statuses is None or record.get("status") in statuses:
+                matches.append(record)
+        return matches
+    
+    def search(self, query: Dict[str, str], weights: Optional[Dict[str, float]] = None, min_score: float = 0.0,
+               statuses: Optional[Iterable[str]] = None, exclude_id: Optional[str] = None,
+               top_k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Похожие профессии: взвешенная сумма коэффициентов Жаккара по словам полей
+        
+        query - {поле: текст}, weights - {поле: вес} (по умолчанию 1.0). Кандидаты берутся
+        из списков слов запроса, поэтому профессии без общих слов не просматриваются.
+        Возвращает [(оценка, профессия)] по убыванию оценки (не больше top_k).
+        """
+        weights = weights or {field: 1.0 for field in query}
+        statuses = set(statuses) if statuses is not None else None
+        
+        query_tokens = {field: tokenize(text) for field, text in query.items() if weights.get(field)}
+        query_tokens = {field: tokens for field, tokens in query_tokens.items() if tokens}
+        if not query_tokens:
+            return []
+        
+        candidates = self._candidates(query_tokens, weights, min_score)
+        candidates.discard(exclude_id)
+        
+        scored = []
+        for record_id in candidates:
+            record = self._records[record_id]
+            if statuses is not None and record.get("status") not in statuses:
+                continue
+            
+            score = 0.0
+            for field, tokens in query_tokens.items():
+                record_tokens = self._tokens[field][record_id]
+                intersection = len(tokens & record_tokens)
+                if intersection:
+                    score += weights[field] * intersection / (len(tokens) + len(record_tokens) - intersection)
+            
+            score = min(1.0, score)
+            if score >= min_score and score > 0:
+                scored.append((score, record))
+        
+        if top_k is not None:
+            return heapq.nlargest(top_k, scored, key=lambda item: item[0])
+        
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+    
+    def _candidates(self, query_tokens: Dict[str, frozenset], weights: Dict[str, float], min_score: float) -> set:
+        """Профессии, которые могут набрать min_score
+        
+        Если порог недостижим без совпадения по какому-то полю (остальные веса меньше порога),
+        для этого поля нужен Жаккар не ниже (min_score - остальные веса) / вес поля, а значит
+        общее слово среди первых len(q) - ceil(J * len(q)) + 1 самых редких слов запроса
+        (prefix filtering) - частые слова вроде "специалист" не читаются вовсе
+        """
+        total_weight = sum(weights[field] for field in query_tokens)
+        
+        best_field, best_required = None, 0.0
+        for field in query_tokens:
+            required = (min_score - (total_weight - weights[field])) / weights[field]
+            if required > best_required:
+                best_field, best_required = field, required
+        
+        if best_field is None:
+            candidates = set()
+            for field, tokens in query_tokens.items():
+                postings = self._postings[field]
+                candidates.update(*(postings.get(token, ()) for token in tokens))
+            return candidates
+        
+        postings = self._postings[best_field]
+        tokens = sorted(query_tokens[best_field], key=lambda token: len(postings.get(token, ())))
+        required_overlap = math.ceil(best_required * len(tokens) - 1e-9)
+        prefix = tokens[:len(tokens) - required_overlap + 1]
+        
+        # Фильтр по длине: при Жаккаре J у кандидата от J*|q| до |q|/J слов
+        min_size, max_size = best_required * len(tokens) - 1e-9, len(tokens) / best_required + 1e-9
+        field_tokens = self._tokens[best_field]
+        
+        candidates = set().union(*(postings.get(token, ()) for token in prefix))
+        return {record_id for record_id in candidates if min_size <= len(field_tokens[record_id]) <= max_size}
+
+
+# Экспорт
+__all__ = ['SimilarityIndex', 'tokenize']
@@ -11,51 +11,47 @@ from pathlib import Path
 from datetime import datetime
 
 # ИИ
-from openai import AsyncOpenAI
+from .llm_client import get_openai_client
+from .llm_router import get_llm_router
+from .profession_catalog import ProfessionCatalog
+from .prompt_builder import build_prompt, project_fields
 import httpx
 
 logger = logging.getLogger(__name__)
 
+# Бюджет промпта генерации тегов (токены, локальный подсчет); сверх него сокращаются похожие профессии и поля формы
+TAGS_PROMPT_MAX_TOKENS = 1400
+
+# Поля похожей профессии, которые нужны промпту и ответу API
+SIMILAR_RECORD_FIELDS = ("id", "bank_title", "real_name", "specialization", "department", "tags")
+
 
 class TagsGenerator:
     """ИИ генератор тегов для профессий"""
     
-    def __init__(self, openai_api_key: str, data_dir: Path):
+    def __init__(self, openai_api_key: str, data_dir: Path, catalog: Optional[ProfessionCatalog] = None):
         self.openai_api_key = openai_api_key
         self.data_dir = data_dir
         self.openai_client = None
-        self.profession_data = {}
+        self.llm_router = None
+        
+        # Общий каталог профессий (метаданные без вопросов, обновляется после записей в реестр)
+        self.catalog = catalog or ProfessionCatalog(data_dir)
         
         self._initialize_openai()
-        self._load_profession_data()
     
     def _initialize_openai(self):
         """Инициализация OpenAI клиента"""
         try:
             if self.openai_api_key:
-                self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self.openai_client = get_openai_client(self.openai_api_key)
+                self.llm_router = get_llm_router(self.openai_api_key)
                 logger.info("✅ Tags Generator: OpenAI инициализирован")
             else:
                 logger.warning("⚠️ Tags Generator: OpenAI API ключ не найден")
         except Exception as e:
             logger.error(f"❌ Tags Generator: Ошибка инициализации OpenAI: {e}")
     
-    def _load_profession_data(self):
-        """Загрузка данных о профессиях для анализа"""
-        try:
-            records_file = self.data_dir / "profession_records.json"
-            if records_file.exists():
-                with open(records_file, 'r', encoding='utf-8') as f:
-                    self.profession_data = json.load(f)
-            else:
-                self.profession_data = {"profession_records": []}
-            
-            logger.info(f"✅ Tags Generator: Загружено {len(self.profession_data.get('profession_records', []))} записей")
-            
-        except Exception as e:
-            logger.error(f"❌ Tags Generator: Ошибка загрузки данных: {e}")
-            self.profession_data = {"profession_records": []}
-    
     # === ГЕНЕРАЦИЯ ТЕГОВ ===
     
     async def generate_tags(self, profession_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -96,29 +92,23 @@ class TagsGenerator:
     def _analyze_similar_professions(self, profession_data: Dict[str, Any]) -> Dict[str, Any]:
         """Анализ похожих профессий в базе"""
         try:
-            existing_records = self.profession_data.get("profession_records", [])
-            similar_records = []
+            # Похожесть: названия профессий (вес 70%) и специализации (вес 30%), минимум 30%
+            matches = self.catalog.similarity.search(
+                {"real_name": profession_data.get('real_name', ''), "specialization": profession_data.get('specialization', '')},
+                weights={"real_name": 0.7, "specialization": 0.3},
+                min_score=0.3,
+                statuses=["approved_by_head", "questions_generated", "active"]
+            )
             
-            current_real_name = profession_data.get('real_name', '').lower()
-            current_specialization = profession_data.get('specialization', '').lower()
+            scores = {record["id"]: (similarity, record) for similarity, record in matches}
             
-            for record in existing_records:
-                # Рассматриваем только утвержденные записи
-                if record.get("status") not in ["approved_by_head", "questions_generated", "active"]:
-                    continue
-                
-                similarity = self._calculate_profession_similarity(
-                    current_real_name, current_specialization,
-                    record.get('real_name', '').lower(), record.get('specialization', '').lower()
-                )
-                
-                if similarity >= 0.3:  # Минимум 30% схожести
-                    similar_records.append({
-                        **record,
-                        'similarity_score': similarity
-                    })
+            # Близкие по написанию названия ("Data Scientist" / "Data Science Specialist"): как в Head Approval,
+            # косинус n-грамм заменяет оценку по словам, если он выше
+            for similarity, record in self.catalog.fuzzy_search("real_name", profession_data.get('real_name', ''), top_k=10, min_score=0.5):
+                if similarity > scores.get(record["id"], (0.0, None))[0]:
+                    scores[record["id"]] = (similarity, record)
             
-            # Сортируем по убыванию похожести
+            similar_records = [{**project_fields(record, SIMILAR_RECORD_FIELDS), 'similarity_score': similarity} for similarity, record in scores.values()]
             similar_records.sort(key=lambda x: x['similarity_score'], reverse=True)
             
             return {
@@ -131,46 +121,14 @@ class TagsGenerator:
             logger.error(f"❌ Tags Generator: Ошибка анализа похожих профессий: {e}")
             return {"similar_records": [], "found_similar": False, "analysis_confidence": 0.0}
     
-    def _calculate_profession_similarity(self, name1: str, spec1: str, name2: str, spec2: str) -> float:
-        """Расчет похожести профессий"""
-        try:
-            score = 0.0
-            
-            # Похожесть названий профессий (вес 70%)
-            if name1 and name2:
-                name_words1 = set(name1.split())
-                name_words2 = set(name2.split())
-                
-                if name_words1 and name_words2:
-                    intersection = name_words1.intersection(name_words2)
-                    union = name_words1.union(name_words2)
-                    name_similarity = len(intersection) / len(union)
-                    score += name_similarity * 0.7
-            
-            # Похожесть специализаций (вес 30%)
-            if spec1 and spec2:
-                spec_words1 = set(spec1.split())
-                spec_words2 = set(spec2.split())
-                
-                if spec_words1 and spec_words2:
-                    intersection = spec_words1.intersection(spec_words2)
-                    union = spec_words1.union(spec_words2)
-                    spec_similarity = len(intersection) / len(union)
-                    score += spec_similarity * 0.3
-            
-            return min(1.0, score)
-            
-        except Exception as e:
-            logger.error(f"❌ Tags Generator: Ошибка расчета похожести: {e}")
-            return 0.0
-    
     async def _ai_generate_tags(self, profession_data: Dict[str, Any], similar_analysis: Dict[str, Any]) -> Dict[str, Any]:
         """ИИ генерация тегов"""
         try:
             prompt = self._create_smart_tags_prompt(profession_data, similar_analysis)
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4",
+            response = await self.llm_router.complete(
+                "tags_generation",
+                agent="tags_generator",
                 messages=[
                     {"role": "system", "content": "Ты эксперт по профессиям и навыкам в банковской сфере. Генерируешь точные теги с весами для проверки кандидатов."},
                     {"role": "user", "content": prompt}
@@ -182,6 +140,7 @@ class TagsGenerator:
             # Парсим ответ ИИ
             ai_response = response.choices[0].message.content
             tags = self._parse_ai_tags_response(ai_response)
+            self.llm_router.record_parse("tags_generation", bool(tags), agent="tags_generator")
             
             return {
                 "tags": tags,
@@ -194,23 +153,17 @@ class TagsGenerator:
             return {"tags": {}, "source": "ai_error", "confidence": 0.0}
     
     def _create_smart_tags_prompt(self, profession_data: Dict[str, Any], similar_analysis: Dict[str, Any]) -> str:
-        """Создание умного промпта для генерации тегов"""
-        
-        profession_name = profession_data.get('real_name', '')
-        specialization = profession_data.get('specialization', '')
-        department = profession_data.get('department', '')
+        """Создание умного промпта для генерации тегов (не длиннее TAGS_PROMPT_MAX_TOKENS токенов)"""
         
-        # Информация о похожих профессиях
-        similar_info = ""
+        # Информация о похожих профессиях: строка на профессию, самые похожие - первыми
+        similar_lines = []
         if similar_analysis.get("found_similar"):
-            similar_records = similar_analysis.get("similar_records", [])
-            similar_info = f"ПОХОЖИЕ ПРОФЕССИИ В БАНКЕ:\n"
-            for record in similar_records[:2]:
+            for record in similar_analysis.get("similar_records", [])[:2]:
                 if record.get("tags"):
                     top_tags = sorted(record["tags"].items(), key=lambda x: x[1], reverse=True)[:5]
-                    similar_info += f"• {record['bank_title']}: {', '.join([f'{tag}({weight}%)' for tag, weight in top_tags])}\n"
+                    similar_lines.append(f"• {record['bank_title']}: {', '.join([f'{tag}({weight}%)' for tag, weight in top_tags])}")
         
-        return f"""
+        template = """
         Сгенерируй МАКСИМУМ 10 самых важных тегов для профессии "{profession_name}" специализации "{specialization}" в банке Halyk Bank.
         
         ПРОФЕССИЯ: {profession_name}
@@ -271,6 +224,20 @@ class TagsGenerator:
         
         Отвечай СТРОГО в JSON формате!
         """
+        
+        return build_prompt(
+            "tags_generation",
+            template,
+            {
+                "profession_name": profession_data.get('real_name', ''),
+                "specialization": profession_data.get('specialization', ''),
+                "department": profession_data.get('department', ''),
+                "similar_info": similar_lines
+            },
+            TAGS_PROMPT_MAX_TOKENS,
+            trim_order=("similar_info", "specialization", "department", "profession_name"),
+            renderers={"similar_info": lambda lines: "ПОХОЖИЕ ПРОФЕССИИ В БАНКЕ:\n" + "\n".join(lines) if lines else ""}
+        )
     
     def _parse_ai_tags_response(self, response: str) -> Dict[str, int]:
         """Парсинг ответа ИИ для извлечения тегов"""
@@ -0,0 +1,78 @@
+"""
+Text Chunking - локальный подсчет токенов и разбиение длинных текстов на части
+Токены считаются через tiktoken, если он установлен, иначе приблизительно по символам (с запасом)
+"""
+
+import re
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken не установлен или словарь недоступен офлайн
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста
+    
+    Без tiktoken: ~4 символа латиницы на токен и ~2 символа кириллицы (оценка сверху)
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return int((len(text) - non_ascii) / 4 + non_ascii / 2) + 1
+
+
+def _split_oversized(piece: str, max_tokens: int) -> List[str]:
+    """Абзац длиннее лимита: по предложениям, а предложение длиннее лимита - по символам"""
+    sentences = re.split(r'(?<=[.!?;])\s+', piece)
+    if len(sentences) > 1:
+        return sentences
+    
+    # Символов в части - по средней плотности токенов этого текста
+    chars_per_part = max(1, int(len(piece) * max_tokens / count_tokens(piece)))
+    return [piece[i:i + chars_per_part] for i in range(0, len(piece), chars_per_part)]
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Части текста не длиннее max_tokens токенов (границы - абзацы, затем предложения)"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    
+    pending = [paragraph for paragraph in text.split("\n") if paragraph.strip()]
+    pending.reverse()
+    
+    while pending:
+        piece = pending.pop()
+        piece_tokens = count_tokens(piece)
+        
+        if piece_tokens > max_tokens:
+            pending.extend(reversed(_split_oversized(piece, max_tokens)))
+            continue
+        
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        
+        current.append(piece)
+        current_tokens += piece_tokens
+    
+    if current:
+        chunks.append("\n".join(current))
+    
+    return chunks
+
+
+# Экспорт
+__all__ = ['count_tokens', 'split_into_chunks']
@@ -0,0 +1,8 @@
+"""
+Фоновые задачи HR Admin Panel v2.0
+Персистентная очередь с пулом воркеров для долгих ИИ операций
+"""
+
+from .job_queue import JobQueue, JobContext, ACTIVE_JOB_STATES
+
+__all__ = ['JobQueue', 'JobContext', 'ACTIVE_JOB_STATES']
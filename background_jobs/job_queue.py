@@ -0,0 +1,384 @@
+"""
+JobQueue - персистентная очередь фоновых задач с пулом воркеров
+Состояние задач хранится в data/background_jobs.json и переживает перезапуск сервера
+"""
+
+import json
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+# Состояния задачи
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_JOB_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobContext:
+    """Контекст выполнения задачи: отчет о прогрессе для обработчика"""
+    
+    def __init__(self, queue: "JobQueue", job: Dict[str, Any]):
+        self.queue = queue
+        self.job = job
+    
+    @property
+    def job_id(self) -> str:
+        return self.job["id"]
+    
+    def report_progress(self, done: int, total: int, message: str = ""):
+        """Обновление прогресса задачи (например, тегов готово / всего)"""
+        self.queue.update_progress(self.job_id, done, total, message)
+
+
+JobHandler = Callable[[Dict[str, Any], JobContext], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """Персистентная очередь фоновых задач"""
+    
+    def __init__(self, data_dir: Path, workers: int = 2, max_attempts: int = 3, retry_delay: int = 30,
+                 jobs_filename: str = "background_jobs.json", history_limit: int = 500):
+        self.jobs_file = data_dir / jobs_filename
+        self.workers_count = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.history_limit = history_limit
+        
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.handlers: Dict[str, JobHandler] = {}
+        
+        self._running_tasks: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        
+        self._load_jobs()
+    
+    # === ПЕРСИСТЕНТНОСТЬ ===
+    
+    def _load_jobs(self):
+        """Загрузка задач из файла"""
+        try:
+            if self.jobs_file.exists():
+                with open(self.jobs_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.jobs = {job["id"]: job for job in data.get("jobs", [])}
+            
+            logger.info(f"✅ Job Queue: Загружено {len(self.jobs)} задач")
+        
+        except Exception as e:
+            logger.error(f"❌ Job Queue: Ошибка загрузки задач: {e}")
+            self.jobs = {}
+    
+    def _save_jobs(self):
+        """Сохранение задач в файл (через временный файл, чтобы не побить JSON)"""
+        try:
+            self._trim_history()
+            
+            tmp_file = self.jobs_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"jobs": list(self.jobs.values())}, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.jobs_file)
+        
+        except Exception as e:
+            logger.error(f"❌ Job Queue: Ошибка сохранения задач: {e}")
+    
+    def _trim_history(self):
+        """Удаление самых старых завершенных задач сверх лимита истории"""
+        finished = [job for job in self.jobs.values() if job["status"] in FINISHED_JOB_STATES]
+        if len(finished) <= self.history_limit:
+            return
+        
+        finished.sort(key=lambda job: job.get("finished_at") or job["created_at"])
+        for job in finished[:len(finished) - self.history_limit]:
+            self.jobs.pop(job["id"], None)
+    
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+    
+    def register_handler(self, job_type: str, handler: JobHandler):
+        """Регистрация обработчика для типа задач"""
+        self.handlers[job_type] = handler
+    
+    async def start(self):
+        """Запуск пула воркеров с восстановлением прерванных задач"""
+        self._wakeup = asyncio.Event()
+        
+        # Задачи, которые выполнялись в момент остановки, возвращаем в очередь
+        recovered = 0
+        for job in self.jobs.values():
+            if job["status"] == JOB_RUNNING:
+                job["status"] = JOB_QUEUED
+                job["recovered_at"] = datetime.now().isoformat() + "Z"
+                recovered += 1
+        
+        if recovered:
+            self._save_jobs()
+            logger.info(f"🔁 Job Queue: Восстановлено {recovered} прерванных задач")
+        
+        for index in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker_loop(index)))
+        
+        self._wakeup.set()
+        logger.info(f"✅ Job Queue: Запущено {self.workers_count} воркеров")
+    
+    async def stop(self):
+        """Остановка воркеров (выполняемые задачи останутся running и восстановятся при старте)"""
+        for worker in self._workers:
+            worker.cancel()
+        
+        for task in list(self._running_tasks.values()):
+            task.cancel()
+        
+        await asyncio.gather(*self._workers, *self._running_tasks.values(), return_exceptions=True)
+        self._workers = []
+        self._running_tasks = {}
+    
+    # === УПРАВЛЕНИЕ ЗАДАЧАМИ ===
+    
+    def enqueue(self, job_type: str, payload: Dict[str, Any], priority: int = 10,
+                dedup_key: Optional[str] = None, created_by: str = "system",
+                order_key: Optional[str] = None) -> Dict[str, Any]:
+        """Постановка задачи в очередь (повторная постановка активной задачи возвращает существующую)
+        
+        order_key - порядок внутри одного priority (по умолчанию время постановки).
+        Более срочная повторная постановка поднимает ожидающую задачу и заменяет ее payload.
+        """
+        if dedup_key:
+            existing = self.find_active_job(dedup_key)
+            if existing:
+                if existing["status"] == JOB_QUEUED and priority < existing["priority"]:
+                    existing.update({"priority": priority, "payload": payload, "created_by": created_by, "order_key": order_key})
+                    self._save_jobs()
+                    self._notify_workers()
+                    logger.info(f"⏫ Job Queue: Задача {existing['id']} поднята до приоритета {priority}")
+                return existing
+        
+        job = {
+            "id": f"job_{uuid.uuid4().hex[:12]}",
+            "type": job_type,
+            "payload": payload,
+            "priority": priority,
+            "order_key": order_key,
+            "dedup_key": dedup_key,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "progress": {"done": 0, "total": 0, "percent": 0, "message": ""},
+            "created_by": created_by,
+            "created_at": datetime.now().isoformat() + "Z",
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "retry_at": None,
+            "result": None
+        }
+        
+        self.jobs[job["id"]] = job
+        self._save_jobs()
+        self._notify_workers()
+        
+        logger.info(f"📥 Job Queue: Задача {job['id']} ({job_type}) поставлена в очередь")
+        return job
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Получение задачи по ID"""
+        return self.jobs.get(job_id)
+    
+    def find_active_job(self, dedup_key: str) -> Optional[Dict[str, Any]]:
+        """Поиск активной (queued/running) задачи по ключу дедупликации"""
+        for job in self.jobs.values():
+            if job.get("dedup_key") == dedup_key and job["status"] in ACTIVE_JOB_STATES:
+                return job
+        return None
+    
+    def list_jobs(self, job_type: Optional[str] = None, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Список задач (новые первыми)"""
+        jobs = [
+            job for job in self.jobs.values()
+            if (not job_type or job["type"] == job_type) and (not status or job["status"] == status)
+        ]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+    
+    def update_progress(self, job_id: str, done: int, total: int, message: str = ""):
+        """Обновление прогресса задачи"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        
+        job["progress"] = {
+            "done": done,
+            "total": total,
+            "percent": round(done / total * 100) if total else 0,
+            "message": message
+        }
+        self._save_jobs()
+    
+    async def cancel(self, job_id: str) -> bool:
+        """Отмена задачи (из очереди или во время выполнения)"""
+        job = self.jobs.get(job_id)
+        if not job or job["status"] not in ACTIVE_JOB_STATES:
+            return False
+        
+        task = self._running_tasks.get(job_id)
+        if task:
+            # Воркер переведет задачу в cancelled после остановки обработчика
+            job["cancel_requested"] = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            self._finish_job(job, JOB_CANCELLED)
+        
+        logger.info(f"🛑 Job Queue: Задача {job_id} отменена")
+        return True
+    
+    def retry(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Повторный запуск завершившейся с ошибкой или отмененной задачи"""
+        job = self.jobs.get(job_id)
+        if not job or job["status"] not in (JOB_FAILED, JOB_CANCELLED):
+            return None
+        
+        job["status"] = JOB_QUEUED
+        job["attempts"] = 0
+        job["error"] = None
+        job["finished_at"] = None
+        job["retry_at"] = None
+        job.pop("cancel_requested", None)
+        self._save_jobs()
+        self._notify_workers()
+        
+        logger.info(f"🔁 Job Queue: Задача {job_id} поставлена на повтор")
+        return job
+    
+    async def wait_for(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Ожидание завершения задачи"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        
+        if job["status"] in FINISHED_JOB_STATES:
+            return job
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return self.jobs.get(job_id)
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if future in waiters:
+                waiters.remove(future)
+    
+    # === ВОРКЕРЫ ===
+    
+    def _notify_workers(self):
+        """Пробуждение воркеров при появлении новых задач"""
+        if self._wakeup:
+            self._wakeup.set()
+    
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """Выбор следующей задачи: меньший priority первым, затем по order_key (или более старые)"""
+        now = datetime.now().isoformat() + "Z"
+        queued = [
+            job for job in self.jobs.values()
+            if job["status"] == JOB_QUEUED and (not job.get("retry_at") or job["retry_at"] <= now)
+        ]
+        if not queued:
+            return None
+        return min(queued, key=lambda job: (job["priority"], job.get("order_key") or job["created_at"]))
+    
+    async def _worker_loop(self, index: int):
+        """Цикл воркера: берет задачи из очереди, пока они есть"""
+        while True:
+            job = self._next_job()
+            
+            if not job:
+                self._wakeup.clear()
+                try:
+                    # Периодически просыпаемся, чтобы подхватить отложенные повторы
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            await self._run_job(job)
+    
+    async def _run_job(self, job: Dict[str, Any]):
+        """Выполнение одной задачи с обработкой отмены, ошибок и повторов"""
+        handler = self.handlers.get(job["type"])
+        if not handler:
+            job["error"] = f"Нет обработчика для задач типа {job['type']}"
+            self._finish_job(job, JOB_FAILED)
+            return
+        
+        job["status"] = JOB_RUNNING
+        job["attempts"] += 1
+        job["started_at"] = datetime.now().isoformat() + "Z"
+        self._save_jobs()
+        
+        task = asyncio.create_task(handler(job, JobContext(self, job)))
+        self._running_tasks[job["id"]] = task
+        
+        try:
+            job["result"] = await task
+            self._finish_job(job, JOB_COMPLETED)
+            logger.info(f"✅ Job Queue: Задача {job['id']} ({job['type']}) выполнена")
+        
+        except asyncio.CancelledError:
+            if job.pop("cancel_requested", False):
+                self._finish_job(job, JOB_CANCELLED)
+            else:
+                # Остановка сервера: задача останется running и восстановится при старте
+                self._save_jobs()
+                raise
+        
+        except Exception as e:
+            job["error"] = str(e)
+            
+            if job["attempts"] < job["max_attempts"]:
+                retry_at = datetime.now() + timedelta(seconds=self.retry_delay * job["attempts"])
+                job["status"] = JOB_QUEUED
+                job["retry_at"] = retry_at.isoformat() + "Z"
+                self._save_jobs()
+                logger.warning(f"⚠️ Job Queue: Задача {job['id']} упала (попытка {job['attempts']}), повтор в {retry_at:%H:%M:%S}: {e}")
+            else:
+                self._finish_job(job, JOB_FAILED)
+                logger.error(f"❌ Job Queue: Задача {job['id']} завершилась ошибкой: {e}")
+        
+        finally:
+            self._running_tasks.pop(job["id"], None)
+    
+    def _finish_job(self, job: Dict[str, Any], status: str):
+        """Перевод задачи в финальное состояние и оповещение ожидающих"""
+        job["status"] = status
+        job["finished_at"] = datetime.now().isoformat() + "Z"
+        self._save_jobs()
+        
+        for future in self._waiters.pop(job["id"], []):
+            if not future.done():
+                future.set_result(job)
+
+
+# Экспорт
+__all__ = [
+    'JobQueue',
+    'JobContext',
+    'JOB_QUEUED',
+    'JOB_RUNNING',
+    'JOB_COMPLETED',
+    'JOB_FAILED',
+    'JOB_CANCELLED',
+    'ACTIVE_JOB_STATES'
+]
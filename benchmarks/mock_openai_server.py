@@ -0,0 +1,435 @@
+"""
+Локальный OpenAI-совместимый mock-сервер для нагрузочных тестов без расхода токенов
+POST /v1/chat/completions (в том числе stream=true): настраиваемые задержки, инъекция ошибок 500 и 429,
+детерминированные ответы в формате JSON, который ждет каждый агент (формат выбирается по заголовку
+X-LLM-Route, который LLM Router добавляет к запросам, или по тексту промпта)
+
+Запуск:
+    python benchmarks/mock_openai_server.py                                  # порт 8100, задержка ~0.8 сек
+    python benchmarks/mock_openai_server.py --latency 1.5 --jitter 0.5 --distribution lognormal
+    python benchmarks/mock_openai_server.py --error-rate 0.02 --rate-limit-rate 0.05 --max-concurrency 20
+    python benchmarks/mock_openai_server.py --route-latency question_generation=6 chat=0.3
+
+Приложение направляется на сервер через .env (ключ OpenAI не нужен):
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+
+Счетчики запросов и инъекций по маршрутам: GET /stats
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ai_agents.llm_router import ROUTE_HEADER
+from ai_agents.text_chunking import count_tokens
+
+
+# === ДЕТЕРМИНИРОВАННЫЕ ОТВЕТЫ ===
+
+SKILLS = [
+    "Python", "SQL", "Machine Learning", "Statistics", "Data Visualization", "Git", "Docker", "Kubernetes",
+    "Linux", "REST API", "Kafka", "PostgreSQL", "Java", "Spring", "Airflow", "Spark", "Risk Management",
+    "Banking Regulations", "Financial Analysis", "Excel", "Problem Solving", "Communication"
+]
+
+TERMS = [
+    "индексы", "транзакции", "кэширование", "репликация", "мониторинг", "логирование", "валидация",
+    "сериализация", "партиционирование", "миграции", "аутентификация", "шифрование", "профилирование",
+    "тестирование", "масштабирование", "очереди", "потоки", "нормализация", "агрегация", "отчетность",
+    "резервирование", "версионирование", "конфигурация", "оптимизация", "декомпозиция", "интеграция"
+]
+
+DEPARTMENTS = ["IT Department", "Risk Management", "Operations", "Finance", "Retail Banking"]
+PROFESSIONS = ["Data Scientist", "Backend Developer", "Risk Analyst", "DevOps Engineer", "Business Analyst"]
+LEVELS = ["Junior", "Middle", "Senior"]
+CATEGORIES = ["Основы", "Практика", "Архитектура", "Оптимизация", "Безопасность"]
+
+CHAT_REPLIES = [
+    "Данные профессии выглядят согласованно, дубликатов по названию не видно.",
+    "Рекомендую уточнить специализацию: так кандидатам будет понятнее, какие навыки проверяются.",
+    "Теги покрывают основные навыки, веса стоит сверить с задачами отдела.",
+    "Банковское название соответствует стандартам, можно переходить к следующему шагу."
+]
+
+
+def _last_user_prompt(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content") or "")
+    return ""
+
+
+def _json_after(marker: str, prompt: str) -> Dict[str, Any]:
+    """JSON-объект тегов, вставленный в промпт после marker"""
+    match = re.search(re.escape(marker) + r'\s*(\{.*?\})', prompt, re.DOTALL)
+    try:
+        return json.loads(match.group(1)) if match else {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def _question(tag: str, difficulty: str, rng: random.Random) -> Dict[str, Any]:
+    """Уникальный вопрос (случайные термины и метки - без почти-дубликатов между вопросами)"""
+    first, second = rng.sample(TERMS, 2)
+    options = [f"{term} {rng.getrandbits(32):08x}" for term in rng.sample(TERMS, 4)]
+    return {
+        "question": f"{tag}: как {first} влияет на {second} (кейс {rng.getrandbits(40):010x})?",
+        "options": options,
+        "correct_answer": options[0],
+        "explanation": f"{options[0]} - ожидаемое решение для уровня {difficulty}",
+        "difficulty": difficulty,
+        "category": rng.choice(CATEGORIES)
+    }
+
+
+def tags_response(prompt: str, rng: random.Random) -> Dict[str, Any]:
+    return {skill: rng.randrange(55, 96) for skill in rng.sample(SKILLS, 7)}
+
+
+def tag_analysis_response(prompt: str, rng: random.Random) -> Dict[str, Any]:
+    # Один маршрут - два формата: корректировки тегов начальником и анализ тегов при утверждении
+    if '"tags_to_add"' in prompt:
+        tags = _json_after("ТЕКУЩИЕ ТЕГИ:", prompt)
+        corrected = rng.sample(sorted(tags), min(2, len(tags)))
+        added = [skill for skill in SKILLS if skill not in tags][:2]
+        return {
+            "weight_corrections": {
+                tag: {"current": tags[tag], "suggested": min(95, tags[tag] + 5), "reason": "Ключевой навык позиции"}
+                for tag in corrected
+            },
+            "tags_to_add": {skill: {"weight": rng.randrange(55, 80), "reason": "Нужен в задачах отдела"} for skill in added},
+            "tags_to_remove": [],
+            "explanation": "Усилены ключевые навыки и добавлены недостающие"
+        }
+    
+    tags = _json_after("ТЕГИ:", prompt)
+    return {
+        "tags_relevance_score": round(rng.uniform(0.7, 0.95), 2),
+        "missing_tags": [skill for skill in SKILLS if skill not in tags][:rng.randrange(0, 3)],
+        "excessive_tags": [],
+        "weight_corrections": {},
+        "banking_specific_issues": [],
+        "overall_recommendation": rng.choice(["approve", "approve", "modify"])
+    }
+
+
+def consistency_response(prompt: str, rng: random.Random) -> Dict[str, Any]:
+    score = round(rng.uniform(0.7, 0.95), 2)
+    if '"consistency_score"' in prompt:
+        return {"consistency_score": score, "issues": [], "suggestions": ["Уточнить специализацию"],
+                "should_return_to_hr": False, "return_reason": ""}
+    return {"score": score, "issues": [], "suggestions": ["Уточнить специализацию"]}
+
+
+def vacancy_response(prompt: str, rng: random.Random) -> Dict[str, Any]:
+    profession = rng.choice(PROFESSIONS)
+    return {
+        "position_title": f"Главный специалист ({profession})",
+        "department_suggestion": rng.choice(DEPARTMENTS),
+        "real_profession": profession,
+        "specialization": rng.choice(SKILLS),
+        "experience_level": rng.choice(LEVELS),
+        "key_requirements": [f"Опыт работы с {skill}" for skill in rng.sample(SKILLS, 4)],
+        "summary": f"Позиция {profession} в банке: развитие и поддержка внутренних систем"
+    }
+
+
+def questions_response(prompt: str, rng: random.Random) -> Any:
+    # Один тег и уровень: массив вопросов
+    match = re.search(r'Создай (\d+) уникальных вопросов уровня (\w+) по тегу "(.+?)"', prompt)
+    if match:
+        count, difficulty, tag = int(match.group(1)), match.group(2), match.group(3)
+        return [_question(tag, difficulty, rng) for _ in range(count)]
+    
+    # Упакованный запрос: тег -> уровень -> массив вопросов
+    packed: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for tag, plan in re.findall(r'^\s*- "(.+?)": ((?:\w+ - \d+(?:, )?)+)\s*$', prompt, re.MULTILINE):
+        packed[tag] = {
+            difficulty: [_question(tag, difficulty, rng) for _ in range(int(count))]
+            for difficulty, count in re.findall(r'(\w+) - (\d+)', plan)
+        }
+    return packed
+
+
+def chat_response(prompt: str, rng: random.Random) -> str:
+    return rng.choice(CHAT_REPLIES)
+
+
+def recommendations_response(prompt: str, rng: random.Random) -> str:
+    return (
+        "Результат показывает хорошее понимание основ. "
+        f"Сильная сторона - {rng.choice(TERMS)}, стоит подтянуть {rng.choice(TERMS)}. "
+        "Советы: разберите вопросы с ошибками, решите несколько практических задач по слабым темам "
+        "и повторите тест через пару недель."
+    )
+
+
+# Маршрут LLM Router -> построитель ответа (dict/list - JSON, str - текст)
+RESPONSE_BUILDERS = {
+    "tags_generation": tags_response,
+    "tag_analysis": tag_analysis_response,
+    "consistency_check": consistency_response,
+    "vacancy_analysis": vacancy_response,
+    "vacancy_chunk_analysis": vacancy_response,
+    "question_generation": questions_response,
+    "chat": chat_response,
+    "recommendations": recommendations_response
+}
+
+
+def detect_route(prompt: str) -> str:
+    """Маршрут по тексту промпта (клиент не прислал заголовок маршрута)"""
+    if "уникальных вопросов" in prompt or "Создай уникальные вопросы" in prompt:
+        return "question_generation"
+    if "тегов для профессии" in prompt:
+        return "tags_generation"
+    if '"tags_relevance_score"' in prompt or '"tags_to_add"' in prompt:
+        return "tag_analysis"
+    if '"consistency_score"' in prompt or "логичность" in prompt:
+        return "consistency_check"
+    if '"position_title"' in prompt:
+        return "vacancy_analysis"
+    if "рекомендации для кандидата" in prompt:
+        return "recommendations"
+    return "chat"
+
+
+def build_content(route: str, model: str, messages: List[Dict[str, Any]]) -> str:
+    """Ответ модели: одинаковый запрос - одинаковый ответ"""
+    seed = hashlib.sha256(json.dumps([route, model, messages], ensure_ascii=False, sort_keys=True).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    
+    result = RESPONSE_BUILDERS.get(route, chat_response)(_last_user_prompt(messages), rng)
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, indent=2)
+
+
+# === СЕРВЕР ===
+
+class MockOpenAIServer:
+    """Эмуляция chat.completions: задержки, ошибки, лимит одновременных запросов"""
+    
+    def __init__(self, latency: float = 0.8, jitter: float = 0.3, distribution: str = "lognormal",
+                 seconds_per_token: float = 0.002, route_latency: Optional[Dict[str, float]] = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, timeout_rate: float = 0.0,
+                 hang_seconds: float = 300, retry_after: float = 1, max_concurrency: int = 0, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.seconds_per_token = seconds_per_token
+        self.route_latency = route_latency or {}
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        
+        # Задержки и ошибки воспроизводимы при одинаковом seed и порядке запросов
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.stats: Dict[str, Dict[str, int]] = {}
+    
+    def sample_latency(self, route: str) -> float:
+        """Задержка до первого токена (fixed | uniform | normal | lognormal с медианой latency)"""
+        base = self.route_latency.get(route, self.latency)
+        if self.distribution == "fixed" or not base:
+            return base
+        if self.distribution == "uniform":
+            return max(0.0, self.rng.uniform(base - self.jitter, base + self.jitter))
+        if self.distribution == "normal":
+            return max(0.0, self.rng.gauss(base, self.jitter))
+        return base * math.exp(self.rng.gauss(0, self.jitter / base))
+    
+    def _stats_for(self, route: str) -> Dict[str, int]:
+        return self.stats.setdefault(route, {
+            "requests": 0, "completed": 0, "errors_500": 0, "rate_limited": 0, "hung": 0,
+            "prompt_tokens": 0, "completion_tokens": 0
+        })
+    
+    def _error(self, status_code: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+        return JSONResponse(
+            {"error": {"message": message, "type": error_type, "param": None, "code": None}},
+            status_code=status_code,
+            headers=headers
+        )
+    
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o-mini")
+        route = request.headers.get(ROUTE_HEADER) or detect_route(_last_user_prompt(messages))
+        stats = self._stats_for(route)
+        stats["requests"] += 1
+        
+        # Лимит одновременных запросов и случайные 429 - как rate limit OpenAI
+        if (self.max_concurrency and self.in_flight >= self.max_concurrency) or self.rng.random() < self.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return self._error(429, "Rate limit reached (mock)", "requests", {"retry-after": f"{self.retry_after:g}"})
+        
+        self.in_flight += 1
+        try:
+            latency = self.sample_latency(route)
+            
+            if self.rng.random() < self.timeout_rate:
+                stats["hung"] += 1
+                await asyncio.sleep(self.hang_seconds)
+            
+            if self.rng.random() < self.error_rate:
+                await asyncio.sleep(latency / 2)
+                stats["errors_500"] += 1
+                return self._error(500, "The server had an error while processing your request (mock)", "server_error")
+            
+            content = build_content(route, model, messages)
+            prompt_tokens = sum(count_tokens(str(message.get("content") or "")) + 4 for message in messages)
+            completion_tokens = count_tokens(content)
+            
+            # Обрезка по max_tokens, как у настоящей модели (finish_reason="length")
+            finish_reason = "stop"
+            max_tokens = body.get("max_tokens")
+            if max_tokens and completion_tokens > max_tokens:
+                content = content[:int(len(content) * max_tokens / completion_tokens)]
+                completion_tokens, finish_reason = max_tokens, "length"
+            
+            stats["completed"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:24]}"
+            
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                return StreamingResponse(
+                    self._stream(completion_id, model, content, finish_reason, usage, latency, include_usage),
+                    media_type="text/event-stream"
+                )
+            
+            await asyncio.sleep(latency + completion_tokens * self.seconds_per_token)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "system_fingerprint": "mock",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason
+                }],
+                "usage": usage
+            })
+        
+        finally:
+            self.in_flight -= 1
+    
+    async def _stream(self, completion_id: str, model: str, content: str, finish_reason: str,
+                      usage: Dict[str, int], latency: float, include_usage: bool):
+        """SSE-чанки chat.completion.chunk: первый после задержки, дальше со скоростью генерации"""
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra) -> str:
+            payload = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "system_fingerprint": "mock",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+                **extra
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(latency)
+            yield chunk({"role": "assistant", "content": ""})
+            
+            pieces = _stream_pieces(content)
+            per_piece = usage["completion_tokens"] * self.seconds_per_token / max(1, len(pieces))
+            for piece in pieces:
+                await asyncio.sleep(per_piece)
+                yield chunk({"content": piece})
+            
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+        
+        finally:
+            self.in_flight -= 1
+
+
+def _stream_pieces(content: str, size: int = 16) -> List[str]:
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+def create_app(server: MockOpenAIServer) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI API")
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await server.chat_completions(request)
+    
+    @app.get("/v1/models")
+    async def list_models():
+        models = ["gpt-4", "gpt-4o", "gpt-4o-mini"]
+        return {"object": "list", "data": [{"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in models]}
+    
+    @app.get("/stats")
+    async def stats():
+        return {"in_flight": server.in_flight, "routes": server.stats}
+    
+    return app
+
+
+def parse_route_latency(values: List[str]) -> Dict[str, float]:
+    """["chat=0.3", "question_generation=6"] -> {маршрут: секунды}"""
+    result = {}
+    for value in values:
+        route, _, seconds = value.partition("=")
+        result[route] = float(seconds)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный OpenAI-совместимый mock-сервер")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.8, help="Задержка до первого токена, сек (медиана)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Разброс задержки, сек")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--seconds-per-token", type=float, default=0.002, help="Время генерации одного токена ответа")
+    parser.add_argument("--route-latency", nargs="*", default=[], metavar="ROUTE=SEC", help="Задержка отдельных маршрутов")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Доля зависающих запросов")
+    parser.add_argument("--hang-seconds", type=float, default=300, help="Сколько висит зависший запрос")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After для ответов 429, сек")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Больше одновременных запросов - 429 (0 - без лимита)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed задержек и инъекций ошибок")
+    args = parser.parse_args()
+    
+    server = MockOpenAIServer(
+        latency=args.latency, jitter=args.jitter, distribution=args.distribution,
+        seconds_per_token=args.seconds_per_token, route_latency=parse_route_latency(args.route_latency),
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds, retry_after=args.retry_after, max_concurrency=args.max_concurrency,
+        seed=args.seed
+    )
+    
+    print(f"🧪 Mock OpenAI: http://{args.host}:{args.port}/v1 (OPENAI_BASE_URL для приложения)")
+    uvicorn.run(create_app(server), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк упакованной генерации вопросов
+Сравнивает режимы per_level и packed: время, токены, число запросов и доля вопросов, прошедших валидацию
+
+Запуск (нужен OPENAI_API_KEY, запросы идут в реальный API; с OPENAI_BASE_URL - в mock-сервер benchmarks/mock_openai_server.py):
+    python benchmarks/question_packing.py                  # демо-профессия
+    python benchmarks/question_packing.py <profession_id>  # профессия из data/profession_records.json
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import OPENAI_API_KEY, DATA_DIR, QUESTIONS_PACK_MAX_QUESTIONS
+from ai_agents import QuestionsGenerator
+
+
+# Демо-профессия: один крупный тег и несколько небольших
+DEMO_PROFESSION = {
+    "id": "benchmark",
+    "bank_title": "Главный специалист",
+    "real_name": "Software Developer",
+    "specialization": "Backend Development",
+    "department": "IT Department",
+    "tags": {"Python": 90, "SQL": 60, "Docker": 45, "Git": 40, "Linux": 35}
+}
+
+
+def load_profession(profession_id: str) -> Dict[str, Any]:
+    """Профессия из реестра"""
+    with open(DATA_DIR / "profession_records.json", 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    for record in data.get("profession_records", []):
+        if record["id"] == profession_id:
+            return record
+    
+    raise SystemExit(f"❌ Профессия {profession_id} не найдена")
+
+
+async def run_mode(mode: str, profession: Dict[str, Any]) -> Dict[str, Any]:
+    """Одна генерация в заданном режиме с подсчетом запросов, токенов и валидации"""
+    metrics = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "validated": 0, "rejected": 0}
+    
+    # Отдельный каталог, чтобы чекпоинты не переиспользовались между режимами
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        generator = QuestionsGenerator(OPENAI_API_KEY, Path(tmp_dir), mode, QUESTIONS_PACK_MAX_QUESTIONS)
+        completions = generator.openai_client.chat.completions
+        original_create = completions.create
+        original_validate = generator._validate_question
+        
+        async def counting_create(**kwargs):
+            metrics["calls"] += 1
+            response = await original_create(**kwargs)
+            if getattr(response, "usage", None):
+                metrics["prompt_tokens"] += response.usage.prompt_tokens
+                metrics["completion_tokens"] += response.usage.completion_tokens
+            return response
+        
+        def counting_validate(question):
+            valid = original_validate(question)
+            metrics["validated" if valid else "rejected"] += 1
+            return valid
+        
+        completions.create = counting_create
+        generator._validate_question = counting_validate
+        
+        try:
+            started = time.perf_counter()
+            result = await generator.generate_questions_for_profession(dict(profession, id=f"benchmark_{mode}"))
+            metrics["wall_time"] = time.perf_counter() - started
+        finally:
+            completions.create = original_create
+    
+    checked = metrics["validated"] + metrics["rejected"]
+    metrics["total_tokens"] = metrics["prompt_tokens"] + metrics["completion_tokens"]
+    metrics["questions"] = len(result.get("questions", []))
+    metrics["pass_rate"] = metrics["validated"] / checked if checked else 0.0
+    return metrics
+
+
+def print_report(results: Dict[str, Dict[str, Any]]):
+    """Таблица сравнения режимов"""
+    rows = [
+        ("Время, с", "wall_time", "{:.1f}"),
+        ("Запросов к ИИ", "calls", "{}"),
+        ("Токены prompt", "prompt_tokens", "{}"),
+        ("Токены completion", "completion_tokens", "{}"),
+        ("Токены всего", "total_tokens", "{}"),
+        ("Вопросов в банке", "questions", "{}"),
+        ("Прошли валидацию", "pass_rate", "{:.0%}"),
+    ]
+    
+    modes = list(results)
+    print(f"\n{'':<20}" + "".join(f"{mode:>14}" for mode in modes))
+    for label, key, fmt in rows:
+        print(f"{label:<20}" + "".join(f"{fmt.format(results[mode][key]):>14}" for mode in modes))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сравнение per_level и packed генерации вопросов")
+    parser.add_argument("profession_id", nargs="?", help="ID профессии из реестра (по умолчанию демо-профессия)")
+    args = parser.parse_args()
+    
+    profession = load_profession(args.profession_id) if args.profession_id else DEMO_PROFESSION
+    print(f"🎯 Профессия: {profession['real_name']} ({len(profession['tags'])} тегов)")
+    
+    results = {}
+    for mode in ("per_level", "packed"):
+        print(f"⏳ Режим {mode}...")
+        results[mode] = await run_mode(mode, profession)
+    
+    print_report(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -35,6 +35,13 @@ load_dotenv()
 
 # API ключи из .env файла
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# OpenAI-совместимый API вместо api.openai.com, например локальный mock-сервер:
+# OPENAI_BASE_URL=http://127.0.0.1:8100/v1 (python benchmarks/mock_openai_server.py)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+if OPENAI_BASE_URL and not OPENAI_API_KEY:
+    OPENAI_API_KEY = "local-mock"  # Mock-серверу ключ не нужен
+
 if not OPENAI_API_KEY:
     raise ValueError("⚠️ OPENAI_API_KEY не найден в .env файле!")
 
@@ -53,11 +60,76 @@ for directory in [DATA_DIR, TEMPLATES_DIR, STATIC_DIR, UPLOADS_DIR]:
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'.pdf', '.docx', '.doc', '.txt'}
 
+# Извлечение текста из загруженных файлов (пул процессов, вне event loop)
+DOCUMENT_EXTRACTION_WORKERS = 2
+DOCUMENT_EXTRACTION_TIMEOUT = 20  # Секунд на файл
+DOCUMENT_MAX_PAGES = 30  # Страниц PDF
+DOCUMENT_MAX_CHARS = 50000  # Чтение прекращается, когда текста достаточно
+
+# Кэш анализов загруженных файлов по SHA-256 содержимого (data/file_analyses.json)
+FILE_ANALYSIS_CACHE_MAX_ENTRIES = 200
+FILE_ANALYSIS_CACHE_TTL_HOURS = 72
+
+# Длинные документы: части не длиннее N токенов анализируются параллельно и объединяются
+FILE_ANALYSIS_CHUNK_TOKENS = 3000
+
 # Настройки ИИ
 OPENAI_MODEL = "gpt-4"
 AI_TEMPERATURE = 0.2
 AI_MAX_TOKENS = 2000
 
+# Уровни моделей: маршруты ссылаются на уровень, а не на конкретную модель
+LLM_MODEL_TIERS = {
+    "premium": OPENAI_MODEL,
+    "standard": "gpt-4o",
+    "economy": "gpt-4o-mini"
+}
+
+# Маршруты операций агентов: цепочка уровней (следующий - fallback при таймауте/недоступности),
+# таймаут одной попытки в секундах и лимит max_tokens
+LLM_ROUTES = {
+    "tags_generation": {"tiers": ["premium", "standard"], "timeout": 60, "max_tokens": 1200},
+    "tag_analysis": {"tiers": ["standard", "premium"], "timeout": 45, "max_tokens": 1000},
+    "consistency_check": {"tiers": ["economy", "standard"], "timeout": 30, "max_tokens": 600},
+    "vacancy_analysis": {"tiers": ["standard", "premium"], "timeout": 45, "max_tokens": 800},
+    "vacancy_chunk_analysis": {"tiers": ["economy", "standard"], "timeout": 30, "max_tokens": 600},
+    "chat": {"tiers": ["economy", "standard"], "timeout": 20, "max_tokens": 300},
+    "question_generation": {"tiers": ["premium", "standard"], "timeout": 120, "max_tokens": 4000},
+    "recommendations": {"tiers": ["economy", "standard"], "timeout": 30, "max_tokens": 300}
+}
+
+# Цены моделей, USD за 1M токенов (метрики стоимости по маршрутам)
+LLM_MODEL_PRICES = {
+    "gpt-4": {"input": 30.0, "output": 60.0},
+    "gpt-4o": {"input": 2.5, "output": 10.0},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.6}
+}
+
+# Фоновые задачи (генерация вопросов)
+GENERATION_WORKERS = 2  # Размер пула воркеров очереди
+GENERATION_MAX_ATTEMPTS = 3  # Автоматических попыток на задачу
+QUESTIONS_GENERATION_MODE = os.getenv('QUESTIONS_GENERATION_MODE', 'per_level')  # per_level | packed
+QUESTIONS_PACK_MAX_QUESTIONS = 20  # Максимум вопросов в одном упакованном запросе
+QUESTIONS_DUPLICATE_THRESHOLD = 0.7  # Сходство (0-1), выше которого вопрос считается почти-дубликатом
+QUESTION_LIBRARY_ENABLED = True  # Общая библиотека вопросов по тегам (data/question_library.json)
+QUESTION_LIBRARY_SAME_PROFESSION_ONLY = False  # Брать из библиотеки только вопросы той же профессии
+
+# Ленивая генерация: уровни сложности генерируются при создании теста, а не ночью для всех тегов
+QUESTIONS_LAZY_LEVELS = False
+QUESTIONS_JIT_WAIT_SECONDS = 20  # Сколько создание теста ждет генерацию недостающего уровня
+TEST_QUESTIONS_COUNT = 15  # Вопросов в тесте кандидата
+
+# Ночная генерация: окно от запуска в 00:00 и общий бюджет токенов (0 - без ограничения).
+# Не успевшие профессии остаются approved_by_head и ставятся первыми следующей ночью
+NIGHTLY_GENERATION_WINDOW_HOURS = 6
+NIGHTLY_GENERATION_TOKEN_BUDGET = 3000000
+
+# Анализ формы создания профессии (/api/analyze-form и чат): пауза перед ИИ анализом,
+# пока форма меняется, и кэш готовых анализов по состоянию формы
+FORM_ANALYSIS_DEBOUNCE_SECONDS = 0.5
+FORM_ANALYSIS_CACHE_TTL = 600  # Секунд
+FORM_ANALYSIS_CACHE_SIZE = 500
+
 # Организация
 ORGANIZATION = {
     "name": "Halyk Bank",
@@ -161,7 +233,7 @@ initialize_data()
 
 print("✅ Конфигурация HR Admin Panel v2.0 загружена")
 print(f"📁 Данные: {DATA_DIR}")
-print(f"🤖 OpenAI: {'✅' if OPENAI_API_KEY else '❌'}")
+print(f"🤖 OpenAI: {'✅' if OPENAI_API_KEY else '❌'}{f' ({OPENAI_BASE_URL})' if OPENAI_BASE_URL else ''}")
 print(f"🌐 Порт: {APP_PORT}")
 print(f"👥 Ролей: {len(ROLE_NAMES)}")
 print(f"📊 Статусов: {len(PROFESSION_STATUSES)}")
\ No newline at end of file
@@ -4,10 +4,11 @@ HR Admin Panel v2.0 - Основной сервер
 """
 
 import json
+import asyncio
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Set
+from datetime import datetime, timedelta
 
 # FastAPI
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, Form, File, UploadFile, HTTPException
@@ -36,10 +37,16 @@ from roles import (
 )
 
 # ИИ агенты
-from ai_agents import HRAssistant, TagsGenerator, HeadApproval, QuestionsGenerator
+from ai_agents import (
+    HRAssistant, TagsGenerator, HeadApproval, QuestionsGenerator, ProfessionCatalog, FormAnalysisCoordinator,
+    DocumentExtractor, FileAnalysisCache, LLMMetrics, get_llm_router, configure_openai_client, llm_call_scope, llm_usage_scope
+)
 
 from proctoring.audio_proctoring import get_audio_proctor
 
+# Очередь фоновых задач
+from background_jobs import JobQueue, JobContext, ACTIVE_JOB_STATES
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -62,17 +69,58 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
 # Инициализируем ИИ агентов
-hr_assistant = HRAssistant(OPENAI_API_KEY, DATA_DIR)
-tags_generator = TagsGenerator(OPENAI_API_KEY, DATA_DIR)
-head_approval = HeadApproval(OPENAI_API_KEY, DATA_DIR)
-questions_generator = QuestionsGenerator(OPENAI_API_KEY, DATA_DIR)
+# Метрики вызовов ИИ по агентам и операциям, расход по профессиям - data/llm_costs.json
+llm_metrics = LLMMetrics(DATA_DIR)
+
+# Адрес API общего клиента (OPENAI_BASE_URL - например, локальный mock-сервер) и учет HTTP-попыток
+configure_openai_client(OPENAI_BASE_URL, llm_metrics.http_event_hooks())
+
+# Общий каталог профессий для агентов (перечитывается после каждой записи в реестр)
+profession_catalog = ProfessionCatalog(DATA_DIR)
+
+document_extractor = DocumentExtractor(
+    DOCUMENT_EXTRACTION_WORKERS, DOCUMENT_MAX_PAGES, DOCUMENT_MAX_CHARS, DOCUMENT_EXTRACTION_TIMEOUT
+)
+
+file_analysis_cache = FileAnalysisCache(DATA_DIR, FILE_ANALYSIS_CACHE_MAX_ENTRIES, FILE_ANALYSIS_CACHE_TTL_HOURS)
+
+hr_assistant = HRAssistant(
+    OPENAI_API_KEY, DATA_DIR, profession_catalog, document_extractor, file_analysis_cache, FILE_ANALYSIS_CHUNK_TOKENS
+)
+form_analysis = FormAnalysisCoordinator(
+    hr_assistant, FORM_ANALYSIS_DEBOUNCE_SECONDS, FORM_ANALYSIS_CACHE_TTL, FORM_ANALYSIS_CACHE_SIZE
+)
+tags_generator = TagsGenerator(OPENAI_API_KEY, DATA_DIR, profession_catalog)
+head_approval = HeadApproval(OPENAI_API_KEY, DATA_DIR, profession_catalog)
+questions_generator = QuestionsGenerator(
+    OPENAI_API_KEY, DATA_DIR, QUESTIONS_GENERATION_MODE, QUESTIONS_PACK_MAX_QUESTIONS, QUESTIONS_DUPLICATE_THRESHOLD,
+    QUESTION_LIBRARY_ENABLED, QUESTION_LIBRARY_SAME_PROFESSION_ONLY
+)
+
+# Маршрутизация запросов агентов по моделям (таблица LLM_ROUTES в config.py)
+llm_router = get_llm_router(OPENAI_API_KEY)
+if llm_router:
+    llm_router.configure(LLM_ROUTES, LLM_MODEL_TIERS, LLM_MODEL_PRICES)
+    llm_router.attach_metrics(llm_metrics)
 
 # Планировщик задач
 scheduler = AsyncIOScheduler()
 
+# Персистентная очередь фоновых задач (генерация вопросов)
+job_queue = JobQueue(DATA_DIR, workers=GENERATION_WORKERS, max_attempts=GENERATION_MAX_ATTEMPTS)
+
+# Расход токенов выполняющихся задач генерации (id задачи -> живой счетчик llm_usage_scope)
+running_generation_usage: Dict[str, Dict[str, int]] = {}
+
 # Хранилище активных WebSocket соединений
 active_connections: Dict[str, WebSocket] = {}
 
+# Фоновые задачи (держим ссылки, чтобы задачи не собрал GC)
+background_tasks: set = set()
+
+# Блокировка записи test_sessions.json (submit и фоновые рекомендации)
+test_sessions_lock = asyncio.Lock()
+
 # === СОБЫТИЯ ПРИЛОЖЕНИЯ ===
 
 @app.on_event("startup")
@@ -83,6 +131,16 @@ async def startup_event():
     # Обновляем справочники
     await update_reference_files()
     
+    # Дозапускаем рекомендации, не сгенерированные до перезапуска
+    resume_pending_recommendations()
+    
+    # Запускаем очередь фоновых задач и подхватываем зависшие генерации
+    job_queue.register_handler("generate_questions", run_questions_generation_job)
+    job_queue.register_handler("generate_level", run_level_generation_job)
+    job_queue.register_handler("generate_tags", run_tags_generation_job)
+    recover_orphaned_generations()
+    await job_queue.start()
+    
     # Запускаем планировщик
     scheduler.start()
     
@@ -100,6 +158,9 @@ async def startup_event():
 async def shutdown_event():
     """Завершение работы"""
     scheduler.shutdown()
+    await job_queue.stop()
+    document_extractor.shutdown()
+    llm_metrics.flush()
     logger.info("💤 HR Admin Panel остановлен")
 
 # === ОСНОВНЫЕ МАРШРУТЫ ===
@@ -231,7 +292,7 @@ async def analyze_file(request: Request, file: UploadFile = File(...)):
     
     try:
         # Проверяем размер файла
-        if file.size > MAX_FILE_SIZE:
+        if file.size is not None and file.size > MAX_FILE_SIZE:
             return JSONResponse({"error": "Файл слишком большой (максимум 10MB)"}, status_code=400)
         
         # Проверяем расширение
@@ -239,18 +300,13 @@ async def analyze_file(request: Request, file: UploadFile = File(...)):
         if file_extension not in ALLOWED_EXTENSIONS:
             return JSONResponse({"error": f"Неподдерживаемый формат файла: {file_extension}"}, status_code=400)
         
-        # Сохраняем файл
-        file_path = UPLOADS_DIR / f"{user['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Анализируем через HR Assistant
-        analysis_result = await hr_assistant.analyze_file(str(file_path))
+        # Читаем файл из памяти (UploadFile уже во временном spooled-файле, в uploads не сохраняем)
+        content = await file.read(MAX_FILE_SIZE + 1)
+        if len(content) > MAX_FILE_SIZE:
+            return JSONResponse({"error": "Файл слишком большой (максимум 10MB)"}, status_code=400)
         
-        # Удаляем файл после анализа
-        file_path.unlink(missing_ok=True)
+        # Анализируем через HR Assistant (текст извлекается в пуле процессов)
+        analysis_result = await hr_assistant.analyze_file(content, file.filename)
         
         logger.info(f"📄 Файл проанализирован: {file.filename} пользователем {user['name']}")
         return JSONResponse(analysis_result)
@@ -267,8 +323,12 @@ async def analyze_form(request: Request, form_data: dict):
         return JSONResponse({"error": "Не авторизован"}, status_code=401)
     
     try:
-        # Анализируем через HR Assistant
-        analysis_result = await hr_assistant.analyze_form_data(form_data)
+        # Анализируем через HR Assistant (кэш по состоянию формы, устаревшие анализы сессии отменяются)
+        analysis_result = await form_analysis.analyze(str(user["id"]), form_data)
+        
+        if analysis_result is None:
+            # Пока шел анализ, пришло более новое состояние формы - ответ уже не нужен
+            return JSONResponse({"success": False, "superseded": True})
         
         return JSONResponse({
             "success": True,
@@ -294,31 +354,19 @@ async def create_profession(request: Request, profession_data: dict):
         # 1. Создаем профессию со статусом "created_by_hr"
         profession_id = await save_profession(profession_data, user, "created_by_hr")
         
-        # 2. Генерируем теги через Tags Generator
-        tags_result = await tags_generator.generate_tags(profession_data)
+        # 2. Теги генерируются фоновой задачей: по готовности статус "tags_generated",
+        #    уведомление начальнику отдела и сообщение на страницу создателя (WebSocket)
+        job = enqueue_tags_generation(profession_id, profession_data, user)
         
-        if tags_result.get("success"):
-            # 3. Сохраняем теги и меняем статус на "tags_generated"
-            await update_profession_with_tags(profession_id, tags_result, user)
-            
-            # 4. Отправляем уведомление начальнику отдела
-            await notify_department_head(profession_data, profession_id)
-            
-            logger.info(f"✅ Профессия создана: {profession_data.get('bank_title')} (ID: {profession_id}) пользователем {user['name']}")
-            
-            return JSONResponse({
-                "success": True,
-                "profession_id": profession_id,
-                "tags_count": len(tags_result["tags"]),
-                "message": "Профессия создана! Теги сгенерированы ИИ и отправлены на подтверждение начальнику отдела."
-            })
-        else:
-            logger.warning(f"⚠️ Профессия создана, но теги не сгенерированы: {tags_result.get('error')}")
-            return JSONResponse({
-                "success": True,
-                "profession_id": profession_id,
-                "warning": "Профессия создана, но теги не сгенерированы. Требуется ручная настройка."
-            })
+        logger.info(f"✅ Профессия создана: {profession_data.get('bank_title')} (ID: {profession_id}) пользователем {user['name']}, генерация тегов в очереди")
+        
+        return JSONResponse({
+            "success": True,
+            "profession_id": profession_id,
+            "job_id": job["id"],
+            "status": "created_by_hr",
+            "message": "Профессия создана! ИИ генерирует теги, после чего профессия уйдет на подтверждение начальнику отдела."
+        })
         
     except Exception as e:
         logger.error(f"❌ Ошибка создания профессии: {e}")
@@ -372,9 +420,10 @@ async def get_profession_details(profession_id: str, request: Request):
         
         # Если это начальник, добавляем анализ для утверждения
         if can_user_approve_profession(user["role"]):
-            analysis = await head_approval.analyze_profession_for_approval(
-                profession_id, user["department"]
-            )
+            with llm_call_scope(profession_id=profession_id):
+                analysis = await head_approval.analyze_profession_for_approval(
+                    profession_id, user["department"], profession
+                )
             
             return JSONResponse({
                 "success": True,
@@ -499,26 +548,24 @@ async def generate_questions_manual(profession_id: str, request: Request):
         if profession.get("status") != "approved_by_head":
             return JSONResponse({"error": "Профессия еще не утверждена"}, status_code=400)
         
-        # Генерируем вопросы
-        questions_result = await questions_generator.generate_questions_for_profession(profession)
+        # Генерируем вопросы через очередь и дожидаемся результата
+        job = enqueue_questions_generation(profession_id, user["email"])
+        job = await job_queue.wait_for(job["id"])
         
-        if questions_result.get("success"):
-            # Сохраняем вопросы
-            await save_profession_questions(profession_id, questions_result["questions"])
-            
-            # Обновляем статус
-            await update_profession_status(profession_id, "questions_generated")
+        if job and job["status"] == "completed":
+            questions_result = job["result"]
             
             logger.info(f"❓ Вопросы сгенерированы для {profession_id}: {questions_result['stats']['total_questions']} вопросов")
             
             return JSONResponse({
                 "success": True,
+                "job_id": job["id"],
                 "questions_count": questions_result["stats"]["total_questions"],
                 "stats": questions_result["stats"],
                 "message": "Вопросы успешно сгенерированы!"
             })
         else:
-            return JSONResponse({"error": f"Ошибка генерации вопросов: {questions_result.get('error')}"}, status_code=500)
+            return JSONResponse({"error": f"Ошибка генерации вопросов: {(job or {}).get('error')}"}, status_code=500)
         
     except Exception as e:
         logger.error(f"❌ Ошибка генерации вопросов для {profession_id}: {e}")
@@ -605,7 +652,7 @@ async def get_questions_overview(request: Request):
                 
                 ready_professions.append(profession_info)
                 
-            elif record.get("status") == "approved_by_head":
+            elif record.get("status") in ["approved_by_head", "generating"]:
                 # Считаем ожидаемое количество вопросов на основе тегов
                 tags = record.get("tags", {})
                 tags_count = len(tags)
@@ -621,9 +668,18 @@ async def get_questions_overview(request: Request):
                     "expected_questions": f"~{expected_questions}",
                     "tags_count": tags_count,
                     "top_tags": top_tags,
-                    "status": "pending"
+                    "status": record.get("status") if record.get("status") == "generating" else "pending"
                 })
                 
+                # Прогресс активной задачи генерации
+                active_job = job_queue.find_active_job(f"generate_questions:{record.get('id')}")
+                if active_job:
+                    profession_info.update({
+                        "job_id": active_job["id"],
+                        "job_status": active_job["status"],
+                        "progress": active_job["progress"]
+                    })
+                
                 pending_professions.append(profession_info)
         
         return JSONResponse({
@@ -727,36 +783,154 @@ async def generate_questions_for_single_profession(profession_key: str, request:
         if not target_profession:
             return JSONResponse({"error": "Профессия не найдена или не готова к генерации"}, status_code=404)
         
-        # Обновляем статус на "генерируется"
-        target_profession["status"] = "generating"
-        target_profession["generation_started_at"] = datetime.now().isoformat() + "Z"
-        target_profession["workflow_history"].append({
-            "status": "generation_started",
-            "timestamp": datetime.now().isoformat() + "Z",
-            "user": user["email"],
-            "action": f"Запущена генерация вопросов супер админом"
-        })
-        
-        # Сохраняем промежуточный статус
-        with open(records_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        # Запускаем генерацию в фоне
-        import asyncio
-        asyncio.create_task(generate_questions_background(target_profession, user))
+        # Ставим генерацию в очередь (статус профессии станет "generating")
+        job = enqueue_questions_generation(target_profession["id"], user["email"])
         
         logger.info(f"🤖 Запущена генерация вопросов для {profession_key} пользователем {user['name']}")
         
         return JSONResponse({
             "success": True,
-            "message": f"Генерация вопросов для '{profession_key}' запущена",
-            "profession_id": target_profession["id"]
+            "message": f"Генерация вопросов для '{profession_key}' поставлена в очередь",
+            "profession_id": target_profession["id"],
+            "job_id": job["id"]
         })
         
     except Exception as e:
         logger.error(f"❌ Ошибка запуска генерации: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
+@app.get("/api/generation-jobs")
+async def get_generation_jobs(request: Request):
+    """Список задач генерации с прогрессом"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    jobs = job_queue.list_jobs(status=request.query_params.get("status"))
+    
+    return JSONResponse({
+        "success": True,
+        "jobs": jobs,
+        "total": len(jobs)
+    })
+
+@app.get("/api/generation-jobs/{job_id}")
+async def get_generation_job(job_id: str, request: Request):
+    """Статус и прогресс задачи генерации"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    job = job_queue.get_job(job_id)
+    if not job:
+        return JSONResponse({"error": "Задача не найдена"}, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "job": job
+    })
+
+@app.post("/api/generation-jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str, request: Request):
+    """Отмена задачи генерации"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    job = job_queue.get_job(job_id)
+    if not job:
+        return JSONResponse({"error": "Задача не найдена"}, status_code=404)
+    
+    was_running = job["status"] == "running"
+    cancelled = await job_queue.cancel(job_id)
+    if not cancelled:
+        return JSONResponse({"error": "Задача уже завершена"}, status_code=400)
+    
+    # Задачу из очереди отменили до старта - возвращаем профессии исходный статус
+    if not was_running and job["type"] == "generate_questions":
+        await finish_questions_generation(job["payload"]["profession_id"], None, "Генерация отменена")
+    
+    logger.info(f"🛑 Задача {job_id} отменена пользователем {user['name']}")
+    
+    return JSONResponse({
+        "success": True,
+        "message": "Задача отменена"
+    })
+
+@app.post("/api/generation-jobs/{job_id}/retry")
+async def retry_generation_job(job_id: str, request: Request):
+    """Повторный запуск упавшей или отмененной задачи"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    job = job_queue.get_job(job_id)
+    if not job:
+        return JSONResponse({"error": "Задача не найдена"}, status_code=404)
+    
+    if job["type"] == "generate_questions":
+        profession = get_profession_by_id(job["payload"]["profession_id"])
+        if not profession or profession.get("status") != "approved_by_head":
+            return JSONResponse({"error": "Профессия не готова к повторной генерации"}, status_code=400)
+    
+    job = job_queue.retry(job_id)
+    if not job:
+        return JSONResponse({"error": "Повторить можно только упавшую или отмененную задачу"}, status_code=400)
+    
+    if job["type"] == "generate_questions":
+        set_profession_generating(job["payload"]["profession_id"], user["email"])
+    
+    return JSONResponse({
+        "success": True,
+        "job": job
+    })
+
+@app.get("/api/llm-metrics")
+async def get_llm_metrics(request: Request):
+    """Задержка, токены, стоимость и fallback по маршрутам LLM - для настройки таблицы LLM_ROUTES"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    return JSONResponse({
+        "success": True,
+        "routes": llm_router.get_metrics() if llm_router else {},
+        "operations": llm_metrics.report(),
+        "top_professions": llm_metrics.top_professions(),
+        "form_analysis": form_analysis.stats
+    })
+
+@app.get("/api/llm-costs/{profession_id}")
+async def get_profession_llm_costs(profession_id: str, request: Request):
+    """Расход ИИ на профессию: токены и стоимость по операциям (теги, анализ, вопросы)"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"error": "Не авторизован"}, status_code=401)
+    
+    if user["role"] != "super_admin":
+        return JSONResponse({"error": "Доступ запрещен"}, status_code=403)
+    
+    costs = llm_metrics.profession_costs(profession_id)
+    if costs is None:
+        return JSONResponse({"error": "Нет данных о расходе для этой профессии"}, status_code=404)
+    
+    return JSONResponse({"success": True, "profession_id": profession_id, "costs": costs})
+
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 
 def calculate_expected_questions_count(tags: Dict[str, int]) -> int:
@@ -785,13 +959,154 @@ def parse_profession_key(profession_key: str) -> tuple:
     else:
         return profession_key, "Общая"
 
-async def generate_questions_background(profession: Dict[str, Any], user: Dict[str, Any]):
-    """Фоновая генерация вопросов для профессии"""
+# Уровень кандидата -> сложность вопросов
+LEVEL_DIFFICULTY = {
+    "junior": "easy",
+    "middle": "medium",
+    "senior": "hard"
+}
+
+def enqueue_questions_generation(profession_id: str, requested_by: str, nightly_run: Optional[Dict[str, Any]] = None,
+                                 order_key: Optional[str] = None) -> Dict[str, Any]:
+    """Постановка генерации вопросов в очередь фоновых задач
+    
+    Ручной запуск идет вперед ночных задач (и поднимает уже стоящую ночную задачу профессии).
+    nightly_run - окно и бюджет ночного запуска, order_key - порядок среди ночных задач
+    """
+    payload = {"profession_id": profession_id, "requested_by": requested_by}
+    if nightly_run:
+        payload["nightly_run"] = nightly_run
+    
+    job = job_queue.enqueue(
+        "generate_questions",
+        payload,
+        priority=0 if requested_by != "system" else 10,
+        dedup_key=f"generate_questions:{profession_id}",
+        created_by=requested_by,
+        order_key=order_key
+    )
+    
+    # Помечаем профессию как генерирующуюся (синхронно, до первого await воркера)
+    set_profession_generating(profession_id, requested_by)
+    
+    return job
+
+def set_profession_generating(profession_id: str, requested_by: str):
+    """Перевод профессии в статус "generating" (если она еще не в нем)"""
+    records_file = DATA_DIR / "profession_records.json"
+    
+    with open(records_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    for record in data["profession_records"]:
+        if record["id"] == profession_id:
+            if record.get("status") == "generating":
+                return
+            
+            record["status"] = "generating"
+            record["generation_started_at"] = datetime.now().isoformat() + "Z"
+            record["workflow_history"].append({
+                "status": "generation_started",
+                "timestamp": datetime.now().isoformat() + "Z",
+                "user": requested_by,
+                "action": "Запущена генерация вопросов" + (" супер админом" if requested_by != "system" else " по расписанию")
+            })
+            break
+    
+    with open(records_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+async def run_questions_generation_job(job: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Обработчик задачи генерации вопросов (выполняется воркером очереди)"""
+    profession_id = job["payload"]["profession_id"]
+    
+    profession = get_profession_by_id(profession_id)
+    if not profession:
+        raise ValueError(f"Профессия {profession_id} не найдена")
+    
+    if profession.get("status") not in ["generating", "approved_by_head"]:
+        # Вопросы уже сгенерированы или профессия изменилась - делать нечего
+        return {"skipped": True, "status": profession.get("status"), "stats": {"total_questions": len(profession.get("questions", []))}}
+    
+    nightly_run = job["payload"].get("nightly_run")
+    if nightly_run:
+        defer_reason = check_nightly_run_limits(nightly_run)
+        if defer_reason:
+            # Окно или бюджет ночи исчерпаны: готовые батчи остаются в чекпоинте до следующей ночи
+            defer_questions_generation(profession_id, defer_reason)
+            return {"deferred": True, "reason": defer_reason, "profession_id": profession_id}
+    
+    set_profession_generating(profession_id, job["payload"].get("requested_by", "system"))
+    context.report_progress(0, len(profession.get("tags", {})), "Генерация запущена")
+    
+    # Если банк вопросов уже есть (теги скорректированы после генерации) - обновляем его инкрементально
+    existing_questions = profession.get("questions", [])
+    tags_changes = None
+    if existing_questions:
+        bank_tags = {q["tag"]: q.get("tag_weight", 0) for q in existing_questions if q.get("tag")}
+        tags_changes = calculate_tags_changes(bank_tags, profession.get("tags", {}))
+        logger.info(f"🔁 Инкрементальная генерация для {profession_id}: +{len(tags_changes['added'])} / -{len(tags_changes['removed'])} / ~{len(tags_changes['modified'])} тегов")
+    
+    try:
+        with llm_call_scope(profession_id=profession_id), llm_usage_scope() as usage:
+            # Расход текущей попытки виден бюджету ночи сразу, а не после завершения задачи
+            running_generation_usage[job["id"]] = usage
+            try:
+                questions_result = await questions_generator.generate_questions_for_profession(
+                    profession,
+                    progress_callback=lambda done, total, tag: context.report_progress(done, total, f"Тег готов: {tag}"),
+                    existing_questions=existing_questions if tags_changes else None,
+                    tags_changes=tags_changes,
+                    # Окно и бюджет ночи проверяются и между тегами
+                    stop_check=(lambda: check_nightly_run_limits(nightly_run)) if nightly_run else None
+                )
+            finally:
+                # Токены всех попыток задачи (и упавших) - для бюджета ночной генерации
+                running_generation_usage.pop(job["id"], None)
+                job["llm_tokens"] = job.get("llm_tokens", 0) + usage["total_tokens"]
+    except asyncio.CancelledError:
+        if job.get("cancel_requested"):
+            await finish_questions_generation(profession_id, None, "Генерация отменена")
+        raise
+    except Exception as e:
+        if job["attempts"] >= job["max_attempts"]:
+            await finish_questions_generation(profession_id, None, str(e))
+        raise
+    
+    if questions_result.get("stopped"):
+        # Ночь закончилась посреди профессии: готовые теги в чекпоинте, остальное - следующей ночью
+        defer_questions_generation(profession_id, questions_result["error"])
+        return {"deferred": True, "reason": questions_result["error"], "profession_id": profession_id}
+    
+    missing_batches = questions_result.get("stats", {}).get("missing_batches", [])
+    if missing_batches and job["attempts"] < job["max_attempts"]:
+        # Готовые батчи лежат в чекпоинте - повтор догенерирует только недостающие
+        context.report_progress(len(profession.get("tags", {})), len(profession.get("tags", {})), f"Не готово батчей: {len(missing_batches)}, ожидает повтора")
+        raise RuntimeError(f"Не сгенерированы батчи: {', '.join(missing_batches)}")
+    
+    if not questions_result.get("success") or not questions_result.get("questions"):
+        error = questions_result.get("error", "Не сгенерировано ни одного вопроса")
+        # Между попытками профессия остается generating: статус и история меняются только после последней
+        if job["attempts"] >= job["max_attempts"]:
+            await finish_questions_generation(profession_id, None, error)
+        raise RuntimeError(error)
+    
+    await finish_questions_generation(profession_id, questions_result, base_question_ids={q.get("id") for q in existing_questions})
+    questions_generator.checkpoints.clear(profession_id)
+    
+    return {
+        "profession_id": profession_id,
+        "stats": questions_result["stats"]
+    }
+
+async def finish_questions_generation(profession_id: str, questions_result: Optional[Dict[str, Any]], error: str = "",
+                                      base_question_ids: Optional[Set[str]] = None):
+    """Сохранение результата генерации (или возврат статуса при ошибке/отмене)
+    
+    base_question_ids - банк, с которого начиналась генерация: вопросы, дописанные в банк за время
+    генерации (ленивые уровни под тесты кандидатов), сохраняются вместе с результатом
+    """
     try:
-        # Генерируем вопросы
-        questions_result = await questions_generator.generate_questions_for_profession(profession)
-        
-        # Обновляем профессию в файле
         records_file = DATA_DIR / "profession_records.json"
         
         with open(records_file, 'r', encoding='utf-8') as f:
@@ -799,16 +1114,31 @@ async def generate_questions_background(profession: Dict[str, Any], user: Dict[s
         
         # Находим и обновляем профессию
         for record in data["profession_records"]:
-            if record["id"] == profession["id"]:
-                if questions_result.get("success"):
-                    record["questions"] = questions_result["questions"]
+            if record["id"] == profession_id:
+                if questions_result:
+                    result_ids = {q.get("id") for q in questions_result["questions"]}
+                    added_meanwhile = [
+                        q for q in record.get("questions", [])
+                        if q.get("id") not in (base_question_ids or set()) and q.get("id") not in result_ids
+                    ]
+                    if added_meanwhile:
+                        logger.info(f"🧩 Генерация {profession_id}: сохранено {len(added_meanwhile)} вопросов, добавленных во время генерации")
+                    
+                    record["questions"] = questions_result["questions"] + added_meanwhile
                     record["status"] = "questions_generated"
                     record["questions_generated_at"] = datetime.now().isoformat() + "Z"
+                    stats = questions_result["stats"]
+                    if stats.get("mode") == "incremental":
+                        action = (f"ИИ обновил банк вопросов: {stats['total_questions']} вопросов "
+                                  f"(сохранено {stats['kept_questions']}, удалено {stats['removed_questions'] + stats['trimmed_questions']})")
+                    else:
+                        action = f"ИИ сгенерировал {stats['total_questions']} вопросов"
+                    
                     record["workflow_history"].append({
                         "status": "questions_generated",
                         "timestamp": datetime.now().isoformat() + "Z",
                         "user": "system",
-                        "action": f"ИИ сгенерировал {questions_result['stats']['total_questions']} вопросов"
+                        "action": action
                     })
                     
                     logger.info(f"✅ Фоновая генерация завершена для {record['real_name']}: {questions_result['stats']['total_questions']} вопросов")
@@ -818,10 +1148,10 @@ async def generate_questions_background(profession: Dict[str, Any], user: Dict[s
                         "status": "generation_failed",
                         "timestamp": datetime.now().isoformat() + "Z",
                         "user": "system",
-                        "action": f"Ошибка генерации: {questions_result.get('error', 'Неизвестная ошибка')}"
+                        "action": f"Ошибка генерации: {error or 'Неизвестная ошибка'}"
                     })
                     
-                    logger.error(f"❌ Фоновая генерация не удалась для {record['real_name']}: {questions_result.get('error')}")
+                    logger.error(f"❌ Фоновая генерация не удалась для {record['real_name']}: {error}")
                 
                 record.pop("generation_started_at", None)
                 break
@@ -831,24 +1161,205 @@ async def generate_questions_background(profession: Dict[str, Any], user: Dict[s
             json.dump(data, f, ensure_ascii=False, indent=2)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка фоновой генерации: {e}")
+        logger.error(f"❌ Ошибка сохранения результата генерации для {profession_id}: {e}")
+        raise
+
+def enqueue_level_generation(profession_id: str, difficulty: str, requested_by: str) -> Dict[str, Any]:
+    """Постановка генерации одного уровня сложности в очередь (ленивый режим, кандидат ждет)"""
+    return job_queue.enqueue(
+        "generate_level",
+        {"profession_id": profession_id, "difficulty": difficulty, "requested_by": requested_by},
+        priority=0,
+        dedup_key=f"generate_level:{profession_id}:{difficulty}",
+        created_by=requested_by
+    )
+
+async def run_level_generation_job(job: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Обработчик задачи генерации недостающего уровня сложности по всем тегам профессии"""
+    profession_id = job["payload"]["profession_id"]
+    difficulty = job["payload"]["difficulty"]
+    checkpoint_id = f"{profession_id}__{difficulty}"
+    
+    profession = get_profession_by_id(profession_id)
+    if not profession:
+        raise ValueError(f"Профессия {profession_id} не найдена")
+    
+    missing = questions_generator.missing_questions_for_level(profession, difficulty)
+    if not missing:
+        return {"skipped": True, "profession_id": profession_id, "difficulty": difficulty}
+    
+    context.report_progress(0, len(missing), f"Генерация уровня {difficulty}")
+    
+    # Все теги банка считаем измененными: генератор добирает только недостающее на нужном уровне
+    tags = profession.get("tags", {})
+    existing_questions = profession.get("questions", [])
+    bank_tags = {q["tag"] for q in existing_questions if q.get("tag")}
+    tags_changes = {
+        "added": [tag for tag in tags if tag not in bank_tags],
+        "removed": [tag for tag in bank_tags if tag not in tags],
+        "modified": {tag: {"from": weight, "to": weight} for tag, weight in tags.items() if tag in bank_tags},
+        "unchanged": []
+    }
+    
+    with llm_call_scope(profession_id=profession_id):
+        questions_result = await questions_generator.generate_questions_for_profession(
+            profession,
+            progress_callback=lambda done, total, tag: context.report_progress(done, total, f"Тег готов: {tag}"),
+            existing_questions=existing_questions,
+            tags_changes=tags_changes,
+            difficulties=[difficulty],
+            checkpoint_id=checkpoint_id
+        )
+    
+    missing_batches = questions_result.get("stats", {}).get("missing_batches", [])
+    if missing_batches and job["attempts"] < job["max_attempts"]:
+        raise RuntimeError(f"Не сгенерированы батчи: {', '.join(missing_batches)}")
+    
+    if not questions_result.get("success"):
+        raise RuntimeError(questions_result.get("error", "Ошибка генерации уровня"))
+    
+    added = save_level_questions(profession_id, difficulty, questions_result["questions"])
+    questions_generator.checkpoints.clear(checkpoint_id)
+    
+    return {
+        "profession_id": profession_id,
+        "difficulty": difficulty,
+        "added_questions": added,
+        "stats": questions_result["stats"]
+    }
+
+def save_level_questions(profession_id: str, difficulty: str, questions: List[Dict[str, Any]]) -> int:
+    """Дописывание в банк профессии новых вопросов уровня (остальной банк не трогаем)"""
+    records_file = DATA_DIR / "profession_records.json"
+    
+    with open(records_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    added = 0
+    for record in data["profession_records"]:
+        if record["id"] == profession_id:
+            existing_ids = {q.get("id") for q in record.get("questions", [])}
+            new_questions = [
+                q for q in questions
+                if q.get("difficulty") == difficulty and q.get("id") not in existing_ids
+            ]
+            record.setdefault("questions", []).extend(new_questions)
+            added = len(new_questions)
+            
+            if added and record.get("status") == "approved_by_head":
+                record["status"] = "questions_generated"
+                record["questions_generated_at"] = datetime.now().isoformat() + "Z"
+            
+            if added:
+                record["workflow_history"].append({
+                    "status": "questions_generated",
+                    "timestamp": datetime.now().isoformat() + "Z",
+                    "user": "system",
+                    "action": f"ИИ сгенерировал {added} вопросов уровня {difficulty} по запросу теста"
+                })
+            break
+    
+    with open(records_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    logger.info(f"✅ Уровень {difficulty} для {profession_id}: добавлено {added} вопросов")
+    return added
+
+async def ensure_level_questions(profession: Dict[str, Any], level: str, requested_by: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Ленивый режим: догенерация недостающего уровня перед созданием теста
+    
+    Если вопросов уровня не хватает на тест, ждем задачу не дольше QUESTIONS_JIT_WAIT_SECONDS.
+    Возвращает (профессия с актуальным банком, задача генерации или None)
+    """
+    difficulty = LEVEL_DIFFICULTY.get(level, "medium")
+    if not questions_generator.openai_client:
+        # Без ИИ догенерировать уровень нечем - тест собирается из имеющегося банка
+        return profession, None
+    
+    if not questions_generator.missing_questions_for_level(profession, difficulty):
+        return profession, None
+    
+    job = enqueue_level_generation(profession["id"], difficulty, requested_by)
+    
+    available = sum(1 for q in profession.get("questions", []) if q.get("difficulty") == difficulty)
+    if available >= TEST_QUESTIONS_COUNT:
+        # На тест хватает - банк дополнится в фоне
+        return profession, job
+    
+    job = await job_queue.wait_for(job["id"], timeout=QUESTIONS_JIT_WAIT_SECONDS) or job
+    return get_profession_by_id(profession["id"]) or profession, job
+
+def nightly_run_tokens(run_id: str) -> int:
+    """Токены, потраченные задачами ночного запуска (по метрикам вызовов ИИ, все попытки и текущие вызовы)"""
+    return sum(
+        job.get("llm_tokens", 0) + running_generation_usage.get(job["id"], {}).get("total_tokens", 0)
+        for job in job_queue.list_jobs("generate_questions")
+        if (job["payload"].get("nightly_run") or {}).get("run_id") == run_id
+    )
+
+def check_nightly_run_limits(nightly_run: Dict[str, Any]) -> Optional[str]:
+    """Причина остановки ночной генерации (окно закрыто или бюджет токенов исчерпан) или None"""
+    if datetime.now().isoformat() + "Z" >= nightly_run["deadline"]:
+        return "окно ночной генерации закрыто"
+    
+    token_budget = nightly_run.get("token_budget", 0)
+    if token_budget and nightly_run_tokens(nightly_run["run_id"]) >= token_budget:
+        return f"бюджет ночной генерации ({token_budget} токенов) исчерпан"
+    
+    return None
+
+def defer_questions_generation(profession_id: str, reason: str):
+    """Возврат профессии в approved_by_head: генерация продолжится следующей ночью"""
+    records_file = DATA_DIR / "profession_records.json"
+    
+    with open(records_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    for record in data["profession_records"]:
+        if record["id"] == profession_id:
+            if record.get("status") == "generating":
+                record["status"] = "approved_by_head"
+                record.pop("generation_started_at", None)
+                record["workflow_history"].append({
+                    "status": "generation_deferred",
+                    "timestamp": datetime.now().isoformat() + "Z",
+                    "user": "system",
+                    "action": f"Генерация перенесена на следующую ночь: {reason}"
+                })
+            break
+    
+    with open(records_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    logger.info(f"🌙 Генерация {profession_id} перенесена на следующую ночь: {reason}")
+
+def recover_orphaned_generations():
+    """Профессии, застрявшие в "generating" без активной задачи, снова ставим в очередь"""
+    try:
+        records_file = DATA_DIR / "profession_records.json"
         
-        # В случае ошибки возвращаем статус обратно
-        try:
-            records_file = DATA_DIR / "profession_records.json"
-            with open(records_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        if not records_file.exists():
+            return
+        
+        with open(records_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        recovered = 0
+        for record in data.get("profession_records", []):
+            if record.get("status") != "generating":
+                continue
             
-            for record in data["profession_records"]:
-                if record["id"] == profession["id"]:
-                    record["status"] = "approved_by_head"
-                    record.pop("generation_started_at", None)
-                    break
+            if job_queue.find_active_job(f"generate_questions:{record['id']}"):
+                continue
             
-            with open(records_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+            enqueue_questions_generation(record["id"], "system")
+            recovered += 1
+        
+        if recovered:
+            logger.info(f"🔁 Восстановлена генерация для {recovered} зависших профессий")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка восстановления зависших генераций: {e}")
 
 
 # === WEBSOCKET ДЛЯ ЧАТА ===
@@ -878,7 +1389,9 @@ async def websocket_chat(websocket: WebSocket, user_id: str):
             if chat_type == "head_approval":
                 ai_response = await head_approval.chat_with_head(user_message, form_context)
             else:
-                ai_response = await hr_assistant.chat_with_user(user_message, form_context)
+                # Последний анализ формы вместо повторного анализа на каждое сообщение
+                current_analysis = await form_analysis.analysis_for_chat(user_id, form_context)
+                ai_response = await hr_assistant.chat_with_user(user_message, form_context, current_analysis)
             
             # Отправляем ответ пользователю
             await websocket.send_text(json.dumps({
@@ -895,6 +1408,20 @@ async def websocket_chat(websocket: WebSocket, user_id: str):
     except Exception as e:
         logger.error(f"❌ Ошибка WebSocket: {e}")
 
+async def push_to_user(user_id: Optional[str], message: Dict[str, Any]) -> bool:
+    """Сообщение на открытую страницу пользователя (через его WebSocket чата)"""
+    websocket = active_connections.get(user_id) if user_id else None
+    if websocket is None:
+        return False
+    
+    try:
+        await websocket.send_text(json.dumps(message, ensure_ascii=False))
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось отправить сообщение пользователю {user_id}: {e}")
+        active_connections.pop(user_id, None)
+        return False
+
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 
 async def save_profession(profession_data: Dict[str, Any], user: Dict[str, Any], status: str) -> str:
@@ -950,6 +1477,111 @@ async def save_profession(profession_data: Dict[str, Any], user: Dict[str, Any],
         logger.error(f"❌ Ошибка сохранения профессии: {e}")
         raise
 
+def enqueue_tags_generation(profession_id: str, profession_data: Dict[str, Any], user: Dict[str, Any]) -> Dict[str, Any]:
+    """Постановка генерации тегов новой профессии в очередь фоновых задач"""
+    return job_queue.enqueue(
+        "generate_tags",
+        {
+            "profession_id": profession_id,
+            "profession_data": profession_data,
+            "requested_by": user["email"],
+            "creator_id": str(user["id"])
+        },
+        priority=0,
+        dedup_key=f"generate_tags:{profession_id}",
+        created_by=user["email"]
+    )
+
+async def run_tags_generation_job(job: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Обработчик задачи генерации тегов (выполняется воркером очереди)
+    
+    Любая ошибка последней попытки доходит до создателя профессии: страница создания ждет финальный статус
+    """
+    try:
+        return await generate_profession_tags(job, context)
+    except Exception as e:
+        if job["attempts"] >= job["max_attempts"]:
+            await report_tags_generation_failed(job["payload"]["profession_id"], job["payload"].get("creator_id"), str(e))
+        raise
+
+async def report_tags_generation_failed(profession_id: str, creator_id: Optional[str], error: str):
+    """Попытки генерации тегов исчерпаны - профессия остается created_by_hr, теги настраиваются вручную"""
+    try:
+        add_profession_history(profession_id, "tags_generation_failed", f"Ошибка генерации тегов: {error}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи истории профессии {profession_id}: {e}")
+    
+    logger.warning(f"⚠️ Профессия {profession_id} создана, но теги не сгенерированы: {error}")
+    await push_to_user(creator_id, {
+        "type": "profession_status",
+        "profession_id": profession_id,
+        "status": "tags_generation_failed",
+        "message": "⚠️ Теги не сгенерированы. Требуется ручная настройка."
+    })
+
+async def generate_profession_tags(job: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Генерация тегов профессии, сохранение и уведомление начальника отдела"""
+    payload = job["payload"]
+    profession_id = payload["profession_id"]
+    creator_id = payload.get("creator_id")
+    
+    profession = get_profession_by_id(profession_id)
+    if not profession:
+        raise ValueError(f"Профессия {profession_id} не найдена")
+    
+    if profession.get("status") != "created_by_hr":
+        # Теги уже есть или профессию изменили вручную - делать нечего
+        return {"skipped": True, "status": profession.get("status")}
+    
+    context.report_progress(0, 1, "Генерация тегов")
+    await push_to_user(creator_id, {
+        "type": "profession_status",
+        "profession_id": profession_id,
+        "status": "tags_generating",
+        "message": "🏷️ ИИ генерирует теги профессии..."
+    })
+    
+    with llm_call_scope(profession_id=profession_id):
+        tags_result = await tags_generator.generate_tags(payload.get("profession_data") or profession)
+    
+    if not tags_result.get("success"):
+        raise RuntimeError(tags_result.get("error", "Теги не сгенерированы"))
+    
+    # Сохраняем теги и меняем статус на "tags_generated", уведомляем начальника отдела
+    await update_profession_with_tags(profession_id, tags_result, {"email": payload.get("requested_by", "system")})
+    await notify_department_head(profession, profession_id)
+    
+    context.report_progress(1, 1, f"Сгенерировано тегов: {len(tags_result['tags'])}")
+    await push_to_user(creator_id, {
+        "type": "profession_status",
+        "profession_id": profession_id,
+        "status": "tags_generated",
+        "tags_count": len(tags_result["tags"]),
+        "message": f"✅ ИИ сгенерировал {len(tags_result['tags'])} тегов. Профессия отправлена на подтверждение начальнику отдела."
+    })
+    
+    return {"profession_id": profession_id, "tags_count": len(tags_result["tags"])}
+
+def add_profession_history(profession_id: str, status: str, action: str):
+    """Запись в историю профессии без смены статуса"""
+    records_file = DATA_DIR / "profession_records.json"
+    
+    with open(records_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    for record in data["profession_records"]:
+        if record["id"] == profession_id:
+            record["workflow_history"].append({
+                "status": status,
+                "timestamp": datetime.now().isoformat() + "Z",
+                "user": "system",
+                "action": action
+            })
+            break
+    
+    with open(records_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
 async def update_profession_with_tags(profession_id: str, tags_result: Dict[str, Any], user: Dict[str, Any]):
     """Обновление профессии с тегами"""
     try:
@@ -976,11 +1608,26 @@ async def update_profession_with_tags(profession_id: str, tags_result: Dict[str,
         # Сохраняем
         with open(records_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        
+        # Анализ для начальника считаем сразу - модалка утверждения откроется без ожидания ИИ
+        schedule_approval_analysis(profession_id)
             
     except Exception as e:
         logger.error(f"❌ Ошибка обновления тегов: {e}")
         raise
 
+def schedule_approval_analysis(profession_id: str):
+    """Фоновый расчет анализа профессии для утверждения (результат хранится по ревизии тегов)"""
+    profession = get_profession_by_id(profession_id)
+    if not profession or profession.get("status") != "tags_generated":
+        return
+    
+    # Задача наследует контекст: вызовы ИИ анализа учитываются в расходе профессии
+    with llm_call_scope(profession_id=profession_id):
+        task = asyncio.create_task(head_approval.precompute_analysis(profession))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
 def load_reference_data() -> Dict[str, Any]:
     """Загрузка справочных данных"""
     try:
@@ -1190,6 +1837,9 @@ async def approve_profession_by_head(profession_id: str, corrected_tags: Dict[st
         with open(records_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         
+        # Анализ для утверждения больше не нужен
+        head_approval.analysis_store.invalidate(profession_id)
+        
         # Обновляем справочники
         await update_reference_files()
         
@@ -1405,6 +2055,10 @@ async def daily_questions_generation():
         with open(records_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
+        if QUESTIONS_LAZY_LEVELS:
+            logger.info("🌙 Ленивый режим: уровни генерируются при создании тестов, ночная генерация пропущена")
+            return
+        
         # Находим профессии со статусом "approved_by_head"
         approved_professions = [
             record for record in data.get("profession_records", [])
@@ -1415,29 +2069,25 @@ async def daily_questions_generation():
             logger.info("📊 Нет утвержденных профессий для генерации вопросов")
             return
         
-        generated_count = 0
+        # Ставим профессии в очередь - генерацию выполняет пул воркеров (GENERATION_WORKERS),
+        # раньше утвержденные идут первыми, ручные запуски обгоняют ночные
+        started_at = datetime.now()
+        nightly_run = {
+            "run_id": f"nightly_{started_at:%Y%m%d_%H%M}",
+            "deadline": (started_at + timedelta(hours=NIGHTLY_GENERATION_WINDOW_HOURS)).isoformat() + "Z",
+            "token_budget": NIGHTLY_GENERATION_TOKEN_BUDGET
+        }
         
+        approved_professions.sort(key=lambda record: record.get("approved_at") or record.get("created_at", ""))
         for profession in approved_professions:
             try:
-                # Генерируем вопросы
-                questions_result = await questions_generator.generate_questions_for_profession(profession)
-                
-                if questions_result.get("success"):
-                    # Сохраняем вопросы
-                    await save_profession_questions(profession["id"], questions_result["questions"])
-                    
-                    # Обновляем статус
-                    await update_profession_status(profession["id"], "questions_generated")
-                    
-                    generated_count += 1
-                    logger.info(f"✅ Вопросы сгенерированы для {profession['id']}: {questions_result['stats']['total_questions']} вопросов")
-                else:
-                    logger.error(f"❌ Не удалось сгенерировать вопросы для {profession['id']}")
-                    
+                enqueue_questions_generation(profession["id"], "system", nightly_run=nightly_run,
+                                             order_key=profession.get("approved_at") or profession.get("created_at"))
             except Exception as e:
-                logger.error(f"❌ Ошибка генерации вопросов для {profession['id']}: {e}")
+                logger.error(f"❌ Ошибка постановки генерации для {profession['id']}: {e}")
         
-        logger.info(f"🌙 Ежедневная генерация завершена: {generated_count} профессий обработано")
+        logger.info(f"🌙 Ежедневная генерация: {len(approved_professions)} профессий поставлено в очередь "
+                    f"(окно до {nightly_run['deadline']}, бюджет {NIGHTLY_GENERATION_TOKEN_BUDGET or '∞'} токенов)")
         
     except Exception as e:
         logger.error(f"❌ Ошибка ежедневной генерации вопросов: {e}")
@@ -1614,9 +2264,27 @@ async def create_candidate_test(request: Request, test_data: dict):
         
         # Получаем профессию
         profession = get_profession_by_id(profession_id)
-        if not profession or not profession.get("questions"):
+        lazy_ready = QUESTIONS_LAZY_LEVELS and profession and profession.get("tags") and \
+            profession.get("status") in ["approved_by_head", "generating", "questions_generated"]
+        if not profession or not (profession.get("questions") or lazy_ready):
             return JSONResponse({"error": "Профессия не найдена или у неё нет вопросов"}, status_code=404)
         
+        if lazy_ready:
+            profession, level_job = await ensure_level_questions(profession, level, user["email"])
+            difficulty = LEVEL_DIFFICULTY[level]
+            available = sum(1 for q in profession.get("questions", []) if q.get("difficulty") == difficulty)
+            
+            if level_job and level_job["status"] in ACTIVE_JOB_STATES and available < TEST_QUESTIONS_COUNT:
+                return JSONResponse({
+                    "success": False,
+                    "pending": True,
+                    "job_id": level_job["id"],
+                    "error": f"Вопросы уровня {level} готовятся, повторите через минуту"
+                }, status_code=202)
+            
+            if not available:
+                return JSONResponse({"error": f"Не удалось подготовить вопросы уровня {level}"}, status_code=503)
+        
         # Создаем тест-сессию
         test_session = await create_test_session(test_data, profession, user)
         
@@ -1727,38 +2395,42 @@ async def submit_test_results(request: Request):
         if not sessions_file.exists():
             return {"status": "error", "message": "Файл тест-сессий не найден"}
         
-        with open(sessions_file, 'r', encoding='utf-8') as f:
-            sessions_data = json.load(f)
-        
-        # Находим нужную сессию
-        session_found = False
-        for session in sessions_data.get("test_sessions", []):
-            if session["test_session_id"] == session_id:
-                # Рассчитываем результаты
-                results = calculate_test_results(session["questions"], answers)
-                
-                # Генерируем рекомендации через ИИ
-                recommendations = await generate_candidate_recommendations(session, results)
-                results["recommendations"] = recommendations
-                
-                # Обновляем данные сессии
-                session["answers"] = answers
-                session["time_spent"] = time_spent
-                session["completed_at"] = completed_at
-                session["status"] = "completed"
-                session["started_at"] = session.get("started_at") or completed_at
-                session["results"] = results
-                session["security_stats"] = security_stats
-                
-                session_found = True
-                break
-        
-        if not session_found:
-            return {"status": "error", "message": "Тест-сессия не найдена"}
+        async with test_sessions_lock:
+            with open(sessions_file, 'r', encoding='utf-8') as f:
+                sessions_data = json.load(f)
+            
+            # Находим нужную сессию
+            session_found = False
+            for session in sessions_data.get("test_sessions", []):
+                if session["test_session_id"] == session_id:
+                    # Рассчитываем результаты
+                    results = calculate_test_results(session["questions"], answers)
+                    
+                    # Рекомендации ИИ генерируются в фоне и дописываются в сессию позже
+                    results["recommendations"] = None
+                    results["recommendations_status"] = "pending"
+                    
+                    # Обновляем данные сессии
+                    session["answers"] = answers
+                    session["time_spent"] = time_spent
+                    session["completed_at"] = completed_at
+                    session["status"] = "completed"
+                    session["started_at"] = session.get("started_at") or completed_at
+                    session["results"] = results
+                    session["security_stats"] = security_stats
+                    
+                    session_found = True
+                    break
+            
+            if not session_found:
+                return {"status": "error", "message": "Тест-сессия не найдена"}
+            
+            # Сохраняем обновленные данные
+            with open(sessions_file, 'w', encoding='utf-8') as f:
+                json.dump(sessions_data, f, ensure_ascii=False, indent=2)
         
-        # Сохраняем обновленные данные
-        with open(sessions_file, 'w', encoding='utf-8') as f:
-            json.dump(sessions_data, f, ensure_ascii=False, indent=2)
+        # Запускаем генерацию рекомендаций в фоне
+        schedule_recommendations_generation(session_id)
         
         return {
             "status": "success", 
@@ -1771,6 +2443,89 @@ async def submit_test_results(request: Request):
         return {"status": "error", "message": str(e)}
 
 
+@app.get("/api/test-recommendations/{session_id}")
+async def get_test_recommendations(session_id: str):
+    """Получение рекомендаций кандидату (генерируются в фоне после отправки теста)"""
+    try:
+        test_session = get_test_session_by_id(session_id)
+        if not test_session:
+            return JSONResponse({"error": "Тест-сессия не найдена"}, status_code=404)
+        
+        results = test_session.get("results") or {}
+        
+        return JSONResponse({
+            "success": True,
+            "status": results.get("recommendations_status", "ready" if results.get("recommendations") else "pending"),
+            "recommendations": results.get("recommendations")
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка получения рекомендаций {session_id}: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def schedule_recommendations_generation(session_id: str):
+    """Постановка фоновой генерации рекомендаций для тест-сессии"""
+    task = asyncio.create_task(generate_recommendations_background(session_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+def resume_pending_recommendations():
+    """Перезапуск генерации рекомендаций, прерванной перезапуском сервера"""
+    try:
+        sessions_file = DATA_DIR / "test_sessions.json"
+        
+        if not sessions_file.exists():
+            return
+        
+        with open(sessions_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        pending_ids = [
+            session["test_session_id"] for session in data.get("test_sessions", [])
+            if (session.get("results") or {}).get("recommendations_status") == "pending"
+        ]
+        
+        for session_id in pending_ids:
+            schedule_recommendations_generation(session_id)
+        
+        if pending_ids:
+            logger.info(f"🔁 Возобновлена генерация рекомендаций: {len(pending_ids)} сессий")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка возобновления рекомендаций: {e}")
+
+
+async def generate_recommendations_background(session_id: str):
+    """Фоновая генерация рекомендаций и сохранение их в тест-сессию"""
+    try:
+        test_session = get_test_session_by_id(session_id)
+        if not test_session or not test_session.get("results"):
+            return
+        
+        recommendations, status = await generate_candidate_recommendations(test_session, test_session["results"])
+        
+        sessions_file = DATA_DIR / "test_sessions.json"
+        
+        async with test_sessions_lock:
+            with open(sessions_file, 'r', encoding='utf-8') as f:
+                sessions_data = json.load(f)
+            
+            for session in sessions_data.get("test_sessions", []):
+                if session["test_session_id"] == session_id and session.get("results"):
+                    session["results"]["recommendations"] = recommendations
+                    session["results"]["recommendations_status"] = status
+                    session["results"]["recommendations_generated_at"] = datetime.now().isoformat() + "Z"
+                    break
+            
+            with open(sessions_file, 'w', encoding='utf-8') as f:
+                json.dump(sessions_data, f, ensure_ascii=False, indent=2)
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка фоновой генерации рекомендаций {session_id}: {e}")
+
+
 def calculate_test_results(questions: list, answers: list) -> dict:
     """Рассчитывает результаты тестирования с оценкой и анализом по категориям"""
     if not questions or not answers:
@@ -1877,13 +2632,15 @@ def calculate_grade(percentage: float) -> dict:
         return {"grade": "F", "text": "Неудовлетворительно", "color": "#EF4444"}
 
 
-async def generate_candidate_recommendations(test_session: dict, results: dict) -> str:
-    """Генерирует персональные рекомендации для кандидата через ИИ"""
+async def generate_candidate_recommendations(test_session: dict, results: dict) -> tuple:
+    """Генерирует персональные рекомендации для кандидата через ИИ (текст, статус)"""
+    candidate = test_session.get("candidate", {})
+    profession = test_session.get("profession", {})
+    level = test_session.get("level", "")
+    
     try:
-        # Подготавливаем данные для ИИ
-        candidate = test_session.get("candidate", {})
-        profession = test_session.get("profession", {})
-        level = test_session.get("level", "")
+        if not llm_router:
+            return build_fallback_recommendations(profession, results), "fallback"
         
         # Анализируем слабые места
         weak_categories = []
@@ -1923,12 +2680,10 @@ async def generate_candidate_recommendations(test_session: dict, results: dict)
 ТОН: Поддерживающий, профессиональный, мотивирующий
 """
 
-        # Вызываем ИИ (используем OpenAI API как в других агентах)
-        import openai
-        openai.api_key = OPENAI_API_KEY
-        
-        response = openai.chat.completions.create(
-            model="gpt-4",
+        # Вызываем ИИ через общий асинхронный клиент (не блокирует event loop)
+        response = await llm_router.complete(
+            "recommendations",
+            agent="candidate_results",
             messages=[
                 {"role": "system", "content": "Ты опытный HR-специалист, который дает конструктивную обратную связь кандидатам после тестирования."},
                 {"role": "user", "content": prompt}
@@ -1940,28 +2695,30 @@ async def generate_candidate_recommendations(test_session: dict, results: dict)
         recommendations = response.choices[0].message.content.strip()
         logger.info(f"✅ Рекомендации сгенерированы для {candidate.get('full_name', 'кандидата')}")
         
-        return recommendations
+        return recommendations, "ready"
         
     except Exception as e:
         logger.error(f"❌ Ошибка генерации рекомендаций: {e}")
+        return build_fallback_recommendations(profession, results), "fallback"
+
+
+def build_fallback_recommendations(profession: dict, results: dict) -> str:
+    """Fallback рекомендации на основе оценки (когда ИИ недоступен)"""
+    grade = results.get("grade", "F")
+    
+    fallback_recommendations = {
+        "A": f"Превосходный результат! Вы показали отличные знания в области {profession.get('name', 'выбранной специальности')}. Продолжайте развиваться в этом направлении и делитесь знаниями с коллегами.",
         
-        # Fallback рекомендации на основе оценки
-        grade = results.get("grade", "F")
-        percentage = results.get("percentage", 0)
+        "B": f"Хороший результат! У вас есть solid понимание основ {profession.get('name', 'специальности')}. Рекомендуем углубить знания в слабых областях и продолжать практическое применение навыков.",
         
-        fallback_recommendations = {
-            "A": f"Превосходный результат! Вы показали отличные знания в области {profession.get('name', 'выбранной специальности')}. Продолжайте развиваться в этом направлении и делитесь знаниями с коллегами.",
-            
-            "B": f"Хороший результат! У вас есть solid понимание основ {profession.get('name', 'специальности')}. Рекомендуем углубить знания в слабых областях и продолжать практическое применение навыков.",
-            
-            "C": f"Удовлетворительный результат. Базовые знания присутствуют, но есть пространство для роста. Сосредоточьтесь на изучении основных концепций и регулярной практике.",
-            
-            "D": f"Результат показывает необходимость дополнительной подготовки. Рекомендуем пройти базовые курсы по {profession.get('name', 'специальности')} и получить практический опыт.",
-            
-            "F": f"Результат указывает на значительные пробелы в знаниях. Рекомендуем начать с изучения основ {profession.get('name', 'специальности')} через курсы и практические задания."
-        }
+        "C": f"Удовлетворительный результат. Базовые знания присутствуют, но есть пространство для роста. Сосредоточьтесь на изучении основных концепций и регулярной практике.",
+        
+        "D": f"Результат показывает необходимость дополнительной подготовки. Рекомендуем пройти базовые курсы по {profession.get('name', 'специальности')} и получить практический опыт.",
         
-        return fallback_recommendations.get(grade, "Продолжайте развивать свои навыки и знания в выбранной области.")
+        "F": f"Результат указывает на значительные пробелы в знаниях. Рекомендуем начать с изучения основ {profession.get('name', 'специальности')} через курсы и практические задания."
+    }
+    
+    return fallback_recommendations.get(grade, "Продолжайте развивать свои навыки и знания в выбранной области.")
     
     
 @app.get("/api/test-session-answers/{session_id}")
@@ -2078,10 +2835,14 @@ def get_professions_with_questions() -> List[Dict[str, Any]]:
         professions_with_questions = []
         
         for record in data.get("profession_records", []):
-            if (record.get("status") == "questions_generated" and 
+            # В ленивом режиме вопросы уровней генерируются при создании теста
+            on_demand = QUESTIONS_LAZY_LEVELS and bool(record.get("tags")) and \
+                record.get("status") in ["approved_by_head", "generating", "questions_generated"]
+            
+            if on_demand or (record.get("status") == "questions_generated" and 
                 record.get("questions") and len(record["questions"]) > 0):
                 
-                questions = record["questions"]
+                questions = record.get("questions", [])
                 questions_by_difficulty = {"easy": 0, "medium": 0, "hard": 0}
                 
                 for question in questions:
@@ -2098,7 +2859,8 @@ def get_professions_with_questions() -> List[Dict[str, Any]]:
                     "questions_count": len(questions),
                     "questions_by_difficulty": questions_by_difficulty,
                     "tags": record.get("tags", {}),
-                    "updated_at": record.get("questions_generated_at")
+                    "updated_at": record.get("questions_generated_at"),
+                    "on_demand": on_demand
                 })
         
         return professions_with_questions
@@ -2168,18 +2930,13 @@ async def create_test_session(test_data: Dict[str, Any], profession: Dict[str, A
         logger.error(f"❌ Ошибка создания тест-сессии: {e}")
         raise
 
-def select_questions_by_level_and_tags(profession: Dict[str, Any], level: str, total_questions: int = 15) -> List[Dict[str, Any]]:
+def select_questions_by_level_and_tags(profession: Dict[str, Any], level: str, total_questions: int = TEST_QUESTIONS_COUNT) -> List[Dict[str, Any]]:
     """Отбор вопросов по уровню и весам тегов"""
     try:
         print(f"🔍 ОТЛАДКА: Выбор вопросов для {profession.get('real_name')} уровня {level}")
         
         # 1. Определяем сложность по уровню
-        difficulty_map = {
-            "junior": "easy",
-            "middle": "medium",
-            "senior": "hard"
-        }
-        target_difficulty = difficulty_map.get(level, "medium")
+        target_difficulty = LEVEL_DIFFICULTY.get(level, "medium")
         
         # 2. Фильтруем вопросы по сложности
         all_questions = profession.get("questions", [])